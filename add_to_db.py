@@ -1,27 +1,517 @@
 import pymongo
 import dotenv
 import os
+import bz2
+import gzip
+import lzma
 import json
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 import sys
+import threading
+
+import cache
+from fetcher import canonical_url
+from models import (
+    Manga,
+    browse_fields,
+    browse_key,
+    chapter_sort_value,
+    manga_id_from_url,
+    parse_browse_key,
+)
+
+# Connexion MongoDB initialisée à la demande (voir get_client()) : importer
+# ce module ne lit pas le .env et n'ouvre aucune connexion.
+_client = None
+_client_lock = threading.Lock()
+_env_loaded = False
+
+
+def load_env():
+    """Charge les variables d'environnement du fichier .env (une seule fois)."""
+    global _env_loaded
+    if not _env_loaded:
+        dotenv.load_dotenv()
+        _env_loaded = True
+
+
+def get_client():
+    """
+    Retourne le client MongoDB partagé, créé au premier appel.
+
+    Les paramètres du pool et de la compression réseau sont configurables
+    via les variables d'environnement MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE,
+    MONGO_COMPRESSORS et MONGO_TIMEOUT_MS.
+
+    Returns:
+        pymongo.MongoClient: Client connecté au cluster
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                load_env()
+                timeout_ms = int(os.getenv("MONGO_TIMEOUT_MS", "10000"))
+                _client = pymongo.MongoClient(
+                    os.getenv("MONGO_URL"),
+                    maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "20")),
+                    minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+                    compressors=os.getenv("MONGO_COMPRESSORS", "zlib"),
+                    serverSelectionTimeoutMS=timeout_ms,
+                    connectTimeoutMS=timeout_ms,
+                )
+    return _client
+
+
+def get_db():
+    """Retourne la base de données SushiScan (déjà définie dans l'URL)."""
+    return get_client().get_database()
+
+
+def close_client():
+    """Ferme le client MongoDB s'il a été créé."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+# Fonctions d'accès aux collections pour les autres modules
+def get_manga_collection():
+    """Retourne la collection des mangas"""
+    return get_db()["mangas"]
+
+def get_chapters_collection():
+    """Retourne la collection des chapitres"""
+    return get_db()["chapters"]
+
+def get_planning_collection():
+    """Retourne la collection du planning"""
+    return get_db()["planning"]
+
+def get_homepage_collection():
+    """Retourne la collection de la homepage"""
+    return get_db()["homepage"]
+
+def get_chapter_buckets_collection():
+    """Retourne la collection des buckets de chapitres"""
+    return get_db()["chapter_buckets"]
+
+def get_cache_state_collection():
+    """Retourne la collection des versions de cache"""
+    return get_db()["cache_state"]
+
+def get_job_locks_collection():
+    """Retourne la collection des verrous de jobs"""
+    return get_db()["job_locks"]
+
+def get_crawl_queue_collection():
+    """Retourne la collection de la file de travail du crawl distribué"""
+    return get_db()["crawl_queue"]
+
+def get_page_manifests_collection():
+    """Retourne la collection du manifeste des pages de chapitres"""
+    return get_db()["page_manifests"]
+
+def get_covers_collection():
+    """Retourne la collection de l'état du cache des couvertures"""
+    return get_db()["covers"]
+
+def get_changes_collection():
+    """Retourne la collection du journal des changements"""
+    return get_db()["changes"]
+
+def get_negative_cache_collection():
+    """Retourne la collection du cache des résultats négatifs du scraping"""
+    return get_db()["negative_cache"]
+
+def get_crawl_state_collection():
+    """Retourne la collection de l'état des crawls par priorité"""
+    return get_db()["crawl_state"]
+
+def get_revisit_history_collection():
+    """Retourne la collection de l'historique de revisite des mangas"""
+    return get_db()["revisit_history"]
+
+def get_facets_collection():
+    """Retourne la collection des compteurs de facettes (types, langues, genres)"""
+    return get_db()["facets"]
+
+
+def get_chapter_storage():
+    """
+    Retourne le mode de stockage des chapitres (variable CHAPTER_STORAGE) :
+    - "documents" (défaut) : un document par chapitre dans `chapters`
+    - "buckets" : un document par (manga, type de scan) dans `chapter_buckets`,
+      contenant un tableau compact [[numéro, nombre de pages], ...]
+    """
+    load_env()
+    return os.getenv("CHAPTER_STORAGE", "documents").strip().lower()
+
+
+def notify_cache_invalidation(*namespaces):
+    """
+    Invalide les caches de lecture après une écriture.
+
+    Les caches du processus courant sont vidés immédiatement, et la version
+    de chaque namespace est incrémentée en base pour que les services de
+    lecture tournant dans d'autres processus se resynchronisent.
 
-# Charger les variables d'environnement
-dotenv.load_dotenv()
+    Args:
+        *namespaces (str): Namespaces modifiés (mangas, chapters, planning, homepage)
+    """
+    cache.invalidate(*namespaces)
+    for namespace in namespaces:
+        try:
+            get_cache_state_collection().update_one(
+                {"_id": namespace},
+                {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now()}},
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Erreur lors de l'invalidation du cache '{namespace}': {e}")
+
+
+# Les chapitres référencent leur manga par `manga_id` (identifiant stable
+# dérivé du slug du catalogue, aussi utilisé comme _id des mangas). Les index
+# uniques sont partiels pour cohabiter avec les documents antérieurs à
+# migrate_manga_ids(), encore identifiés par `manga_title`.
+MANGA_ID_FILTER = {"manga_id": {"$exists": True}}
+
+# Index unique des chapitres
+CHAPTER_UNIQUE_INDEX = [
+    ("manga_id", pymongo.ASCENDING),
+    ("scan_name", pymongo.ASCENDING),
+    ("number", pymongo.ASCENDING),
+]
+
+# Index composé utilisé pour trier les chapitres par numéro réel
+CHAPTER_SORT_INDEX = [
+    ("manga_id", pymongo.ASCENDING),
+    ("scan_name", pymongo.ASCENDING),
+    ("number_sort", pymongo.ASCENDING),
+    ("number", pymongo.ASCENDING),
+]
+
+
+# Index unique des buckets de chapitres
+CHAPTER_BUCKET_INDEX = [
+    ("manga_id", pymongo.ASCENDING),
+    ("scan_name", pymongo.ASCENDING),
+]
+
+# Index par titre remplacés par les index par manga_id (supprimés par migrate_manga_ids)
+LEGACY_TITLE_INDEXES = {
+    "chapters": ["manga_title_1_scan_name_1_number_1", "manga_title_1_scan_name_1_number_sort_1_number_1"],
+    "chapter_buckets": ["manga_title_1_scan_name_1"],
+    "mangas": ["title_1"],
+}
+
+# Résolution titre -> manga_id des lectures par titre
+_manga_id_cache = cache.TTLCache(maxsize=10_000, ttl=300)
+
+
+def ensure_manga_id_indexes():
+    """Crée les index par manga_id des collections mangas, chapters et chapter_buckets."""
+    mangas_collection = get_manga_collection()
+    # L'ancien index unique sur le titre est conservé jusqu'à migrate_manga_ids()
+    # ou au premier manga recréé sous son manga_id (voir relax_title_index)
+    if "title_1" not in mangas_collection.index_information():
+        mangas_collection.create_index([("title", pymongo.ASCENDING)])
+    get_chapters_collection().create_index(
+        CHAPTER_UNIQUE_INDEX, unique=True, partialFilterExpression=MANGA_ID_FILTER
+    )
+    get_chapters_collection().create_index(CHAPTER_SORT_INDEX)
+    get_chapter_buckets_collection().create_index(
+        CHAPTER_BUCKET_INDEX, unique=True, partialFilterExpression=MANGA_ID_FILTER
+    )
+
+
+def relax_title_index(mangas_collection):
+    """
+    Remplace l'ancien index unique sur le titre par un index simple, pour
+    qu'un manga puisse être écrit sous son manga_id avant la suppression de
+    son document d'origine (même titre).
+    """
+    index = mangas_collection.index_information().get("title_1")
+    if index is None or not index.get("unique"):
+        return
+    try:
+        mangas_collection.drop_index("title_1")
+    except pymongo.errors.OperationFailure:
+        pass  # Déjà supprimé par un autre processus
+    mangas_collection.create_index([("title", pymongo.ASCENDING)])
+
+
+def resolve_manga_id(manga_title):
+    """
+    Retrouve le manga_id d'un manga à partir de son titre (lectures compatibles
+    avec les appels existants par titre).
+
+    Returns:
+        int: manga_id, ou None si le manga est inconnu ou pas encore migré
+    """
+    key = ("mangas", "manga_id", manga_title)
+    manga_id = _manga_id_cache.get(key)
+    if manga_id is None:
+        doc = get_manga_collection().find_one({"title": manga_title}, {"_id": 1})
+        if doc is None:
+            return None
+        manga_id = doc["_id"] if isinstance(doc["_id"], int) else False
+        _manga_id_cache.set(key, manga_id)
+    return manga_id or None
+
+
+def chapter_owner_query(manga_title=None, manga_id=None):
+    """
+    Filtre des chapitres (ou buckets) d'un manga : par manga_id si connu,
+    sinon par titre pour les documents non migrés.
+
+    Returns:
+        dict: Filtre MongoDB
+    """
+    if manga_id is None and manga_title is not None:
+        manga_id = resolve_manga_id(manga_title)
+    if manga_id is not None:
+        return {"manga_id": manga_id}
+    return {"manga_title": manga_title}
 
-# Obtenir l'URL de connexion MongoDB depuis les variables d'environnement
-URL = os.getenv("MONGO_URL")
 
-# Se connecter au cluster MongoDB
-client = pymongo.MongoClient(URL)
+def use_chapter_buckets():
+    """Indique si les chapitres sont stockés sous forme de buckets."""
+    return get_chapter_storage() == "buckets"
+
+
+def build_chapter_entries(chapters):
+    """
+    Convertit une liste de chapitres en entrées compactes [numéro, pages],
+    triées par numéro réel.
+
+    Args:
+        chapters (list): Chapitres au format de parse_episodes_js()
+
+    Returns:
+        list: Liste de paires [number, page_count]
+    """
+    entries = [
+        [chapter["number"], chapter.get("page_count", 0)] for chapter in chapters
+    ]
+    entries.sort(key=lambda entry: chapter_sort_value(entry[0]))
+    return entries
+
+
+def expand_chapter_bucket(bucket):
+    """
+    Reconstruit les chapitres d'un bucket au même format que les documents
+    de la collection `chapters`.
+
+    Args:
+        bucket (dict): Document de la collection `chapter_buckets`
+
+    Returns:
+        list: Liste de dictionnaires chapitre
+    """
+    return [
+        {
+            "manga_id": bucket.get("manga_id"),
+            "manga_title": bucket["manga_title"],
+            "scan_name": bucket["scan_name"],
+            "number": number,
+            "number_sort": chapter_sort_value(number),
+            "title": f"Chapitre {number}",
+            "page_count": page_count,
+            "scan_id": bucket.get("scan_id"),
+            "episodes_url": bucket.get("episodes_url"),
+            "added_at": bucket.get("added_at"),
+            "updated_at": bucket.get("updated_at"),
+        }
+        for number, page_count in bucket.get("chapters", [])
+    ]
+
+
+def upsert_chapter_bucket(manga_title, scan_type, chapters, feed=None, manga_id=None):
+    """
+    Écrit en une seule opération tous les chapitres d'un type de scan.
+
+    Args:
+        manga_title (str): Titre du manga
+        scan_type (dict): Type de scan (name, id_scan, episodes_url)
+        chapters (list): Chapitres au format de parse_episodes_js()
+        feed (ChangeFeed): Journal des changements du run (optionnel)
+        manga_id (int): Identifiant stable du manga (voir manga_id_from_url)
+
+    Returns:
+        int: Nombre de chapitres qui n'existaient pas dans le bucket précédent
+    """
+    entries = build_chapter_entries(chapters)
+    now = datetime.now()
+    values = {
+        "manga_title": manga_title,
+        "scan_id": scan_type.get("id_scan"),
+        "episodes_url": scan_type.get("episodes_url"),
+        "chapters": entries,
+        "chapters_count": len(entries),
+        "total_pages": sum(page_count for _, page_count in entries),
+        "updated_at": now,
+    }
+    if manga_id is not None:
+        values["manga_id"] = manga_id
+    previous = upsert_with_legacy_fallback(
+        get_chapter_buckets_collection(),
+        dict(chapter_owner_query(manga_title, manga_id), scan_name=scan_type["name"]),
+        {"manga_title": manga_title, "scan_name": scan_type["name"]},
+        {"$set": values, "$setOnInsert": {"added_at": now}},
+        projection={"chapters": 1},
+    )
+    known_pages = dict((previous or {}).get("chapters", []))
+    nb_added = 0
+    for number, page_count in entries:
+        if number not in known_pages:
+            nb_added += 1
+            if feed is not None:
+                feed.chapter_added(manga_title, scan_type["name"], number, page_count)
+        elif feed is not None and known_pages[number] != page_count:
+            feed.page_count_changed(
+                manga_title, scan_type["name"], number, known_pages[number], page_count
+            )
+    return nb_added
+
+
+def upsert_with_legacy_fallback(collection, query, legacy_query, update, projection):
+    """
+    Upsert qui adopte le document antérieur à la migration des manga_id.
+
+    Si l'upsert par manga_id entre en conflit avec l'ancien index unique par
+    titre, le document existant (identifié par `legacy_query`) est mis à jour
+    à la place et reçoit ainsi son manga_id.
+
+    Returns:
+        dict: Document avant la mise à jour (projeté), ou None s'il a été créé
+    """
+    try:
+        return collection.find_one_and_update(
+            query,
+            update,
+            projection=projection,
+            upsert=True,
+            return_document=pymongo.ReturnDocument.BEFORE,
+        )
+    except pymongo.errors.DuplicateKeyError:
+        if query == legacy_query:
+            raise
+        return collection.find_one_and_update(
+            legacy_query,
+            update,
+            projection=projection,
+            return_document=pymongo.ReturnDocument.BEFORE,
+        )
+
+
+def find_chapters(manga_title, scan_name=None, manga_id=None):
+    """
+    Retourne les chapitres d'un manga triés par type de scan puis par numéro,
+    quel que soit le mode de stockage.
+
+    Args:
+        manga_title (str): Titre du manga
+        scan_name (str): Type de scan (optionnel)
+        manga_id (int): Identifiant du manga, prioritaire sur le titre (optionnel)
+
+    Returns:
+        list: Liste de dictionnaires chapitre
+    """
+    query = chapter_owner_query(manga_title, manga_id)
+    if scan_name:
+        query["scan_name"] = scan_name
+
+    if use_chapter_buckets():
+        chapters = []
+        buckets = get_chapter_buckets_collection().find(query, {"_id": 0}).sort(
+            CHAPTER_BUCKET_INDEX
+        )
+        for bucket in buckets:
+            chapters.extend(expand_chapter_bucket(bucket))
+        return chapters
+
+    return list(
+        get_chapters_collection().find(query, {"_id": 0}).sort(
+            [(field, direction) for field, direction in CHAPTER_SORT_INDEX[1:]]
+        )
+    )
+
+
+def get_manga_totals(manga_title, manga_id=None):
+    """
+    Calcule le nombre de chapitres et de pages d'un manga, quel que soit le
+    mode de stockage.
+
+    Args:
+        manga_title (str): Titre du manga
+        manga_id (int): Identifiant du manga, prioritaire sur le titre (optionnel)
+
+    Returns:
+        tuple: (total_chapters, total_pages)
+    """
+    query = chapter_owner_query(manga_title, manga_id)
+    if use_chapter_buckets():
+        pipeline = [
+            {"$match": query},
+            {
+                "$group": {
+                    "_id": None,
+                    "total_chapters": {"$sum": "$chapters_count"},
+                    "total_pages": {"$sum": "$total_pages"},
+                }
+            },
+        ]
+        result = list(get_chapter_buckets_collection().aggregate(pipeline))
+        if not result:
+            return 0, 0
+        return result[0]["total_chapters"], result[0]["total_pages"]
+
+    total_chapters = get_chapters_collection().count_documents(query)
+    pipeline_pages = [
+        {"$match": query},
+        {"$group": {"_id": None, "total_pages": {"$sum": "$page_count"}}},
+    ]
+    page_result = list(get_chapters_collection().aggregate(pipeline_pages))
+    total_pages = page_result[0]["total_pages"] if page_result else 0
+    return total_chapters, total_pages
+
+
+def get_known_scan_types(mangas=None):
+    """
+    État des types de scans enregistré lors du run précédent, pour le chemin
+    rapide de get_scan_chapters (episodes.js demandé sans la page de scan).
+
+    Args:
+        mangas (list): Ne charger que ces mangas (défaut: toute la collection)
+
+    Returns:
+        dict: URL canonique de la page de scan -> {"id_scan", "chapters_count",
+            "runs_since_discovery"}
+    """
+    query = {}
+    if mangas is not None:
+        manga_ids = [manga_id_from_url(manga.get("url")) for manga in mangas]
+        query = {"_id": {"$in": [manga_id for manga_id in manga_ids if manga_id is not None]}}
+
+    known_scans = {}
+    for manga in get_manga_collection().find(query, {"scan_chapters": 1}):
+        for scan_type in manga.get("scan_chapters") or []:
+            if scan_type.get("url"):
+                known_scans[canonical_url(scan_type["url"])] = {
+                    "id_scan": scan_type.get("id_scan"),
+                    "chapters_count": scan_type.get("chapters_count", 0),
+                    "runs_since_discovery": scan_type.get("runs_since_discovery"),
+                }
+    return known_scans
 
-# Sélectionner la base de données SushiScan (déjà définie dans l'URL)
-db = client.get_database()
 
-# Définir les collections
-mangas_collection = db["mangas"]  # Stocke les informations de base des mangas
-chapters_collection = db["chapters"]  # Stocke les chapitres individuels
-planning_collection = db["planning"]  # Stocke le planning des sorties
-homepage_collection = db["homepage"]  # Stocke les données de la homepage
 def get_data(jsonfile):
     """
     Fonction pour récupérer les données d'un fichier JSON et les insérer dans la base de données MongoDB.
@@ -44,12 +534,206 @@ def get_data(jsonfile):
         return None
 
 
-def insert_mangas_to_db(data):
+# Index des listes filtrées : une clé par combinaison de filtres, triée par titre
+BROWSE_INDEX = [
+    ("browse_keys", pymongo.ASCENDING),
+    ("title", pymongo.ASCENDING),
+    ("_id", pymongo.ASCENDING),
+]
+
+
+def ensure_browse_indexes():
+    """Crée l'index de navigation des mangas et l'index des facettes."""
+    get_manga_collection().create_index(BROWSE_INDEX)
+    get_facets_collection().create_index(
+        [("scopes", pymongo.ASCENDING), ("count", pymongo.DESCENDING)]
+    )
+
+
+def facet_document(key, labels):
+    """
+    Champs d'un compteur de facette : filtres de la clé, libellés et
+    "scopes" (dimension comptée @ clé des autres filtres), par lesquels
+    get_facets() retrouve par exemple les genres des Manhwa.
+    """
+    filters = parse_browse_key(key)
+    return {
+        "filters": filters,
+        "labels": {
+            dimension: labels[dimension].get(value, value)
+            for dimension, value in filters.items()
+        },
+        "scopes": [
+            f"{dimension}@"
+            + browse_key(**{other: value for other, value in filters.items() if other != dimension})
+            for dimension in filters
+        ],
+    }
+
+
+def update_facet_counts(previous_keys, keys, labels):
+    """
+    Met à jour les compteurs de facettes d'un manga dont les clés de
+    navigation passent de `previous_keys` à `keys`.
+
+    Args:
+        previous_keys (list): Clés avant l'écriture (None pour un nouveau manga)
+        keys (list): Clés après l'écriture
+        labels (dict): Libellés {dimension: {valeur: libellé}} (voir browse_fields)
+    """
+    previous_keys = set(previous_keys or [])
+    keys = set(keys)
+    operations = [
+        pymongo.UpdateOne(
+            {"_id": key},
+            {"$inc": {"count": 1}, "$set": facet_document(key, labels)},
+            upsert=True,
+        )
+        for key in keys - previous_keys
+    ]
+    operations += [
+        pymongo.UpdateOne({"_id": key}, {"$inc": {"count": -1}})
+        for key in previous_keys - keys
+    ]
+    if operations:
+        get_facets_collection().bulk_write(operations, ordered=False)
+
+
+def adopt_legacy_chapters(manga_title, manga_id):
+    """
+    Donne le manga_id aux chapitres et buckets d'un manga enregistrés avant
+    la migration (identifiés par leur titre), pour que les lectures par
+    manga_id les trouvent même s'ils ne sont pas réécrits par le scraping.
+
+    Un chapitre antérieur qui existe déjà sous le manga_id (réécrit entre-temps)
+    est supprimé au profit de la version récente.
+
+    Returns:
+        int: Nombre de documents mis à jour
+    """
+    legacy_query = {"manga_title": manga_title, "manga_id": {"$exists": False}}
+    nb_updated = 0
+    for collection in (get_chapters_collection(), get_chapter_buckets_collection()):
+        try:
+            nb_updated += collection.update_many(legacy_query, {"$set": {"manga_id": manga_id}}).modified_count
+        except pymongo.errors.DuplicateKeyError:
+            # Un par un : les doublons de l'index unique par manga_id sont supprimés
+            for doc in collection.find(legacy_query, {"_id": 1}):
+                try:
+                    collection.update_one({"_id": doc["_id"]}, {"$set": {"manga_id": manga_id}})
+                    nb_updated += 1
+                except pymongo.errors.DuplicateKeyError:
+                    collection.delete_one({"_id": doc["_id"]})
+    return nb_updated
+
+
+def upsert_manga(mangas_collection, manga_id, manga_doc):
+    """
+    Insère ou met à jour un manga sous son manga_id (_id), ou par titre si
+    son URL ne permet pas d'en dériver un.
+
+    Un document antérieur à la migration (_id ObjectId, même titre) est
+    recréé sous son manga_id : le nouveau document est écrit avant la
+    suppression de l'ancien, pour qu'une interruption ne fasse pas perdre le
+    manga, et ses chapitres reçoivent le manga_id (voir adopt_legacy_chapters).
+    Les champs de navigation (voir browse_fields) et les compteurs de
+    facettes sont mis à jour au passage.
+
+    Returns:
+        bool: True si le manga a été créé
+    """
+    fields, labels = browse_fields(manga_doc)
+    manga_doc = dict(manga_doc, **fields)
+    query = {"title": manga_doc["title"]} if manga_id is None else {"_id": manga_id}
+
+    def write():
+        return mangas_collection.find_one_and_update(
+            query, {"$set": manga_doc}, projection={"browse_keys": 1}, upsert=True
+        )
+
+    try:
+        previous = write()
+    except pymongo.errors.DuplicateKeyError:
+        # Index unique sur le titre d'avant la migration
+        if manga_id is None:
+            raise
+        relax_title_index(mangas_collection)
+        previous = write()
+
+    if previous is None and manga_id is not None:
+        legacy = mangas_collection.find_one(
+            {"title": manga_doc["title"], "_id": {"$type": "objectId"}}
+        )
+        if legacy is not None:
+            # Champs du document d'origine absents du scraping, puis suppression
+            kept = {key: value for key, value in legacy.items() if key != "_id" and key not in manga_doc}
+            if kept:
+                mangas_collection.update_one({"_id": manga_id}, {"$set": kept})
+            mangas_collection.delete_one({"_id": legacy["_id"]})
+            previous = {"browse_keys": legacy.get("browse_keys")}
+            adopt_legacy_chapters(manga_doc["title"], manga_id)
+
+    try:
+        update_facet_counts(
+            previous.get("browse_keys") if previous else None, fields["browse_keys"], labels
+        )
+    except Exception as e:
+        print(f"Erreur lors de la mise à jour des facettes de {manga_doc['title']}: {e}")
+    return previous is None
+
+
+def rebuild_facets(batch_size=1000):
+    """
+    Recalcule les champs de navigation de tous les mangas et reconstruit la
+    collection `facets` (après un import en masse, ou pour une base créée
+    avant l'indexation de navigation).
+
+    Returns:
+        int: Nombre de compteurs de facettes écrits
+    """
+    mangas_collection = get_manga_collection()
+    ensure_browse_indexes()
+    counts = Counter()
+    all_labels = {"type": {}, "language": {}, "genre": {}}
+    operations = []
+    for manga in mangas_collection.find({}, {"genres": 1, "type": 1, "language": 1}):
+        fields, labels = browse_fields(manga)
+        counts.update(fields["browse_keys"])
+        for dimension, values in labels.items():
+            for value, label in values.items():
+                all_labels[dimension].setdefault(value, label)
+        operations.append(pymongo.UpdateOne({"_id": manga["_id"]}, {"$set": fields}))
+        if len(operations) >= batch_size:
+            mangas_collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        mangas_collection.bulk_write(operations, ordered=False)
+
+    facets_collection = get_facets_collection()
+    facets_collection.delete_many({})
+    documents = [
+        dict(facet_document(key, all_labels), _id=key, count=count)
+        for key, count in counts.items()
+    ]
+    for start in range(0, len(documents), batch_size):
+        facets_collection.insert_many(documents[start:start + batch_size], ordered=False)
+    notify_cache_invalidation("mangas")
+    print(f"{len(documents)} compteurs de facettes reconstruits pour {counts['*']} mangas.")
+    return len(documents)
+
+
+def insert_mangas_to_db(data, feed=None, failed=None, ensure_indexes=True, invalidate_cache=True):
     """
     Insère les données des mangas dans MongoDB de manière optimisée.
 
     Args:
         data (list): Liste des données de mangas à insérer
+        feed (ChangeFeed): Journal des changements du run (optionnel)
+        failed (list): Optionnel, reçoit l'URL de chaque manga dont une
+            écriture (manga, chapitres) a échoué
+        ensure_indexes (bool): Créer les index avant l'écriture (une fois par
+            run suffit, voir ingest_writer.py)
+        invalidate_cache (bool): Invalider les caches de lecture après l'écriture
 
     Returns:
         tuple: (nb_mangas_added, nb_chapters_added) - Nombre de mangas et chapitres ajoutés
@@ -58,17 +742,29 @@ def insert_mangas_to_db(data):
         print("Aucune donnée à insérer.")
         return 0, 0
 
+    mangas_collection = get_manga_collection()
+    chapters_collection = get_chapters_collection()
+
     nb_mangas_added = 0
     nb_chapters_added = 0
 
+    nb_processed = 0
     try:
-        # Création d'un index sur le titre pour accélérer les recherches
-        mangas_collection.create_index([("title", pymongo.ASCENDING)], unique=True)
+        # Index sur le titre et index des chapitres par manga_id
+        if ensure_indexes:
+            ensure_manga_id_indexes()
 
         # Traitement de chaque manga
         for manga in data:
+            # Les enregistrements du pipeline sont convertis un par un
+            if isinstance(manga, Manga):
+                manga = manga.to_dict()
+            manga_id = manga_id_from_url(manga.get("url"))
+            write_failed = False
+
             # Extraction des chapitres pour insertion séparée
             chapters_data = []
+            bucket_writes = []  # (scan_type, chapters) en mode buckets
             scan_chapters_copy = []  # Copie pour conserver les données originales
 
             if "scan_chapters" in manga:
@@ -81,12 +777,21 @@ def insert_mangas_to_db(data):
                     if "chapters" in scan_type:
                         chapters = scan_type["chapters"]
 
+                        # En mode buckets, une seule écriture par type de scan
+                        if use_chapter_buckets():
+                            bucket_writes.append((scan_type, chapters))
+                            chapters = []
+
                         # Préparation des chapitres pour insertion
                         for chapter in chapters:
                             chapter_doc = {
+                                "manga_id": manga_id,
                                 "manga_title": manga["title"],
                                 "scan_name": scan_type["name"],
                                 "number": chapter["number"],
+                                "number_sort": chapter.get(
+                                    "number_sort", chapter_sort_value(chapter["number"])
+                                ),
                                 "title": chapter["title"],
                                 "page_count": chapter.get("page_count", 0),
                                 "scan_id": scan_type.get("id_scan"),
@@ -95,6 +800,9 @@ def insert_mangas_to_db(data):
                                 "updated_at": datetime.now(),
                             }
 
+                            if manga_id is None:
+                                chapter_doc.pop("manga_id")
+
                             # Ajout du chemin du reader (compatibilité)
                             if "reader_path" in chapter:
                                 chapter_doc["reader_path"] = chapter["reader_path"]
@@ -102,58 +810,74 @@ def insert_mangas_to_db(data):
                             chapters_data.append(chapter_doc)
 
                         # Mettre le count des chapitres dans la copie
-                        scan_type_copy["chapters_count"] = len(chapters)
+                        scan_type_copy["chapters_count"] = len(scan_type["chapters"])
                         # Retirer les chapitres détaillés de la copie pour éviter la duplication
                         scan_type_copy.pop("chapters", None)
 
                     scan_chapters_copy.append(scan_type_copy)
             # Insertion ou mise à jour des chapitres en premier pour pouvoir calculer les totaux
             if chapters_data:
-                # Création d'un index pour rechercher les chapitres
-                chapters_collection.create_index(
-                    [
-                        ("manga_title", pymongo.ASCENDING),
-                        ("scan_name", pymongo.ASCENDING),
-                        ("number", pymongo.ASCENDING),
-                    ],
-                    unique=True,
-                )
-
                 # Insertion ou mise à jour des chapitres
                 for chapter in chapters_data:
+                    legacy_query = {
+                        "manga_title": chapter["manga_title"],
+                        "scan_name": chapter["scan_name"],
+                        "number": chapter["number"],
+                    }
+                    query = legacy_query
+                    if manga_id is not None:
+                        query = {
+                            "manga_id": manga_id,
+                            "scan_name": chapter["scan_name"],
+                            "number": chapter["number"],
+                        }
                     try:
-                        result = chapters_collection.update_one(
-                            {
-                                "manga_title": chapter["manga_title"],
-                                "scan_name": chapter["scan_name"],
-                                "number": chapter["number"],
-                            },
+                        previous = upsert_with_legacy_fallback(
+                            chapters_collection,
+                            query,
+                            legacy_query,
                             {"$set": chapter},
-                            upsert=True,
+                            projection={"page_count": 1},
                         )
 
-                        if result.upserted_id:
+                        if previous is None:
                             nb_chapters_added += 1
+                            if feed is not None:
+                                feed.chapter_added(
+                                    chapter["manga_title"],
+                                    chapter["scan_name"],
+                                    chapter["number"],
+                                    chapter["page_count"],
+                                )
+                        elif feed is not None and previous.get("page_count") != chapter["page_count"]:
+                            feed.page_count_changed(
+                                chapter["manga_title"],
+                                chapter["scan_name"],
+                                chapter["number"],
+                                previous.get("page_count"),
+                                chapter["page_count"],
+                            )
                     except Exception as e:
+                        write_failed = True
                         print(
                             f"Erreur lors de l'insertion du chapitre {chapter['number']} de {chapter['manga_title']}: {e}"
                         )
 
+            if bucket_writes:
+                for scan_type, chapters in bucket_writes:
+                    try:
+                        nb_chapters_added += upsert_chapter_bucket(
+                            manga["title"], scan_type, chapters, feed, manga_id
+                        )
+                    except Exception as e:
+                        write_failed = True
+                        print(
+                            f"Erreur lors de l'insertion des chapitres {scan_type['name']} de {manga['title']}: {e}"
+                        )
+
             # Calculer les totaux depuis la base de données
             manga_title = manga["title"]
-
-            # Compter le nombre de chapitres pour ce manga
-            total_chapters = chapters_collection.count_documents(
-                {"manga_title": manga_title}
-            )
-
-            # Calculer le total de pages pour ce manga
-            pipeline_pages = [
-                {"$match": {"manga_title": manga_title}},
-                {"$group": {"_id": None, "total_pages": {"$sum": "$page_count"}}},
-            ]
-            page_result = list(chapters_collection.aggregate(pipeline_pages))
-            total_pages = page_result[0]["total_pages"] if page_result else 0
+            total_chapters, total_pages = get_manga_totals(manga_title, manga_id)
 
             # Ajout des métadonnées du manga avec les totaux corrects
             manga_doc = {
@@ -173,12 +897,10 @@ def insert_mangas_to_db(data):
 
             # Insertion ou mise à jour du manga (upsert)
             try:
-                result = mangas_collection.update_one(
-                    {"title": manga["title"]}, {"$set": manga_doc}, upsert=True
-                )
-
-                if result.upserted_id:
+                if upsert_manga(mangas_collection, manga_id, manga_doc):
                     nb_mangas_added += 1
+                    if feed is not None:
+                        feed.manga_added(manga["title"])
                     print(
                         f"Manga ajouté: {manga['title']} ({total_chapters} chapitres, {total_pages} pages)"
                     )
@@ -188,12 +910,25 @@ def insert_mangas_to_db(data):
                     )
 
             except Exception as e:
+                write_failed = True
                 print(f"Erreur lors de l'insertion du manga {manga['title']}: {e}")
 
+            if write_failed and failed is not None:
+                failed.append(manga.get("url"))
+            nb_processed += 1
+
+        if feed is not None:
+            feed.flush()
+        if invalidate_cache:
+            notify_cache_invalidation("mangas", "chapters")
         return nb_mangas_added, nb_chapters_added
 
     except Exception as e:
         print(f"Erreur lors de l'insertion en base de données: {e}")
+        if failed is not None:
+            # Le manga en cours et les suivants n'ont pas été écrits
+            for manga in list(data)[nb_processed:]:
+                failed.append(manga.url if isinstance(manga, Manga) else manga.get("url"))
         return 0, 0
 
 
@@ -211,6 +946,8 @@ def insert_planning_to_db(planning_data):
         print("Aucune donnée de planning à insérer.")
         return 0
 
+    planning_collection = get_planning_collection()
+
     nb_planning_updated = 0
 
     try:
@@ -221,6 +958,15 @@ def insert_planning_to_db(planning_data):
         planning_collection.delete_many({})
         print("Collection planning vidée pour mise à jour complète.")
 
+        # Miniatures déjà en cache (la collection est recréée à chaque mise à jour)
+        images = list({entry["image"] for entry in planning_data if entry.get("image")})
+        thumbnails = {
+            doc["_id"]: doc["thumbnails"]
+            for doc in get_covers_collection().find(
+                {"_id": {"$in": images}, "thumbnails": {"$exists": True}}, {"thumbnails": 1}
+            )
+        } if images else {}
+
         # Traitement de chaque entrée de planning
         for entry in planning_data:
             # Préparation du document planning
@@ -234,6 +980,8 @@ def insert_planning_to_db(planning_data):
                 "language": entry["language"],
                 "updated_at": datetime.now(),
             }
+            if entry["image"] in thumbnails:
+                planning_doc["image_thumbnails"] = thumbnails[entry["image"]]
 
             # Insertion de l'entrée de planning
             try:
@@ -245,6 +993,7 @@ def insert_planning_to_db(planning_data):
                 print(f"Erreur lors de l'insertion de l'entrée planning {entry['name']}: {e}")
 
         print(f"Planning mis à jour: {nb_planning_updated} entrées ajoutées.")
+        notify_cache_invalidation("planning")
         return nb_planning_updated
 
     except Exception as e:
@@ -252,6 +1001,552 @@ def insert_planning_to_db(planning_data):
         return 0
 
 
+def migrate_chapter_sort_keys(batch_size=1000):
+    """
+    Ajoute le champ `number_sort` aux chapitres existants qui ne l'ont pas,
+    puis crée l'index composé correspondant.
+
+    Args:
+        batch_size (int): Nombre de mises à jour envoyées par bulk_write
+
+    Returns:
+        int: Nombre de chapitres migrés
+    """
+    chapters_collection = get_chapters_collection()
+
+    nb_migrated = 0
+    batch = []
+
+    try:
+        cursor = chapters_collection.find(
+            {"number_sort": {"$exists": False}}, {"number": 1}
+        )
+        for chapter in cursor:
+            batch.append(
+                pymongo.UpdateOne(
+                    {"_id": chapter["_id"]},
+                    {"$set": {"number_sort": chapter_sort_value(chapter.get("number"))}},
+                )
+            )
+            if len(batch) >= batch_size:
+                nb_migrated += chapters_collection.bulk_write(
+                    batch, ordered=False
+                ).modified_count
+                batch = []
+                print(f"  {nb_migrated} chapitres migrés...")
+
+        if batch:
+            nb_migrated += chapters_collection.bulk_write(
+                batch, ordered=False
+            ).modified_count
+
+        chapters_collection.create_index(CHAPTER_SORT_INDEX)
+        print(f"Migration terminée: {nb_migrated} chapitres mis à jour.")
+        if nb_migrated:
+            notify_cache_invalidation("chapters")
+        return nb_migrated
+
+    except Exception as e:
+        print(f"Erreur lors de la migration des clés de tri: {e}")
+        return nb_migrated
+
+
+def migrate_chapters_to_buckets(drop_documents=False):
+    """
+    Regroupe les documents de la collection `chapters` en buckets
+    (un document par manga et type de scan) dans `chapter_buckets`.
+
+    Args:
+        drop_documents (bool): Supprimer les documents `chapters` migrés
+
+    Returns:
+        int: Nombre de buckets écrits
+    """
+    chapters_collection = get_chapters_collection()
+    chapter_buckets_collection = get_chapter_buckets_collection()
+
+    nb_buckets = 0
+    batch = []
+
+    try:
+        ensure_manga_id_indexes()
+        pipeline = [
+            {"$sort": {field: direction for field, direction in CHAPTER_SORT_INDEX}},
+            {
+                "$group": {
+                    "_id": {"manga_title": "$manga_title", "scan_name": "$scan_name"},
+                    "manga_id": {"$last": "$manga_id"},
+                    "chapters": {"$push": ["$number", "$page_count"]},
+                    "scan_id": {"$last": "$scan_id"},
+                    "episodes_url": {"$last": "$episodes_url"},
+                    "added_at": {"$min": "$added_at"},
+                    "updated_at": {"$max": "$updated_at"},
+                }
+            },
+        ]
+        for group in chapters_collection.aggregate(pipeline, allowDiskUse=True):
+            entries = [[number, page_count or 0] for number, page_count in group["chapters"]]
+            bucket = {
+                "manga_title": group["_id"]["manga_title"],
+                "scan_name": group["_id"]["scan_name"],
+            }
+            if group.get("manga_id") is not None:
+                bucket["manga_id"] = group["manga_id"]
+            batch.append(
+                pymongo.UpdateOne(
+                    dict(
+                        chapter_owner_query(bucket["manga_title"], group.get("manga_id")),
+                        scan_name=bucket["scan_name"],
+                    ),
+                    {
+                        "$set": {
+                            **bucket,
+                            "scan_id": group.get("scan_id"),
+                            "episodes_url": group.get("episodes_url"),
+                            "chapters": entries,
+                            "chapters_count": len(entries),
+                            "total_pages": sum(page_count for _, page_count in entries),
+                            "added_at": group.get("added_at"),
+                            "updated_at": group.get("updated_at"),
+                        }
+                    },
+                    upsert=True,
+                )
+            )
+            if len(batch) >= 500:
+                chapter_buckets_collection.bulk_write(batch, ordered=False)
+                nb_buckets += len(batch)
+                batch = []
+                print(f"  {nb_buckets} buckets écrits...")
+
+        if batch:
+            chapter_buckets_collection.bulk_write(batch, ordered=False)
+            nb_buckets += len(batch)
+
+        print(f"Migration terminée: {nb_buckets} buckets écrits.")
+
+        if drop_documents:
+            result = chapters_collection.delete_many({})
+            print(f"{result.deleted_count} documents chapitres supprimés.")
+
+        notify_cache_invalidation("chapters")
+        return nb_buckets
+
+    except Exception as e:
+        print(f"Erreur lors de la migration vers les buckets: {e}")
+        return nb_buckets
+
+
+def migrate_manga_ids(batch_size=1000):
+    """
+    Passe les mangas existants sur leur identifiant stable : le manga est
+    recréé avec `_id` = manga_id (dérivé du slug de son URL), ses chapitres
+    et buckets reçoivent le champ `manga_id`, puis les anciens index par
+    titre sont remplacés par les index par manga_id.
+
+    Si plusieurs documents correspondent au même slug (titre renommé sur
+    le site), le plus récent est conservé ainsi que ses chapitres.
+
+    Args:
+        batch_size (int): Nombre de mises à jour envoyées par bulk_write
+
+    Returns:
+        int: Nombre de mangas migrés
+    """
+    mangas_collection = get_manga_collection()
+    chapters_collection = get_chapters_collection()
+    chapter_buckets_collection = get_chapter_buckets_collection()
+
+    nb_migrated = 0
+    try:
+        # Le nouveau document est écrit avant la suppression de l'ancien (même titre)
+        relax_title_index(mangas_collection)
+
+        # Les index uniques par manga_id sont recréés après la suppression des doublons
+        for collection, keys in (
+            (chapters_collection, CHAPTER_UNIQUE_INDEX),
+            (chapter_buckets_collection, CHAPTER_BUCKET_INDEX),
+        ):
+            index_name = "_".join(f"{field}_{direction}" for field, direction in keys)
+            if index_name in collection.index_information():
+                collection.drop_index(index_name)
+
+        # Du plus ancien au plus récent : un titre renommé remplace l'ancien
+        legacy_mangas = mangas_collection.find({"_id": {"$type": "objectId"}}).sort(
+            "updated_at", pymongo.ASCENDING
+        )
+        for manga in legacy_mangas:
+            manga_id = manga_id_from_url(manga.get("url"))
+            if manga_id is None:
+                print(f"  Pas de slug de catalogue pour {manga.get('title')}, manga ignoré")
+                continue
+
+            old_id = manga["_id"]
+            manga["_id"] = manga_id
+            current = mangas_collection.find_one({"_id": manga_id}, {"updated_at": 1})
+            # Un document déjà migré plus récent (titre renommé depuis) est conservé
+            if current is None or (current.get("updated_at") or datetime.min) <= (
+                manga.get("updated_at") or datetime.min
+            ):
+                mangas_collection.replace_one({"_id": manga_id}, manga, upsert=True)
+            # Le document d'origine n'est supprimé qu'une fois le nouveau écrit
+            mangas_collection.delete_one({"_id": old_id})
+
+            adopt_legacy_chapters(manga["title"], manga_id)
+            nb_migrated += 1
+            if nb_migrated % batch_size == 0:
+                print(f"  {nb_migrated} mangas migrés...")
+
+        # Doublons laissés par les titres renommés : garder le document le plus récent
+        for collection, keys in (
+            (chapters_collection, ["manga_id", "scan_name", "number"]),
+            (chapter_buckets_collection, ["manga_id", "scan_name"]),
+        ):
+            pipeline = [
+                {"$match": MANGA_ID_FILTER},
+                {"$sort": {"updated_at": -1}},
+                {
+                    "$group": {
+                        "_id": {key: f"${key}" for key in keys},
+                        "ids": {"$push": "$_id"},
+                        "count": {"$sum": 1},
+                    }
+                },
+                {"$match": {"count": {"$gt": 1}}},
+            ]
+            duplicates = []
+            for group in collection.aggregate(pipeline, allowDiskUse=True):
+                duplicates.extend(group["ids"][1:])
+            for start in range(0, len(duplicates), batch_size):
+                collection.delete_many({"_id": {"$in": duplicates[start:start + batch_size]}})
+            if duplicates:
+                print(f"  {len(duplicates)} doublons supprimés dans {collection.name}")
+
+        # Remplacement des index par titre
+        for name, index_names in LEGACY_TITLE_INDEXES.items():
+            collection = get_db()[name]
+            existing = collection.index_information()
+            for index_name in index_names:
+                if index_name in existing:
+                    collection.drop_index(index_name)
+        ensure_manga_id_indexes()
+
+        print(f"Migration terminée: {nb_migrated} mangas passés sur leur identifiant stable.")
+        notify_cache_invalidation("mangas", "chapters")
+        return nb_migrated
+
+    except Exception as e:
+        print(f"Erreur lors de la migration des identifiants de mangas: {e}")
+        return nb_migrated
+
+
+# Extensions reconnues par l'import en masse (éventuellement compressées)
+IMPORT_EXTENSIONS = (".json", ".jsonl", ".ndjson")
+IMPORT_COMPRESSIONS = ("", ".gz", ".bz2", ".xz", ".7z")
+
+
+def iter_import_files(paths):
+    """
+    Développe les chemins de l'import en masse : fichiers tels quels,
+    dossiers parcourus récursivement (fichiers .json/.jsonl/.ndjson,
+    éventuellement .gz, .bz2, .xz ou .7z), par ordre alphabétique.
+
+    Args:
+        paths (list): Fichiers ou dossiers
+
+    Returns:
+        generator: Chemins des fichiers à importer
+    """
+    suffixes = tuple(ext + comp for ext in IMPORT_EXTENSIONS for comp in IMPORT_COMPRESSIONS)
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(suffixes) or name.endswith(".7z"):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def iter_json_values(stream, chunk_size=1 << 20):
+    """
+    Lit en flux les valeurs JSON d'un fichier texte : éléments d'un tableau
+    JSON (format de anime_data.json), lignes JSONL ou objets concaténés,
+    sans charger tout le fichier en mémoire.
+
+    Args:
+        stream: Fichier texte ouvert
+        chunk_size (int): Taille des lectures
+
+    Returns:
+        generator: Valeurs décodées
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    while True:
+        # Sauter les blancs et les séparateurs d'un tableau de premier niveau
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                return
+            buffer = stream.read(chunk_size)
+            position = 0
+            eof = not buffer
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        # Une valeur qui touche la fin du tampon peut être tronquée (nombre)
+        if end == len(buffer) and not eof:
+            chunk = stream.read(chunk_size)
+            if chunk:
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            eof = True
+        yield value
+        position = end
+
+
+def iter_import_records(path):
+    """
+    Itère sur les mangas d'un fichier d'import (JSON ou JSONL, compressé
+    ou non ; une archive .7z peut contenir plusieurs fichiers).
+
+    Args:
+        path (str): Chemin du fichier
+
+    Returns:
+        generator: Dictionnaires manga
+    """
+    if path.endswith(".7z"):
+        import tempfile
+
+        import py7zr
+
+        with tempfile.TemporaryDirectory() as directory:
+            with py7zr.SevenZipFile(path, "r") as archive:
+                archive.extractall(path=directory)
+            for member in iter_import_files([directory]):
+                yield from iter_import_records(member)
+        return
+
+    with _open_compressed(path) as stream:
+        for value in iter_json_values(stream):
+            yield from value if isinstance(value, list) else [value]
+
+
+def _open_compressed(path):
+    """Ouvre `path` en texte, décompressé selon son extension."""
+    openers = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+    for extension, opener in openers.items():
+        if path.endswith(extension):
+            return opener(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def bulk_write_mangas(mangas):
+    """
+    Écrit un lot de mangas avec des bulk_write (un par collection), sans
+    relecture de la base : les totaux sont calculés depuis les données
+    importées et aucun journal des changements n'est produit.
+
+    Les mangas sans manga_id (URL absente ou hors catalogue) sont ignorés.
+    Les documents antérieurs à migrate_manga_ids() ne sont pas adoptés :
+    migrer la base avant d'y importer.
+
+    Args:
+        mangas (list): Mangas au format de anime_data.json
+
+    Returns:
+        Counter: mangas, new_mangas, chapters, new_chapters (new_buckets en
+        mode buckets), skipped, errors
+    """
+    stats = Counter()
+    buckets = use_chapter_buckets()
+    manga_ops, chapter_ops, bucket_ops = [], [], []
+    now = datetime.now()
+
+    for manga in mangas:
+        if isinstance(manga, Manga):
+            manga = manga.to_dict()
+        manga_id = manga_id_from_url(manga.get("url"))
+        if manga_id is None or not manga.get("title"):
+            stats["skipped"] += 1
+            continue
+
+        scan_chapters_copy = []
+        total_chapters = 0
+        total_pages = 0
+        for scan_type in manga.get("scan_chapters") or []:
+            scan_type_copy = {key: value for key, value in scan_type.items() if key != "chapters"}
+            chapters = scan_type.get("chapters")
+            if chapters is not None:
+                scan_type_copy["chapters_count"] = len(chapters)
+                total_chapters += len(chapters)
+                total_pages += sum(chapter.get("page_count", 0) for chapter in chapters)
+                owner = {"manga_id": manga_id, "scan_name": scan_type["name"]}
+                if buckets:
+                    entries = build_chapter_entries(chapters)
+                    bucket_ops.append(
+                        pymongo.UpdateOne(
+                            owner,
+                            {
+                                "$set": {
+                                    "manga_title": manga["title"],
+                                    "scan_id": scan_type.get("id_scan"),
+                                    "episodes_url": scan_type.get("episodes_url"),
+                                    "chapters": entries,
+                                    "chapters_count": len(entries),
+                                    "total_pages": sum(page_count for _, page_count in entries),
+                                    "updated_at": now,
+                                },
+                                "$setOnInsert": {"added_at": now},
+                            },
+                            upsert=True,
+                        )
+                    )
+                else:
+                    for chapter in chapters:
+                        chapter_doc = {
+                            "manga_title": manga["title"],
+                            "number_sort": chapter.get(
+                                "number_sort", chapter_sort_value(chapter["number"])
+                            ),
+                            "title": chapter.get("title", f"Chapitre {chapter['number']}"),
+                            "page_count": chapter.get("page_count", 0),
+                            "scan_id": scan_type.get("id_scan"),
+                            "episodes_url": scan_type.get("episodes_url"),
+                            "updated_at": now,
+                        }
+                        if "reader_path" in chapter:
+                            chapter_doc["reader_path"] = chapter["reader_path"]
+                        chapter_ops.append(
+                            pymongo.UpdateOne(
+                                dict(owner, number=chapter["number"]),
+                                {"$set": chapter_doc, "$setOnInsert": {"added_at": now}},
+                                upsert=True,
+                            )
+                        )
+            scan_chapters_copy.append(scan_type_copy)
+
+        stats["mangas"] += 1
+        stats["chapters"] += total_chapters
+        manga_doc = {
+            "title": manga["title"],
+            "alt_title": manga.get("alt_title", ""),
+            "url": manga["url"],
+            "image_url": manga.get("image_url", ""),
+            "genres": manga.get("genres", []),
+            "type": manga.get("type", ""),
+            "language": manga.get("language", ""),
+            "scan_types": manga.get("scan_types", []),
+            "scan_chapters": scan_chapters_copy,
+            "total_chapters": total_chapters,
+            "total_pages": total_pages,
+            "updated_at": now,
+        }
+        # Compteurs de facettes recalculés en fin d'import (rebuild_facets)
+        manga_doc.update(browse_fields(manga_doc)[0])
+        manga_ops.append(pymongo.UpdateOne({"_id": manga_id}, {"$set": manga_doc}, upsert=True))
+
+    for collection, operations, counter in (
+        (get_chapters_collection(), chapter_ops, "new_chapters"),
+        (get_chapter_buckets_collection(), bucket_ops, "new_buckets"),
+        (get_manga_collection(), manga_ops, "new_mangas"),
+    ):
+        if not operations:
+            continue
+        try:
+            result = collection.bulk_write(operations, ordered=False)
+            stats[counter] += result.upserted_count
+        except pymongo.errors.BulkWriteError as e:
+            stats[counter] += e.details.get("nUpserted", 0)
+            stats["errors"] += len(e.details.get("writeErrors", []))
+    return stats
+
+
+def bulk_import(paths, workers=4, batch_size=200):
+    """
+    Import en masse non interactif : lit en flux les fichiers de données
+    et répartit les lots entre `workers` threads d'écriture (bulk_write).
+
+    Sert à alimenter un nouveau cluster ou à rejouer des runs archivés.
+    Les compteurs de facettes sont reconstruits à la fin de l'import.
+
+    Args:
+        paths (list): Fichiers ou dossiers (JSON/JSONL, .gz/.bz2/.xz/.7z)
+        workers (int): Nombre d'écritures en parallèle
+        batch_size (int): Mangas par lot
+
+    Returns:
+        Counter: Statistiques cumulées (voir bulk_write_mangas)
+    """
+    ensure_manga_id_indexes()
+    totals = Counter()
+    start = time.perf_counter()
+    in_flight = set()
+
+    def collect(done):
+        for future in done:
+            try:
+                totals.update(future.result())
+            except Exception as e:
+                totals["failed_batches"] += 1
+                print(f"Erreur lors de l'écriture d'un lot: {e}")
+        elapsed = time.perf_counter() - start
+        print(
+            f"  {totals['mangas']} mangas, {totals['chapters']} chapitres "
+            f"({totals['mangas'] / elapsed:.0f} mangas/s, {totals['chapters'] / elapsed:.0f} chapitres/s)"
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path in iter_import_files(paths):
+            print(f"Import de {path}...")
+            batch = []
+            try:
+                for record in iter_import_records(path):
+                    batch.append(record)
+                    if len(batch) < batch_size:
+                        continue
+                    # Au plus deux lots en attente par worker : la lecture attend les écritures
+                    if len(in_flight) >= workers * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    in_flight.add(executor.submit(bulk_write_mangas, batch))
+                    batch = []
+            except Exception as e:
+                totals["failed_files"] += 1
+                print(f"Erreur lors de la lecture de {path}: {e}")
+            if batch:
+                in_flight.add(executor.submit(bulk_write_mangas, batch))
+            totals["files"] += 1
+        done, _ = wait(in_flight)
+        collect(done)
+
+    rebuild_facets()
+    elapsed = time.perf_counter() - start
+    notify_cache_invalidation("mangas", "chapters")
+    print(
+        f"\nImport terminé en {elapsed:.1f}s: {totals['files']} fichiers, {totals['mangas']} mangas "
+        f"({totals['new_mangas']} nouveaux), {totals['chapters']} chapitres "
+        f"({totals['chapters'] / elapsed if elapsed else 0:.0f} chapitres/s), "
+        f"{totals['skipped']} ignorés, {totals['errors']} erreurs d'écriture"
+    )
+    return totals
+
+
 def test_connection():
     """
     Teste la connexion à la base de données MongoDB.
@@ -261,7 +1556,7 @@ def test_connection():
     """
     try:
         # Vérifier la connexion en listant les collections
-        collections = db.list_collection_names()
+        collections = get_db().list_collection_names()
         print(
             f"Connexion à MongoDB réussie. Collections disponibles: {', '.join(collections)}"
         )
@@ -276,8 +1571,12 @@ def get_manga_stats():
     Affiche des statistiques sur les mangas et chapitres stockés dans la base de données.
     """
     try:
-        manga_count = mangas_collection.count_documents({})
-        chapter_count = chapters_collection.count_documents({})
+        if use_chapter_buckets():
+            get_bucket_stats()
+            return
+
+        manga_count = get_manga_collection().count_documents({})
+        chapter_count = get_chapters_collection().count_documents({})
 
         print(f"\nStatistiques MongoDB:")
         print(f"- Nombre de mangas: {manga_count}")
@@ -295,7 +1594,7 @@ def get_manga_stats():
             {"$limit": 5},
         ]
 
-        top_mangas = list(chapters_collection.aggregate(pipeline))
+        top_mangas = list(get_chapters_collection().aggregate(pipeline))
 
         if top_mangas:
             print("\nTop 5 des mangas avec le plus de chapitres:")
@@ -320,7 +1619,7 @@ def get_manga_stats():
             },
         ]
 
-        page_stats = list(chapters_collection.aggregate(pipeline_pages))
+        page_stats = list(get_chapters_collection().aggregate(pipeline_pages))
         if page_stats:
             stats = page_stats[0]
             print(f"\nStatistiques des pages:")
@@ -333,12 +1632,52 @@ def get_manga_stats():
         print(f"Erreur lors de la récupération des statistiques: {e}")
 
 
+def get_bucket_stats():
+    """
+    Affiche les statistiques des mangas et chapitres en mode buckets.
+    """
+    manga_count = get_manga_collection().count_documents({})
+    pipeline = [
+        {
+            "$group": {
+                "_id": "$manga_title",
+                "chapter_count": {"$sum": "$chapters_count"},
+                "total_pages": {"$sum": "$total_pages"},
+            }
+        },
+        {"$sort": {"chapter_count": -1}},
+    ]
+    per_manga = list(get_chapter_buckets_collection().aggregate(pipeline, allowDiskUse=True))
+    chapter_count = sum(manga["chapter_count"] for manga in per_manga)
+    total_pages = sum(manga["total_pages"] for manga in per_manga)
+
+    print(f"\nStatistiques MongoDB (buckets):")
+    print(f"- Nombre de mangas: {manga_count}")
+    print(f"- Nombre de chapitres: {chapter_count}")
+
+    if per_manga:
+        print("\nTop 5 des mangas avec le plus de chapitres:")
+        for idx, manga in enumerate(per_manga[:5], 1):
+            pages_info = (
+                f" ({manga['total_pages']} pages)" if manga["total_pages"] > 0 else ""
+            )
+            print(
+                f"{idx}. {manga['_id']} - {manga['chapter_count']} chapitres{pages_info}"
+            )
+
+    print(f"\nStatistiques des pages:")
+    print(f"- Nombre total de pages: {total_pages}")
+    print(
+        f"- Moyenne de pages par chapitre: {total_pages / chapter_count if chapter_count else 0:.1f}"
+    )
+
+
 def get_planning_stats():
     """
     Affiche les statistiques du planning depuis la base de données.
     """
     try:
-        total_entries = planning_collection.count_documents({})
+        total_entries = get_planning_collection().count_documents({})
         print(f"\n=== STATISTIQUES DU PLANNING ===")
         print(f"Total des entrées: {total_entries}")
         
@@ -348,7 +1687,7 @@ def get_planning_stats():
             {"$sort": {"_id": 1}}
         ]
         
-        day_stats = list(planning_collection.aggregate(pipeline))
+        day_stats = list(get_planning_collection().aggregate(pipeline))
         
         print("\nRépartition par jour:")
         for stat in day_stats:
@@ -360,7 +1699,7 @@ def get_planning_stats():
             {"$sort": {"count": -1}}
         ]
         
-        status_stats = list(planning_collection.aggregate(status_pipeline))
+        status_stats = list(get_planning_collection().aggregate(status_pipeline))
         
         print("\nRépartition par statut:")
         for stat in status_stats:
@@ -382,7 +1721,7 @@ def search_manga(query):
         # Recherche avec une expression régulière (insensible à la casse)
         regex_query = {"title": {"$regex": query, "$options": "i"}}
         results = list(
-            mangas_collection.find(
+            get_manga_collection().find(
                 regex_query,
                 {
                     "title": 1,
@@ -415,6 +1754,25 @@ def search_manga(query):
 
 # Point d'entrée du script
 if __name__ == "__main__":
+    # Mode non interactif : python add_to_db.py import <fichiers ou dossiers>
+    if len(sys.argv) > 1:
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Outil d'ajout à la base de données MongoDB")
+        subparsers = parser.add_subparsers(dest="command", required=True)
+        import_parser = subparsers.add_parser(
+            "import", help="Importer en masse des fichiers de données (JSON/JSONL, .gz/.bz2/.xz/.7z)"
+        )
+        import_parser.add_argument("paths", nargs="+", help="Fichiers ou dossiers à importer")
+        import_parser.add_argument("--workers", type=int, default=4, help="Écritures en parallèle (défaut: 4)")
+        import_parser.add_argument("--batch-size", type=int, default=200, help="Mangas par lot (défaut: 200)")
+        args = parser.parse_args()
+
+        if not test_connection():
+            sys.exit(1)
+        totals = bulk_import(args.paths, workers=args.workers, batch_size=args.batch_size)
+        sys.exit(1 if totals["failed_files"] or totals["failed_batches"] else 0)
+
     print("=== Outil d'ajout à la base de données MongoDB ===")
 
     # Tester la connexion à la base de données
@@ -431,9 +1789,13 @@ if __name__ == "__main__":
         print("3. Rechercher un manga par titre")
         print("4. Mettre à jour le planning")
         print("5. Afficher les statistiques du planning")
-        print("6. Quitter")
+        print("6. Migrer les clés de tri numériques des chapitres")
+        print("7. Migrer les chapitres vers le stockage en buckets")
+        print("8. Migrer les mangas vers leur identifiant stable (manga_id)")
+        print("9. Reconstruire les index de navigation et les compteurs de facettes")
+        print("10. Quitter")
 
-        choice = input("\nEntrez votre choix (1-6): ")
+        choice = input("\nEntrez votre choix (1-10): ")
 
         if choice == "1":
             # Importer les données depuis le fichier JSON
@@ -495,27 +1857,27 @@ if __name__ == "__main__":
             get_planning_stats()
 
         elif choice == "6":
-            # Quitter
-            print("Au revoir!")
-            break
+            # Backfill du champ number_sort sur les chapitres existants
+            migrate_chapter_sort_keys()
 
-        else:
-            print("Option invalide. Veuillez choisir entre 1 et 6.")
+        elif choice == "7":
+            # Regroupement des chapitres existants en buckets
+            drop = input("Supprimer les documents chapitres migrés ? (o/N): ")
+            migrate_chapters_to_buckets(drop_documents=drop.strip().lower() == "o")
+            print("Définissez CHAPTER_STORAGE=buckets dans le .env pour utiliser ce stockage.")
 
+        elif choice == "8":
+            # Passage des mangas et chapitres existants sur manga_id
+            migrate_manga_ids()
 
-# Fonctions d'accès aux collections pour les autres modules
-def get_manga_collection():
-    """Retourne la collection des mangas"""
-    return mangas_collection
+        elif choice == "9":
+            # Champs de navigation et collection facets recalculés depuis les mangas
+            rebuild_facets()
 
-def get_chapters_collection():
-    """Retourne la collection des chapitres"""
-    return chapters_collection
-
-def get_planning_collection():
-    """Retourne la collection du planning"""
-    return planning_collection
+        elif choice == "10":
+            # Quitter
+            print("Au revoir!")
+            break
 
-def get_homepage_collection():
-    """Retourne la collection de la homepage"""
-    return homepage_collection
+        else:
+            print("Option invalide. Veuillez choisir entre 1 et 10.")
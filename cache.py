@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache mémoire TTL/LRU partagé par les modules de lecture.
+
+Les clés sont des tuples dont le premier élément est un "namespace"
+(mangas, chapters, planning, homepage). Les écritures en base invalident
+un namespace complet via invalidate().
+"""
+
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+# Ensemble des caches vivants, pour que invalidate() les atteigne tous
+_registry = weakref.WeakSet()
+
+
+class TTLCache:
+    """
+    Cache LRU borné dont les entrées expirent après `ttl` secondes.
+
+    Args:
+        maxsize (int): Nombre maximum d'entrées conservées
+        ttl (float): Durée de vie d'une entrée en secondes
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _registry.add(self)
+
+    def get(self, key, default=None):
+        """Retourne la valeur associée à `key` si elle est présente et non expirée."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Ajoute ou remplace une entrée, en évinçant la plus ancienne si besoin."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *namespaces):
+        """
+        Supprime les entrées des namespaces donnés (toutes si aucun n'est donné).
+
+        Returns:
+            int: Nombre d'entrées supprimées
+        """
+        with self._lock:
+            if not namespaces:
+                removed = len(self._data)
+                self._data.clear()
+                return removed
+            to_remove = [
+                key
+                for key in self._data
+                if isinstance(key, tuple) and key and key[0] in namespaces
+            ]
+            for key in to_remove:
+                del self._data[key]
+            return len(to_remove)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def invalidate(*namespaces):
+    """
+    Invalide les namespaces donnés dans tous les caches du processus.
+
+    Returns:
+        int: Nombre total d'entrées supprimées
+    """
+    return sum(cache.invalidate(*namespaces) for cache in list(_registry))
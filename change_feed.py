@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Journal des changements produit par chaque ingestion.
+
+Pendant insert_mangas_to_db, les mangas ajoutés, les chapitres ajoutés,
+les nombres de pages modifiés et (après un crawl complet) les titres
+disparus du catalogue sont enregistrés avec l'identifiant du run et un
+horodatage :
+
+- dans la collection `changes` (index TTL, CHANGE_FEED_TTL_DAYS jours) ;
+- dans un fichier JSONL compressé par run, sous CHANGE_FEED_DIR.
+
+Les consommateurs se synchronisent en lisant les changements depuis leur
+dernier passage au lieu de relire tout le catalogue. Les anciens fichiers
+peuvent être regroupés en archives 7z mensuelles (py7zr).
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pymongo
+
+from add_to_db import get_changes_collection, get_manga_collection, load_env
+
+MANGA_ADDED = "manga_added"
+MANGA_REMOVED = "manga_removed"
+CHAPTER_ADDED = "chapter_added"
+PAGE_COUNT_CHANGED = "page_count_changed"
+
+
+def new_run_id():
+    """Identifiant d'un run d'ingestion."""
+    return datetime.now().strftime("%Y%m%d%H%M%S")
+
+
+def get_change_feed_dir():
+    """Dossier des fichiers de changements (variable CHANGE_FEED_DIR)."""
+    load_env()
+    return os.getenv("CHANGE_FEED_DIR", "changes")
+
+
+def ensure_change_indexes():
+    """
+    Crée l'index TTL et l'index de lecture par run de la collection `changes`.
+    Si CHANGE_FEED_TTL_DAYS a changé depuis la création de l'index TTL, son
+    expiration est mise à jour (collMod).
+    """
+    load_env()
+    expire_after = int(os.getenv("CHANGE_FEED_TTL_DAYS", "30")) * 86400
+    collection = get_changes_collection()
+    ttl_index = collection.index_information().get("at_1")
+    if ttl_index is None:
+        collection.create_index("at", expireAfterSeconds=expire_after)
+    elif ttl_index.get("expireAfterSeconds") != expire_after:
+        collection.database.command(
+            "collMod",
+            collection.name,
+            index={"keyPattern": {"at": 1}, "expireAfterSeconds": expire_after},
+        )
+    collection.create_index([("run_id", pymongo.ASCENDING), ("seq", pymongo.ASCENDING)])
+
+
+class ChangeFeed:
+    """
+    Journal des changements d'un run, écrit par lots dans MongoDB et dans
+    `<CHANGE_FEED_DIR>/<run_id>.jsonl.gz`.
+
+    Chaque lot est ajouté au fichier comme un membre gzip complet : le
+    fichier reste lisible même si le processus s'arrête avant la fin du run.
+
+    Args:
+        run_id (str): Identifiant du run (généré si absent)
+        part (str): Suffixe du fichier, pour les runs partagés entre plusieurs processus
+        batch_size (int): Nombre de changements écrits par lot
+    """
+
+    def __init__(self, run_id=None, part=None, batch_size=500):
+        self.run_id = run_id or new_run_id()
+        self.batch_size = batch_size
+        self.counts = Counter()
+        name = f"{self.run_id}.{part}" if part else self.run_id
+        self.file_path = os.path.join(get_change_feed_dir(), f"{name}.jsonl.gz")
+        self._part = part
+        self._seq = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._indexed = False
+
+    def record(self, change_type, manga_title, **fields):
+        """Ajoute un changement au journal."""
+        with self._lock:
+            self._seq += 1
+            change = {
+                "run_id": self.run_id,
+                "seq": self._seq,
+                "type": change_type,
+                "at": datetime.now(),
+                "manga_title": manga_title,
+            }
+            if self._part:
+                change["part"] = self._part
+            change.update(fields)
+            self._pending.append(change)
+            self.counts[change_type] += 1
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self._write(batch)
+
+    def manga_added(self, manga_title):
+        self.record(MANGA_ADDED, manga_title)
+
+    def manga_removed(self, manga_title):
+        self.record(MANGA_REMOVED, manga_title)
+
+    def chapter_added(self, manga_title, scan_name, number, page_count):
+        self.record(CHAPTER_ADDED, manga_title, scan_name=scan_name, number=number, page_count=page_count)
+
+    def page_count_changed(self, manga_title, scan_name, number, previous_page_count, page_count):
+        self.record(
+            PAGE_COUNT_CHANGED,
+            manga_title,
+            scan_name=scan_name,
+            number=number,
+            previous_page_count=previous_page_count,
+            page_count=page_count,
+        )
+
+    def flush(self):
+        """Écrit les changements encore en attente."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        with gzip.open(self.file_path, "ab") as f:
+            for change in batch:
+                line = dict(change, at=change["at"].isoformat())
+                f.write((json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        # Une seule tentative par journal : un index en erreur ne bloque pas l'écriture
+        if not self._indexed:
+            self._indexed = True
+            try:
+                ensure_change_indexes()
+            except Exception as e:
+                print(f"Erreur lors de la création des index du journal des changements: {e}")
+        try:
+            get_changes_collection().insert_many(batch, ordered=False)
+        except Exception as e:
+            print(f"Erreur lors de l'écriture du journal des changements: {e}")
+
+    def summary(self):
+        """Résumé lisible des changements du run."""
+        return ", ".join(f"{count} {change_type}" for change_type, count in sorted(self.counts.items())) or "aucun changement"
+
+
+def record_removed_titles(feed, catalogue_titles, max_ratio=None):
+    """
+    Enregistre les mangas présents en base mais absents du catalogue crawlé.
+    À n'appeler qu'après un crawl complet du catalogue.
+
+    Un titre disparu reçoit un `removed_at` et n'est journalisé qu'une fois,
+    au run où il disparaît ; `removed_at` est effacé quand il réapparaît.
+    Si la part des titres présents au run précédent qui manquent au catalogue
+    dépasse `max_ratio` (catalogue tronqué, filtre de types modifié...), rien
+    n'est enregistré.
+
+    Args:
+        feed (ChangeFeed): Journal du run
+        catalogue_titles (iterable): Titres trouvés dans le catalogue
+        max_ratio (float): Part maximale de titres disparus en un run
+            (défaut: REMOVED_TITLES_MAX_RATIO, 0.1)
+
+    Returns:
+        int: Nombre de titres nouvellement disparus
+    """
+    if max_ratio is None:
+        load_env()
+        max_ratio = float(os.getenv("REMOVED_TITLES_MAX_RATIO", "0.1"))
+    catalogue_titles = set(catalogue_titles)
+    collection = get_manga_collection()
+
+    removed = []
+    returned = []
+    nb_present = 0
+    for manga in collection.find({}, {"title": 1, "removed_at": 1}):
+        if manga.get("removed_at") is None:
+            nb_present += 1
+            if manga.get("title") not in catalogue_titles:
+                removed.append(manga)
+        elif manga.get("title") in catalogue_titles:
+            returned.append(manga["_id"])
+
+    if nb_present and len(removed) > max_ratio * nb_present:
+        print(
+            f"Titres disparus ignorés: {len(removed)} des {nb_present} mangas en base absents "
+            f"du catalogue ({len(catalogue_titles)} titres), au-delà de {max_ratio:.0%}"
+        )
+        return 0
+
+    now = datetime.now()
+    if removed:
+        collection.update_many(
+            {"_id": {"$in": [manga["_id"] for manga in removed]}}, {"$set": {"removed_at": now}}
+        )
+    if returned:
+        collection.update_many({"_id": {"$in": returned}}, {"$unset": {"removed_at": ""}})
+    for manga in removed:
+        feed.manga_removed(manga["title"])
+    feed.flush()
+    return len(removed)
+
+
+def iter_changes(since=None, run_id=None):
+    """
+    Itère sur les changements de la collection `changes`, dans l'ordre.
+
+    Args:
+        since (datetime): Ne retourner que les changements postérieurs
+        run_id (str): Ne retourner que les changements d'un run
+
+    Returns:
+        Cursor: Documents changement
+    """
+    query = {}
+    if since is not None:
+        query["at"] = {"$gt": since}
+    if run_id:
+        query["run_id"] = run_id
+    return get_changes_collection().find(query, {"_id": 0}).sort(
+        [("at", pymongo.ASCENDING), ("seq", pymongo.ASCENDING)]
+    )
+
+
+def archive_change_files(older_than_days=30, directory=None):
+    """
+    Regroupe les fichiers de changements plus anciens que `older_than_days`
+    dans des archives 7z mensuelles (changes-AAAAMM.7z), puis les supprime.
+
+    Returns:
+        int: Nombre de fichiers archivés
+    """
+    import py7zr
+
+    directory = directory or get_change_feed_dir()
+    if not os.path.isdir(directory):
+        return 0
+    limit = time.time() - older_than_days * 86400
+
+    by_month = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(".jsonl.gz") and os.path.getmtime(path) < limit:
+            by_month.setdefault(name[:6], []).append(path)
+
+    nb_archived = 0
+    for month, paths in by_month.items():
+        archive_path = os.path.join(directory, f"changes-{month}.7z")
+        mode = "a" if os.path.exists(archive_path) else "w"
+        with py7zr.SevenZipFile(archive_path, mode) as archive:
+            for path in paths:
+                archive.write(path, os.path.basename(path))
+        for path in paths:
+            os.remove(path)
+        nb_archived += len(paths)
+    return nb_archived
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Journal des changements des ingestions")
+    parser.add_argument("--since-hours", type=float, help="Afficher les changements des N dernières heures")
+    parser.add_argument("--run", help="Afficher les changements d'un run")
+    parser.add_argument("--archive", type=int, metavar="JOURS", help="Archiver en 7z les fichiers plus anciens que JOURS jours")
+    args = parser.parse_args()
+
+    if args.archive is not None:
+        print(f"{archive_change_files(args.archive)} fichiers de changements archivés.")
+    else:
+        since = datetime.now() - timedelta(hours=args.since_hours) if args.since_hours else None
+        for change in iter_changes(since, args.run):
+            change["at"] = change["at"].isoformat()
+            print(json.dumps(change, ensure_ascii=False))
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache local des couvertures avec miniatures WebP.
+
+Les couvertures (image_url des mangas, images du planning) sont
+téléchargées en parallèle avec des requêtes conditionnelles
+(ETag / Last-Modified), stockées sous le hash SHA-256 de leur contenu, puis
+redimensionnées en plusieurs tailles WebP dans un pool de processus. Une
+source inchangée (304 ou même hash) n'est ni réécrite ni redimensionnée.
+
+L'état de chaque source est gardé dans la collection `covers` (clé: URL
+source) et les chemins des miniatures sont enregistrés sur les documents
+mangas (`cover_thumbnails`) et planning (`image_thumbnails`).
+"""
+
+import hashlib
+import mimetypes
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime
+
+import pymongo
+import requests
+
+from add_to_db import (
+    get_covers_collection,
+    get_manga_collection,
+    get_planning_collection,
+    load_env,
+)
+from fetcher import DeadlineExceeded, http_request
+
+# User agent header pour éviter les blocages
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# Largeur maximale (pixels) de chaque taille de miniature
+THUMBNAIL_SIZES = {"small": 160, "medium": 320, "large": 640}
+WEBP_QUALITY = 80
+DOWNLOAD_WORKERS = 16
+RESIZE_WORKERS = os.cpu_count() or 2
+
+
+def get_covers_dir():
+    """Dossier racine du cache des couvertures (variable COVERS_DIR)."""
+    load_env()
+    return os.getenv("COVERS_DIR", "covers")
+
+
+def content_path(root, digest, extension):
+    """Chemin adressé par contenu : <root>/ab/abcdef....<extension>."""
+    return os.path.join(root, digest[:2], digest + extension)
+
+
+def make_thumbnails(original_path, digest, covers_dir, sizes=None):
+    """
+    Génère les miniatures WebP d'une couverture (exécuté dans un processus du pool).
+    Les miniatures déjà présentes ne sont pas régénérées.
+
+    Returns:
+        dict: {nom de taille: chemin relatif à covers_dir}
+    """
+    from PIL import Image
+
+    sizes = sizes or THUMBNAIL_SIZES
+    thumbnails = {}
+    image = None
+    try:
+        for name, width in sizes.items():
+            relative = content_path(os.path.join("thumbs", name), digest, ".webp")
+            target = os.path.join(covers_dir, relative)
+            thumbnails[name] = relative
+            if os.path.exists(target):
+                continue
+            if image is None:
+                image = Image.open(original_path)
+                image.load()
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            thumbnail = image.copy()
+            thumbnail.thumbnail((width, width * 4))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temporary = target + ".tmp"
+            thumbnail.save(temporary, "WEBP", quality=WEBP_QUALITY, method=4)
+            os.replace(temporary, target)
+    finally:
+        if image is not None:
+            image.close()
+    return thumbnails
+
+
+def download_cover(source_url, known, covers_dir, session, deadline=None):
+    """
+    Télécharge une couverture avec une requête conditionnelle.
+
+    Args:
+        source_url (str): URL de la couverture
+        known (dict): État précédent de la source (collection covers) ou None
+        covers_dir (str): Dossier racine du cache
+        session (requests.Session): Session HTTP
+        deadline (Deadline): Budget du job (optionnel)
+
+    Returns:
+        dict: État de la source (sha256, etag, last_modified, original, changed)
+    """
+    headers = dict(HEADERS)
+    if known:
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        if known.get("last_modified"):
+            headers["If-Modified-Since"] = known["last_modified"]
+
+    response = http_request("GET", source_url, session, deadline=deadline, headers=headers, timeout=(5, 30))
+    if response.status_code == 304 and known:
+        return dict(known, changed=False)
+    response.raise_for_status()
+
+    content = response.content
+    digest = hashlib.sha256(content).hexdigest()
+    if known and known.get("sha256") == digest and known.get("thumbnails"):
+        # Contenu identique malgré l'absence de 304 : rien à régénérer
+        state = dict(known, changed=False)
+    else:
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        extension = mimetypes.guess_extension(content_type) or os.path.splitext(source_url)[1] or ".img"
+        original = content_path("originals", digest, extension)
+        target = os.path.join(covers_dir, original)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target + ".tmp", "wb") as f:
+                f.write(content)
+            os.replace(target + ".tmp", target)
+        state = {"sha256": digest, "original": original, "changed": True}
+
+    state["etag"] = response.headers.get("ETag")
+    state["last_modified"] = response.headers.get("Last-Modified")
+    return state
+
+
+def cancel_pending(futures):
+    """Annule les tâches pas encore démarrées d'un pool."""
+    for future in futures:
+        future.cancel()
+
+
+def collect_cover_sources():
+    """
+    Rassemble les URLs de couvertures à traiter.
+
+    Returns:
+        set: URLs des couvertures des mangas et du planning
+    """
+    sources = set()
+    for manga in get_manga_collection().find({"image_url": {"$nin": [None, ""]}}, {"image_url": 1}):
+        sources.add(manga["image_url"])
+    for entry in get_planning_collection().find({"image": {"$nin": [None, ""]}}, {"image": 1}):
+        sources.add(entry["image"])
+    return sources
+
+
+def update_covers(sources=None, download_workers=DOWNLOAD_WORKERS, resize_workers=RESIZE_WORKERS, deadline=None):
+    """
+    Met à jour le cache des couvertures et enregistre les miniatures sur
+    les documents mangas et planning.
+
+    Une fois la deadline atteinte (ou le job annulé), les téléchargements et
+    redimensionnements pas encore démarrés sont abandonnés ; les états déjà
+    obtenus sont enregistrés et le reste est traité au prochain run.
+
+    Args:
+        sources (iterable): URLs à traiter (défaut: toutes les couvertures connues)
+        download_workers (int): Téléchargements simultanés
+        resize_workers (int): Processus de redimensionnement
+        deadline (Deadline): Budget du job (optionnel)
+
+    Returns:
+        dict: Compteurs (downloaded, unchanged, resized, failed, deferred)
+    """
+    covers_dir = get_covers_dir()
+    sources = sorted(set(sources) if sources is not None else collect_cover_sources())
+    covers_collection = get_covers_collection()
+    ensure_cover_indexes()
+    known_states = {doc["_id"]: doc for doc in covers_collection.find({"_id": {"$in": sources}})}
+    stats = {"downloaded": 0, "unchanged": 0, "resized": 0, "failed": 0, "deferred": 0}
+    print(f"Mise à jour de {len(sources)} couvertures...")
+
+    states = {}
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=download_workers, pool_maxsize=download_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # Soumission au fil de l'eau (au plus 2 téléchargements en attente par
+    # worker) : plus rien n'est soumis une fois la deadline atteinte
+    pending = iter(sources)
+    with ThreadPoolExecutor(max_workers=download_workers) as downloads:
+        futures = {}
+
+        def submit_next():
+            url = next(pending, None)
+            if url is not None:
+                futures[downloads.submit(download_cover, url, known_states.get(url), covers_dir, session, deadline)] = url
+
+        for _ in range(download_workers * 2):
+            submit_next()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = futures.pop(future)
+                try:
+                    states[url] = future.result()
+                    stats["downloaded" if states[url]["changed"] else "unchanged"] += 1
+                except DeadlineExceeded:
+                    stats["deferred"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"  Échec du téléchargement de {url}: {e}")
+                if deadline is None or not deadline.expired:
+                    submit_next()
+    stats["deferred"] += sum(1 for _ in pending)
+
+    to_resize = {
+        url: state for url, state in states.items()
+        if state["changed"] or not state.get("thumbnails")
+    }
+    # spawn : le job tourne dans un thread du planificateur, un fork copierait
+    # les verrous tenus par les autres threads
+    if deadline is not None and deadline.expired:
+        # Sans miniatures, l'état n'est pas enregistré : la source sera reprise
+        stats["deferred"] += len(to_resize)
+        for url in to_resize:
+            states.pop(url)
+        to_resize = {}
+    with ProcessPoolExecutor(max_workers=resize_workers, mp_context=multiprocessing.get_context("spawn")) as resizers:
+        futures = {
+            resizers.submit(
+                make_thumbnails, os.path.join(covers_dir, state["original"]), state["sha256"], covers_dir
+            ): url
+            for url, state in to_resize.items()
+        }
+        for future in as_completed(futures):
+            url = futures[future]
+            if future.cancelled():
+                stats["deferred"] += 1
+                states.pop(url, None)
+                continue
+            if deadline is not None and deadline.expired:
+                cancel_pending(futures)
+            try:
+                states[url]["thumbnails"] = future.result()
+                stats["resized"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                states.pop(url, None)
+                print(f"  Échec du redimensionnement de {url}: {e}")
+
+    now = datetime.now()
+    operations = []
+    for url, state in states.items():
+        state.pop("changed", None)
+        state.pop("_id", None)
+        state["updated_at"] = now
+        operations.append(pymongo.UpdateOne({"_id": url}, {"$set": state}, upsert=True))
+    if operations:
+        covers_collection.bulk_write(operations, ordered=False)
+
+    record_cover_paths(states, known_states)
+    print(
+        f"Couvertures: {stats['downloaded']} téléchargées, {stats['unchanged']} inchangées, "
+        f"{stats['resized']} redimensionnées, {stats['failed']} en échec, "
+        f"{stats['deferred']} reportées au prochain run"
+    )
+    return stats
+
+
+def ensure_cover_indexes():
+    """Crée les index sur les URLs des couvertures des mangas et du planning."""
+    get_manga_collection().create_index([("image_url", pymongo.ASCENDING)])
+    get_planning_collection().create_index([("image", pymongo.ASCENDING)])
+
+
+def record_cover_paths(states, known_states=None):
+    """
+    Enregistre les chemins des miniatures sur les documents mangas et planning.
+
+    Les sources dont les miniatures ont changé sont réécrites sur tous leurs
+    documents ; pour les autres, seuls les documents qui n'ont pas encore de
+    miniatures (nouveaux mangas, planning recréé) sont mis à jour, par _id.
+
+    Args:
+        states (dict): État de chaque source traitée (URL -> état)
+        known_states (dict): État précédent des sources (collection covers)
+    """
+    known_states = known_states or {}
+    targets = (
+        (get_manga_collection(), "image_url", "cover_thumbnails"),
+        (get_planning_collection(), "image", "image_thumbnails"),
+    )
+    changed = {}
+    unchanged = {}
+    for url, state in states.items():
+        thumbnails = state.get("thumbnails")
+        if not thumbnails:
+            continue
+        if thumbnails != (known_states.get(url) or {}).get("thumbnails"):
+            changed[url] = thumbnails
+        else:
+            unchanged[url] = thumbnails
+
+    for collection, url_field, thumbnails_field in targets:
+        operations = [
+            pymongo.UpdateMany({url_field: url}, {"$set": {thumbnails_field: thumbnails}})
+            for url, thumbnails in changed.items()
+        ]
+        if unchanged:
+            missing = collection.find(
+                {url_field: {"$in": list(unchanged)}, thumbnails_field: {"$exists": False}},
+                {url_field: 1},
+            )
+            operations.extend(
+                pymongo.UpdateOne({"_id": doc["_id"]}, {"$set": {thumbnails_field: unchanged[doc[url_field]]}})
+                for doc in missing
+            )
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+
+
+if __name__ == "__main__":
+    update_covers()
@@ -2,8 +2,12 @@ import os
 import sys
 import json
 import time
+import signal
+import socket
 import logging
+import multiprocessing
 from datetime import datetime
+import threading
 import schedule
 import requests
 
@@ -13,11 +17,35 @@ from main import (
     refine_data, 
     fetch_scan_page_urls,
     get_scan_chapters,
-    remove_old_files
+    remove_old_files,
+    catalogue_slug,
+    AnimeDataWriter,
+    verify_catalogue_filters,
+    REFINED_TYPES,
+)
+from add_to_db import (
+    insert_mangas_to_db,
+    test_connection,
+    insert_planning_to_db,
+    get_manga_collection,
+    get_planning_collection,
+    get_known_scan_types,
+    load_env,
 )
-from add_to_db import insert_mangas_to_db, test_connection, insert_planning_to_db
 from planning import scrape_planning
-from homepage_db import scrape_homepage_to_db
+from homepage_db import scrape_homepage_to_db, get_latest_homepage_data
+from job_lock import JobLease, is_locked
+import work_queue
+from page_manifest import make_manifest_store
+from covers import update_covers
+from change_feed import ChangeFeed, record_removed_titles
+from negative_cache import NegativeCache
+from profiling import enable_profiling, finish_profiling, is_profiling, profile_stage
+from priority_crawl import run_priority_crawl
+from revisit_policy import record_observations, select_due_mangas
+from fetcher import Deadline, DeadlineExceeded, Fetcher, watchdog
+from ingest_writer import IngestWriter
+from stage_graph import DONE, StageGraph
 
 # Configuration du logging
 log_dir = "logs"
@@ -39,175 +67,760 @@ logger = logging.getLogger("anime_sama_scraper")
 ANIME_LIST_HTML_FILE = "anime_list.html"
 ANIME_DATA_JSON_FILE = "anime_data.json"
 
+# Cadences des jobs planifiés (surchargeables dans le .env)
+load_env()
+HOMEPAGE_INTERVAL_MINUTES = int(os.getenv("HOMEPAGE_INTERVAL_MINUTES", "15"))
+PLANNING_INTERVAL_MINUTES = int(os.getenv("PLANNING_INTERVAL_MINUTES", "60"))
+INCREMENTAL_INTERVAL_HOURS = int(os.getenv("INCREMENTAL_INTERVAL_HOURS", "4"))
+COVERS_INTERVAL_HOURS = int(os.getenv("COVERS_INTERVAL_HOURS", "24"))
+FULL_CRAWL_DAY = os.getenv("FULL_CRAWL_DAY", "sunday")
+FULL_CRAWL_TIME = os.getenv("FULL_CRAWL_TIME", "00:00")
+# Crawl par priorité avec budget de temps (désactivé si PRIORITY_CRAWL_TIME est vide)
+PRIORITY_CRAWL_TIME = os.getenv("PRIORITY_CRAWL_TIME", "")
+CRAWL_BUDGET_MINUTES = float(os.getenv("CRAWL_BUDGET_MINUTES", "360"))
+PRIORITY_CRAWL_WORKERS = int(os.getenv("PRIORITY_CRAWL_WORKERS", "4"))
+
+# Durée de réutilisation des requêtes dédupliquées par un worker du crawl distribué
+WORKER_FETCH_TTL_HOURS = 6
+# Fréquence de relecture des titres signalés (homepage, planning) par un worker
+WORKER_SLUGS_REFRESH_MINUTES = 10
+
+# Délais en minutes (0 = pas de limite) : durée maximale d'un job, et budgets
+# des étapes réseau, bornés par celle du job
+RUN_DEADLINE_MINUTES = float(os.getenv("RUN_DEADLINE_MINUTES", "720"))
+CATALOGUE_TIMEOUT_MINUTES = float(os.getenv("CATALOGUE_TIMEOUT_MINUTES", "30"))
+PLANNING_TIMEOUT_MINUTES = float(os.getenv("PLANNING_TIMEOUT_MINUTES", "5"))
+
+# Filtres du catalogue appliqués côté serveur (listes séparées par des virgules,
+# valeurs du formulaire du site ; vide = pas de filtre). Par défaut, les types
+# conservés par refine_data
+CATALOGUE_TYPES = os.getenv("CATALOGUE_TYPES", ",".join(REFINED_TYPES))
+CATALOGUE_LANGUAGES = os.getenv("CATALOGUE_LANGUAGES", "")
+# Pages du catalogue non filtré comparées au crawl filtré (0 = pas de vérification)
+CATALOGUE_VERIFY_PAGES = int(os.getenv("CATALOGUE_VERIFY_PAGES", "2"))
+
+# Noms des jours tels qu'affichés dans le planning d'Anime-Sama
+JOURS_PLANNING = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+
+# Deadline racine du processus, annulée à la réception de SIGTERM
+_shutdown = Deadline(name="processus")
+# Deadline du job en cours, par thread (voir run_job)
+_job_deadline = threading.local()
+
+def _seconds(minutes):
+    """Convertit un délai en minutes (0 = pas de limite) en secondes ou None."""
+    return minutes * 60 if minutes > 0 else None
+
+def current_deadline():
+    """Deadline du job exécuté par ce thread (la deadline du processus hors job)."""
+    return getattr(_job_deadline, "current", None) or _shutdown
+
+def handle_shutdown_signal(signum, frame):
+    """
+    Annule les jobs en cours : les requêtes en vol s'arrêtent, aucun nouveau
+    manga n'est traité et les données déjà écrites sont conservées. Un second
+    signal arrête immédiatement le processus.
+    """
+    name = signal.Signals(signum).name
+    logger.warning(f"{name} reçu: annulation des jobs en cours...")
+    _shutdown.cancel(f"{name} reçu")
+    signal.signal(signum, signal.SIG_DFL)
+
+def get_catalogue_filters():
+    """
+    Filtres du catalogue configurés (CATALOGUE_TYPES, CATALOGUE_LANGUAGES).
+    
+    Returns:
+        dict: Paramètres du formulaire du catalogue (type[], langue[])
+    """
+    filters = {}
+    types = [value.strip() for value in CATALOGUE_TYPES.split(",") if value.strip()]
+    languages = [value.strip() for value in CATALOGUE_LANGUAGES.split(",") if value.strip()]
+    if types:
+        filters["type[]"] = types
+    if languages:
+        filters["langue[]"] = languages
+    return filters
+
+def scrape_catalogue(filters=None, deadline=None):
+    """
+    Récupère et raffine le catalogue d'Anime-Sama (étape 2 du crawl complet,
+    partagée avec le coordinateur du crawl distribué).
+    
+    Le catalogue est filtré côté serveur (voir get_catalogue_filters), puis
+    comparé à un échantillon du catalogue non filtré : si des items manquent,
+    le catalogue complet est reparcouru sans filtre.
+    
+    Args:
+        filters (dict): Filtres du catalogue (défaut: configuration ; {} = aucun filtre)
+        deadline (Deadline): Deadline englobante (défaut: celle du job), bornée
+            ici par CATALOGUE_TIMEOUT_MINUTES
+    
+    Returns:
+        list: Mangas du catalogue, ou None en cas d'échec
+    """
+    if filters is None:
+        filters = get_catalogue_filters()
+    deadline = (deadline or current_deadline()).child(
+        _seconds(CATALOGUE_TIMEOUT_MINUTES), name="catalogue"
+    )
+
+    # Étape 2: Récupérer le catalogue d'Anime-Sama
+    logger.info("Récupération du catalogue d'Anime-Sama...")
+
+    # Etape 2.1: Suppression des anciens fichiers
+    remove_old_files()
+    logger.info("Suppression des anciens fichiers temporaires...")
+
+    # Etape 2.2: Scraping du catalogue HTML
+    if filters:
+        logger.info(f"Filtres du catalogue: {filters}")
+    try:
+        with profile_stage("get_anime_list"):
+            anime_list_html = get_anime_list(filters, deadline=deadline)
+    except DeadlineExceeded as e:
+        logger.error(f"Catalogue interrompu ({e}). Arrêt du processus.")
+        return None
+    if not anime_list_html:
+        logger.error("Échec de la récupération du catalogue. Arrêt du processus.")
+        return None
+
+    # Sauvegarde du HTML brut
+    with open(ANIME_LIST_HTML_FILE, "w", encoding="utf-8") as file:
+        file.write(anime_list_html)
+    logger.info(f"HTML du catalogue sauvegardé dans {ANIME_LIST_HTML_FILE}")
+
+    # Etape 2.3: Raffinage des données (métadonnées des mangas)
+    logger.info("Analyse et filtrage des données du catalogue...")
+    with profile_stage("refine_data"):
+        refined_anime_data_json_string = refine_data(ANIME_LIST_HTML_FILE)
+    if not refined_anime_data_json_string:
+        logger.error("Échec du raffinement des données. Arrêt du processus.")
+        return None
+
+    # Conversion en objet Python
+    try:
+        anime_data_list = json.loads(refined_anime_data_json_string)
+        logger.info(f"Données raffinées avec succès. {len(anime_data_list)} mangas trouvés.")
+
+        # Sauvegarde des données raffinées
+        with open(ANIME_DATA_JSON_FILE, "w", encoding="utf-8") as json_file_out:
+            json.dump(anime_data_list, json_file_out, indent=4, ensure_ascii=False)
+        logger.info(f"Données raffinées sauvegardées dans {ANIME_DATA_JSON_FILE}")
+
+    except json.JSONDecodeError as e:
+        logger.error(f"Erreur lors de la conversion JSON: {e}")
+        return None
+    
+    # Etape 2.4: Vérification du filtrage côté serveur sur un échantillon
+    if filters and CATALOGUE_VERIFY_PAGES > 0:
+        try:
+            missing = verify_catalogue_filters(anime_data_list, CATALOGUE_VERIFY_PAGES, deadline=deadline)
+        except DeadlineExceeded as e:
+            logger.error(f"Vérification des filtres interrompue ({e}).")
+            return None
+        if missing is None:
+            logger.warning("Échantillon du catalogue non filtré indisponible, vérification des filtres ignorée.")
+        elif missing:
+            logger.warning(
+                f"{len(missing)} items du catalogue non filtré absents du crawl filtré "
+                f"(ex: {missing[:3]}). Nouveau parcours sans filtre..."
+            )
+            return scrape_catalogue(filters={})
+        else:
+            logger.info(f"Filtres vérifiés sur {CATALOGUE_VERIFY_PAGES} pages du catalogue non filtré.")
+    
+    return anime_data_list
+
 def scrape_and_update_db():
     """
     Fonction principale qui exécute le processus complet de scraping et de mise à jour de la base de données
     Récupère les métadonnées des mangas ET les informations des chapitres (sans les URLs d'images).
+    
+    Le job est un graphe d'étapes (voir stage_graph.py) : le planning et la
+    homepage ne dépendent pas du catalogue et tournent en parallèle du crawl,
+    et les chapitres d'un manga sont récupérés dès que ses types de scans sont
+    connus.
     """
     start_time = time.time()
     logger.info("==== DÉBUT DU PROCESSUS DE SCRAPING QUOTIDIEN ====")
     
-    try:
+    # Les étapes tournent dans leurs propres threads : la deadline du job leur est transmise
+    deadline = current_deadline()
+    # Requêtes du run dédupliquées par URL canonique (cartes en double du catalogue)
+    # et bornées par la deadline du job
+    fetcher = Fetcher(deadline=deadline)
+    feed = ChangeFeed()
+    
+    def check_db(ctx):
         # Étape 1: Tester la connexion à la base de données
         if not test_connection():
             logger.error("Impossible de se connecter à la base de données MongoDB. Arrêt du processus.")
             return False
-
+        return True
+    
+    def catalogue(ctx):
         # Étape 2: Récupérer le catalogue d'Anime-Sama
-        logger.info("Récupération du catalogue d'Anime-Sama...")
-        
-        # Etape 2.1: Suppression des anciens fichiers
-        remove_old_files()
-        logger.info("Suppression des anciens fichiers temporaires...")
-        
-        # Etape 2.2: Scraping du catalogue HTML
-        anime_list_html = get_anime_list()
-        if not anime_list_html:
-            logger.error("Échec de la récupération du catalogue. Arrêt du processus.")
-            return False
-        
-        # Sauvegarde du HTML brut
-        with open(ANIME_LIST_HTML_FILE, "w", encoding="utf-8") as file:
-            file.write(anime_list_html)
-        logger.info(f"HTML du catalogue sauvegardé dans {ANIME_LIST_HTML_FILE}")
-        
-        # Etape 2.3: Raffinage des données (métadonnées des mangas)
-        logger.info("Analyse et filtrage des données du catalogue...")
-        refined_anime_data_json_string = refine_data(ANIME_LIST_HTML_FILE)
-        if not refined_anime_data_json_string:
-            logger.error("Échec du raffinement des données. Arrêt du processus.")
-            return False
-        
-        # Conversion en objet Python
-        try:
-            anime_data_list = json.loads(refined_anime_data_json_string)
-            logger.info(f"Données raffinées avec succès. {len(anime_data_list)} mangas trouvés.")
-            
-            # Sauvegarde des données raffinées
-            with open(ANIME_DATA_JSON_FILE, "w", encoding="utf-8") as json_file_out:
-                json.dump(anime_data_list, json_file_out, indent=4, ensure_ascii=False)
-            logger.info(f"Données raffinées sauvegardées dans {ANIME_DATA_JSON_FILE}")
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Erreur lors de la conversion JSON: {e}")
+        anime_data_list = scrape_catalogue(deadline=deadline)
+        if anime_data_list is None:
             return False
-        
         logger.info("Processus de scraping des métadonnées terminé avec succès.")
+        return anime_data_list
+    
+    def select(ctx):
+        # Cache des résultats négatifs (sondes 404, pages sans ID de scan),
+        # invalidé pour les titres signalés par la homepage et le planning
+        recently_updated = get_recently_updated_slugs()
+        negative_cache = NegativeCache()
+        negative_cache.mark_dirty(recently_updated)
         
+        # Politique de revisite : les mangas dont la prochaine visite n'est pas
+        # due sont sautés (mais restent dans le catalogue pour les titres disparus)
+        due_mangas, nb_deferred = select_due_mangas(ctx.results["catalogue"], always_slugs=recently_updated)
+        logger.info(f"Politique de revisite: {len(due_mangas)} mangas à visiter, {nb_deferred} reportés.")
+        return {"mangas": due_mangas, "negative_cache": negative_cache, "recently_updated": recently_updated}
+    
+    # URLs des mangas dont la récupération des types de scans a échoué : leur
+    # visite n'est pas enregistrée comme une visite sans changement
+    failed_urls = set()
+    
+    def scan_types(ctx):
         # Étape 3: Récupérer les types de scans pour chaque manga/anime
+        # (chaque manga est transmis à l'étape des chapitres dès qu'il est traité)
         logger.info("Récupération des types de scans disponibles...")
-        anime_data_list = fetch_scan_page_urls(anime_data_list)
+        errors = []
         
-        # Sauvegarde intermédiaire après récupération des types de scans
-        with open(ANIME_DATA_JSON_FILE, "w", encoding="utf-8") as json_file_out:
-            json.dump(anime_data_list, json_file_out, indent=4, ensure_ascii=False)
-        logger.info("Types de scans récupérés et sauvegardés.")
-        
-        # Étape 4: Récupérer les chapitres de chaque scan
-        logger.info("Récupération des chapitres disponibles...")
-        anime_data_list = get_scan_chapters(anime_data_list)
+        def emit(manga):
+            if errors:
+                failed_urls.add(manga.url)
+                errors.clear()
+            ctx.emit(manga)
         
-        # Sauvegarde finale des données complètes
-        with open(ANIME_DATA_JSON_FILE, "w", encoding="utf-8") as json_file_out:
-            json.dump(anime_data_list, json_file_out, indent=4, ensure_ascii=False)
-        logger.info("Chapitres récupérés et sauvegardés.")
+        with profile_stage("fetch_scan_page_urls"):
+            fetch_scan_page_urls(
+                ctx.results["select"]["mangas"],
+                negative_cache=ctx.results["select"]["negative_cache"],
+                fetcher=fetcher,
+                on_manga=emit,
+                errors=errors,
+            )
+        logger.info("Types de scans récupérés.")
+        return True
+    
+    def chapters(ctx):
+        # Étape 4: Récupérer les chapitres de chaque scan et les insérer au fil de l'eau
+        # (thread d'écriture alimenté par une file bornée, voir ingest_writer.py) ;
+        # les mangas ne sont pas gardés en mémoire, le fichier JSON est écrit au fil de l'eau
+        logger.info("Récupération des chapitres disponibles et mise à jour de la base de données MongoDB...")
+        negative_cache = ctx.results["select"]["negative_cache"]
+        errors = []
+        stats = {"mangas": 0, "chapters": 0, "pages": 0}
         
-        # Étape 5: Préparation des données pour insertion en base
-        logger.info("Préparation des données pour insertion en base...")
+        def on_manga(manga):
+            clean = not errors and manga.url not in failed_urls
+            errors.clear()
+            for scan_type in manga.scan_types or []:
+                if scan_type.chapters is not None:
+                    stats["chapters"] += len(scan_type.chapters)
+                    stats["pages"] += scan_type.chapters.total_pages
+            stats["mangas"] += 1
+            json_writer.write(manga)
+            writer.put(manga, observe=clean)
         
-        # Calculer les statistiques avant insertion
-        total_chapters = sum(
-            sum(scan.get('total_chapters', 0) for scan in manga.get('scan_chapters', []))
-            for manga in anime_data_list
-        )
-        total_pages = sum(
-            sum(
-                sum(chapter.get('page_count', 0) for chapter in scan.get('chapters', []))
-                for scan in manga.get('scan_chapters', [])
+        # Manifeste des pages optionnel (PAGE_MANIFEST=mongo|jsonl)
+        with profile_stage("get_scan_chapters"), AnimeDataWriter(ANIME_DATA_JSON_FILE) as json_writer, IngestWriter(
+            feed=feed, after_batch=record_observations, threaded=not is_profiling()
+        ) as writer:
+            get_scan_chapters(
+                ctx.stream("scan_types"),
+                manifest_store=make_manifest_store(),
+                negative_cache=negative_cache,
+                fetcher=fetcher,
+                known_scans=get_known_scan_types(),
+                on_manga=on_manga,
+                errors=errors,
+                discovery_slugs=ctx.results["select"]["recently_updated"],
             )
-            for manga in anime_data_list
-        )
-        
-        logger.info(f"Statistiques des données: {len(anime_data_list)} mangas, {total_chapters} chapitres, {total_pages} pages")
+        nb_mangas_added, nb_chapters_added = writer.totals
+        logger.info(f"Cache négatif: {negative_cache.summary()}")
+        logger.info(f"Requêtes: {fetcher.summary()}")
+        logger.info(f"Écriture au fil du crawl: {writer.summary()}")
+        if fetcher.deadline.expired:
+            # Les mangas déjà écrits sont conservés
+            logger.warning("Crawl interrompu (deadline du job atteinte ou arrêt demandé).")
+            return False
+        logger.info("Chapitres récupérés et sauvegardés.")
         
-        # Étape 6: Insérer ou mettre à jour les données dans MongoDB
-        logger.info("Mise à jour de la base de données MongoDB...")
-        nb_mangas_added, nb_chapters_added = insert_mangas_to_db(anime_data_list)
-        logger.info(f"Base de données mise à jour avec succès:")
+        # Étape 5: Statistiques des données insérées
+        logger.info(
+            f"Statistiques des données: {stats['mangas']} mangas, {stats['chapters']} chapitres, {stats['pages']} pages"
+        )
         logger.info(f"- {nb_mangas_added} nouveaux mangas ajoutés")
         logger.info(f"- {nb_chapters_added} nouveaux chapitres ajoutés")
-        
-        # Etape 7: Scraper le planning et l'insérer dans la base de données
-        logger.info("Scraping du planning des sorties...")
-        planning_data = scrape_planning()
-        if planning_data:
-            logger.info(f"Planning des sorties récupéré avec succès. {len(planning_data)} entrées trouvées.")
-            insert_planning_to_db(planning_data)
-            logger.info("Planning inséré dans la base de données avec succès.")
-        else:
-            logger.warning("Aucune donnée de planning trouvée ou erreur lors du scraping du planning.")
-        
-        # Etape 8: Scraper la homepage et l'insérer dans la base de données
-        logger.info("Scraping de la homepage (derniers scans, classiques, pépites)...")
-        homepage_success = scrape_homepage_to_db()
-        if homepage_success:
-            logger.info("Homepage scrapée et sauvegardée en base de données avec succès.")
-        else:
-            logger.warning("Erreur lors du scraping de la homepage.")
-        
+        return True
+    
+    def removed_titles(ctx):
+        # Étape 6: Titres disparus du catalogue
+        record_removed_titles(feed, [manga.title for manga in ctx.results["catalogue"]])
+        logger.info(f"Journal des changements du run {feed.run_id}: {feed.summary()}")
+        return True
+    
+    graph = StageGraph("full_crawl")
+    graph.add("db", check_db)
+    graph.add("catalogue", catalogue, after=["db"])
+    graph.add("select", select, after=["catalogue"])
+    graph.add("scan_types", scan_types, after=["select"])
+    graph.add("chapters", chapters, streams=["scan_types"])
+    graph.add("removed_titles", removed_titles, after=["chapters"])
+    # Etapes 7 et 8: planning et homepage (jobs verrouillés, partagés avec les
+    # jobs périodiques), indépendants du catalogue
+    graph.add("planning", lambda ctx: run_job("planning"), after=["db"])
+    graph.add("homepage", lambda ctx: run_job("homepage"), after=["db"])
+    # Sous --profile, une étape à la fois : chacune a son propre profil et son pic mémoire
+    graph.run(sequential=is_profiling())
+    logger.info(f"Étapes du crawl complet:\n{graph.summary()}")
+    
+    # Le planning et la homepage ont leurs propres cadences : leur échec ne fait pas échouer le crawl
+    success = graph.stages["removed_titles"].status == DONE
+    if success:
         logger.info("Processus de scraping complet et mise à jour de la base de données terminé avec succès.")
-        
-        
-        # Calculer le temps d'exécution total
-        execution_time = time.time() - start_time
-        logger.info(f"==== FIN DU PROCESSUS DE SCRAPING ({execution_time:.2f} secondes) ====")
-        
+    
+    # Calculer le temps d'exécution total
+    execution_time = time.time() - start_time
+    logger.info(f"==== FIN DU PROCESSUS DE SCRAPING ({execution_time:.2f} secondes) ====")
+    return success
+
+def scrape_planning_job():
+    """
+    Scrape le planning des sorties et l'insère dans la base de données
+    """
+    logger.info("Scraping du planning des sorties...")
+    deadline = current_deadline().child(_seconds(PLANNING_TIMEOUT_MINUTES), name="planning")
+    with profile_stage("planning"):
+        planning_data = scrape_planning(deadline=deadline)
+    if not planning_data:
+        logger.warning("Aucune donnée de planning trouvée ou erreur lors du scraping du planning.")
+        return False
+    
+    logger.info(f"Planning des sorties récupéré avec succès. {len(planning_data)} entrées trouvées.")
+    with profile_stage("insert_planning_to_db"):
+        insert_planning_to_db(planning_data)
+    logger.info("Planning inséré dans la base de données avec succès.")
+    return True
+
+def scrape_homepage_job():
+    """
+    Scrape la homepage (derniers scans, classiques, pépites) et la sauvegarde en base
+    """
+    logger.info("Scraping de la homepage (derniers scans, classiques, pépites)...")
+    with profile_stage("homepage"):
+        homepage_success = scrape_homepage_to_db(deadline=current_deadline())
+    if homepage_success:
+        logger.info("Homepage scrapée et sauvegardée en base de données avec succès.")
+    else:
+        logger.warning("Erreur lors du scraping de la homepage.")
+    return homepage_success
+
+def get_recently_updated_slugs():
+    """
+    Slugs du catalogue des mangas signalés comme récemment mis à jour :
+    "derniers scans ajoutés" de la homepage et planning du jour.
+    
+    Returns:
+        set: Slugs (voir catalogue_slug)
+    """
+    slugs = set()
+    
+    homepage = get_latest_homepage_data()
+    if homepage:
+        items = homepage.get("sections", {}).get("derniers_scans", {}).get("items", [])
+        slugs.update(catalogue_slug(item.get("url")) for item in items)
+    
+    today = JOURS_PLANNING[datetime.now().weekday()]
+    for entry in get_planning_collection().find({"day": today}, {"url": 1}):
+        slugs.add(catalogue_slug(entry.get("url")))
+    
+    slugs.discard(None)
+    return slugs
+
+def get_recently_updated_mangas(slugs=None):
+    """
+    Sélectionne les mangas à rafraîchir lors d'un passage incrémental :
+    ceux présents dans les "derniers scans ajoutés" de la homepage et ceux
+    du planning du jour. Les mangas sont relus depuis la base (avec leurs
+    types de scans) et rapprochés par slug d'URL du catalogue.
+    
+    Returns:
+        list: Documents mangas (sans _id) prêts pour get_scan_chapters
+    """
+    if slugs is None:
+        slugs = get_recently_updated_slugs()
+    if not slugs:
+        return []
+    
+    mangas = []
+    for manga in get_manga_collection().find({"scan_types.0": {"$exists": True}}, {"_id": 0}):
+        if catalogue_slug(manga.get("url")) in slugs:
+            mangas.append(manga)
+    return mangas
+
+def scrape_incremental_chapters_job():
+    """
+    Rafraîchit uniquement les chapitres des mangas récemment mis à jour
+    (homepage et planning du jour), sans reparcourir le catalogue.
+    """
+    slugs = get_recently_updated_slugs()
+    mangas = get_recently_updated_mangas(slugs)
+    if not mangas:
+        logger.info("Aucun manga récemment mis à jour à rafraîchir.")
         return True
     
-    except requests.exceptions.ConnectionError as e:
-        logger.error(f"Erreur de connexion lors du scraping: {e}")
-    except Exception as e:
-        logger.error(f"Erreur inattendue lors du processus de scraping: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+    # Les titres signalés sont de nouveau sondés même s'ils avaient échoué récemment
+    negative_cache = NegativeCache()
+    negative_cache.mark_dirty(slugs)
     
-    return False
+    fetcher = Fetcher(deadline=current_deadline())
+    logger.info(f"Rafraîchissement incrémental des chapitres de {len(mangas)} mangas...")
+    with profile_stage("get_scan_chapters"):
+        mangas = get_scan_chapters(
+            mangas,
+            negative_cache=negative_cache,
+            fetcher=fetcher,
+            known_scans=get_known_scan_types(mangas),
+            discovery_slugs=slugs,
+        )
+    logger.info(f"Requêtes: {fetcher.summary()}")
+    feed = ChangeFeed()
+    with profile_stage("insert_mangas_to_db"):
+        nb_mangas_added, nb_chapters_added = insert_mangas_to_db(mangas, feed=feed)
+    record_observations(mangas)
+    logger.info(f"Rafraîchissement incrémental terminé: {nb_chapters_added} nouveaux chapitres ajoutés.")
+    logger.info(f"Journal des changements du run {feed.run_id}: {feed.summary()}")
+    return True
 
-def run_scheduled_job():
+def scrape_priority_job(budget_minutes=None):
     """
-    Fonction qui sera appelée par le scheduler
-    Inclut gestion des erreurs et retries en cas d'échec
+    Crawl du catalogue par ordre de priorité (homepage, planning du jour,
+    mangas obsolètes, mangas populaires) dans un budget de temps. Les mangas
+    non traités à l'expiration du budget sont repris au run suivant.
     """
-    logger.info("Exécution du job planifié...")
+    budget_minutes = budget_minutes if budget_minutes is not None else CRAWL_BUDGET_MINUTES
+    if not test_connection():
+        logger.error("Impossible de se connecter à la base de données MongoDB. Arrêt du crawl.")
+        return False
+    
+    anime_data_list = scrape_catalogue()
+    if anime_data_list is None:
+        return False
+    
+    today = JOURS_PLANNING[datetime.now().weekday()]
+    planning_slugs = {
+        catalogue_slug(entry.get("url"))
+        for entry in get_planning_collection().find({"day": today}, {"url": 1})
+    }
+    recently_updated = get_recently_updated_slugs()
+    negative_cache = NegativeCache()
+    negative_cache.mark_dirty(recently_updated)
+    feed = ChangeFeed()
+    fetcher = Fetcher(deadline=current_deadline())
     
-    # Tentatives en cas d'échec (max 3 essais)
-    max_retries = 3
-    retry_delay = 300  # 5 minutes
+    anime_data_list, nb_deferred = select_due_mangas(
+        anime_data_list, always_slugs=recently_updated | planning_slugs
+    )
+    logger.info(f"Politique de revisite: {nb_deferred} mangas reportés (prochaine visite non due).")
     
-    for attempt in range(1, max_retries + 1):
+    discovery_slugs = recently_updated | planning_slugs
+    
+    def process(manga):
+        # Lève une exception en cas d'échec : le manga est reporté au run suivant
+        process_single_manga(manga, negative_cache, fetcher, feed, discovery_slugs=discovery_slugs)
+    
+    logger.info(f"Crawl par priorité de {len(anime_data_list)} mangas (budget: {budget_minutes:g} minutes)...")
+    with profile_stage("priority_crawl"):
+        stats = run_priority_crawl(
+            anime_data_list,
+            process,
+            budget_minutes * 60,
+            planning_slugs=planning_slugs,
+            workers=PRIORITY_CRAWL_WORKERS,
+            deadline=fetcher.deadline,
+        )
+    logger.info(
+        f"Crawl par priorité terminé: {stats['processed']} traités, {stats['failed']} en échec, "
+        f"{stats['remaining']} reportés au prochain run"
+        + (" (budget épuisé)" if stats["budget_exhausted"] else "")
+    )
+    logger.info(f"Requêtes: {fetcher.summary()}")
+    logger.info(f"Journal des changements du run {feed.run_id}: {feed.summary()}")
+    return True
+
+def update_covers_job():
+    """
+    Met à jour le cache local des couvertures (miniatures WebP) des mangas et du planning
+    """
+    logger.info("Mise à jour du cache des couvertures...")
+    with profile_stage("covers"):
+        stats = update_covers(deadline=current_deadline())
+    logger.info(f"Cache des couvertures mis à jour: {stats['downloaded']} nouvelles, {stats['failed']} en échec.")
+    return stats["failed"] == 0 or stats["downloaded"] + stats["unchanged"] > 0
+
+# Jobs planifiables : nom du verrou -> fonction
+JOBS = {
+    "homepage": scrape_homepage_job,
+    "planning": scrape_planning_job,
+    "incremental_chapters": scrape_incremental_chapters_job,
+    "full_crawl": scrape_and_update_db,
+    "covers": update_covers_job,
+    "priority_crawl": scrape_priority_job,
+}
+
+# Un job ne démarre pas tant qu'un des jobs listés ici est en cours
+JOB_CONFLICTS = {
+    "incremental_chapters": ["full_crawl", "priority_crawl"],
+    "priority_crawl": ["full_crawl"],
+    "full_crawl": ["priority_crawl"],
+}
+
+def run_job(name, max_retries=1, retry_delay=300):
+    """
+    Exécute un job sous son verrou (bail MongoDB), avec tentatives en cas d'échec.
+    Si le job tourne déjà (dans ce processus, le service ou une exécution
+    manuelle), l'exécution est ignorée. Les tentatives partagent la deadline
+    du job (RUN_DEADLINE_MINUTES) ; une fois celle-ci atteinte ou l'arrêt
+    demandé, le job n'est pas réessayé.
+    
+    Args:
+        name (str): Nom du job (clé de JOBS)
+        max_retries (int): Nombre maximum de tentatives
+        retry_delay (int): Délai entre deux tentatives (secondes)
+    
+    Returns:
+        bool: True si le job s'est exécuté avec succès
+    """
+    if _shutdown.cancelled:
+        logger.info(f"Job '{name}' ignoré: arrêt en cours.")
+        return False
+    
+    with JobLease(name) as lease:
+        if not lease.acquired:
+            logger.info(f"Job '{name}' déjà en cours ailleurs, exécution ignorée.")
+            return False
+        
+        for conflict in JOB_CONFLICTS.get(name, []):
+            if is_locked(conflict):
+                logger.info(f"Job '{name}' ignoré: le job '{conflict}' est en cours.")
+                return False
+        
+        logger.info(f"Exécution du job '{name}'...")
+        # Une seule deadline pour toutes les tentatives (bornée par celle du job englobant)
+        previous_deadline = getattr(_job_deadline, "current", None)
+        deadline = current_deadline().child(_seconds(RUN_DEADLINE_MINUTES), name=f"job {name}")
+        _job_deadline.current = deadline
         try:
-            success = scrape_and_update_db()
-            if success:
-                logger.info("Job terminé avec succès.")
-                return
-            else:
-                logger.warning(f"Échec du job (tentative {attempt}/{max_retries})")
-        except Exception as e:
-            logger.error(f"Erreur lors de l'exécution du job (tentative {attempt}/{max_retries}): {e}")
+            for attempt in range(1, max_retries + 1):
+                nb_stuck = len(watchdog.stuck)
+                try:
+                    if JOBS[name]():
+                        logger.info(f"Job '{name}' terminé avec succès.")
+                        return True
+                    logger.warning(f"Échec du job '{name}' (tentative {attempt}/{max_retries})")
+                except Exception as e:
+                    logger.error(f"Erreur lors de l'exécution du job '{name}' (tentative {attempt}/{max_retries}): {e}")
+                finally:
+                    for stuck in watchdog.stuck[nb_stuck:]:
+                        logger.warning(
+                            f"Requête bloquée pendant le job '{name}': {stuck['url']} ({stuck['seconds']}s, {stuck['thread']})"
+                        )
+                
+                if attempt < max_retries and not deadline.expired:
+                    logger.info(f"Nouvelle tentative dans {retry_delay} secondes...")
+                    _shutdown.wait(retry_delay)
+                # Deadline atteinte ou arrêt demandé : une nouvelle tentative échouerait aussi
+                try:
+                    deadline.check()
+                except DeadlineExceeded as e:
+                    logger.warning(f"Job '{name}' abandonné sans nouvelle tentative: {e}")
+                    return False
+        finally:
+            _job_deadline.current = previous_deadline
         
-        if attempt < max_retries:
-            logger.info(f"Nouvelle tentative dans {retry_delay} secondes...")
-            time.sleep(retry_delay)
+        if max_retries > 1:
+            logger.error(f"Toutes les tentatives ont échoué ({max_retries}). Abandon du job '{name}'.")
+        return False
+
+def run_job_threaded(name, **kwargs):
+    """
+    Lance un job dans un thread pour ne pas bloquer les autres cadences
+    (le crawl complet dure plusieurs heures).
+    """
+    thread = threading.Thread(target=run_job, args=(name,), kwargs=kwargs, name=f"job-{name}", daemon=True)
+    thread.start()
+    return thread
+
+def process_single_manga(manga, negative_cache, fetcher, feed, manifest_store=None, discovery_slugs=()):
+    """
+    Traite un manga (types de scans, chapitres, insertion en base) et lève
+    une exception si une de ses requêtes a échoué, pour qu'il soit réessayé
+    (file de travail) ou reporté au run suivant (crawl par priorité).
+    Pour les titres de `discovery_slugs`, l'ID du scan est relu sur la page
+    de scan (voir get_scan_chapters).
+    
+    Les chapitres récupérés sont insérés même en cas d'échec partiel ; seule
+    l'observation de la politique de revisite attend un passage complet.
     
-    logger.error(f"Toutes les tentatives ont échoué ({max_retries}). Abandon du job.")
+    Raises:
+        RuntimeError: Page ou episodes.js inaccessible, ou deadline atteinte
+    """
+    errors = []
+    mangas = fetch_scan_page_urls(
+        [manga], negative_cache=negative_cache, fetcher=fetcher, errors=errors
+    )
+    mangas = get_scan_chapters(
+        mangas,
+        manifest_store=manifest_store,
+        negative_cache=negative_cache,
+        fetcher=fetcher,
+        known_scans=get_known_scan_types(mangas),
+        errors=errors,
+        discovery_slugs=discovery_slugs,
+    )
+    insert_mangas_to_db(mangas, feed=feed)
+    if fetcher.deadline is not None and fetcher.deadline.expired:
+        raise RuntimeError("deadline atteinte avant la fin du traitement")
+    if errors:
+        url, message = errors[0]
+        raise RuntimeError(f"{len(errors)} requêtes en échec (ex: {url}: {message})")
+    record_observations(mangas)
+    return mangas
+
+# Journal des changements, cache négatif, requêtes et manifeste du processus worker (créés au premier élément traité)
+_worker_feed = None
+_worker_negative_cache = None
+_worker_fetcher = None
+_worker_manifest_store = None
+# Titres signalés par la homepage et le planning, relus périodiquement
+_worker_slugs = set()
+_worker_slugs_at = None
+
+def process_queued_manga(manga):
+    """
+    Traitement d'un élément de la file par un worker : types de scans,
+    chapitres puis insertion en base. Lève une exception en cas d'échec,
+    pour que l'élément soit réessayé (voir work_queue.fail_item).
+    """
+    global _worker_feed, _worker_negative_cache, _worker_fetcher, _worker_manifest_store
+    global _worker_slugs, _worker_slugs_at
+    if _worker_slugs_at is None or time.monotonic() - _worker_slugs_at > WORKER_SLUGS_REFRESH_MINUTES * 60:
+        _worker_slugs = get_recently_updated_slugs()
+        _worker_slugs_at = time.monotonic()
+    if _worker_feed is None:
+        _worker_feed = ChangeFeed(part=work_queue.new_worker_id().replace(":", "-"))
+        _worker_negative_cache = NegativeCache()
+        # Un worker enchaîne les runs : ne pas réutiliser les résultats d'un run précédent
+        _worker_fetcher = Fetcher(ttl=WORKER_FETCH_TTL_HOURS * 3600, deadline=_shutdown)
+        # Un fichier de manifeste JSONL par processus worker (nom stable d'un lancement à l'autre)
+        _worker_manifest_store = make_manifest_store(
+            part=f"{socket.gethostname()}-{multiprocessing.current_process().name}"
+        )
+    process_single_manga(
+        manga,
+        _worker_negative_cache,
+        _worker_fetcher,
+        _worker_feed,
+        manifest_store=_worker_manifest_store,
+        discovery_slugs=_worker_slugs,
+    )
+
+def run_coordinator(wait=True):
+    """
+    Mode coordinateur du crawl distribué : récupère le catalogue et dépose
+    un élément par manga dans la file `crawl_queue`. Si `wait` est vrai,
+    attend que les workers aient vidé la file puis met à jour le planning
+    et la homepage.
+    
+    Returns:
+        str: Identifiant du run, ou None en cas d'échec
+    """
+    if not test_connection():
+        logger.error("Impossible de se connecter à la base de données MongoDB. Arrêt du coordinateur.")
+        return None
+    
+    anime_data_list = scrape_catalogue()
+    if anime_data_list is None:
+        return None
+    
+    # Les workers relisent le cache négatif : invalider d'abord les titres signalés
+    recently_updated = get_recently_updated_slugs()
+    NegativeCache().mark_dirty(recently_updated)
+    
+    due_mangas, nb_deferred = select_due_mangas(anime_data_list, always_slugs=recently_updated)
+    logger.info(f"Politique de revisite: {nb_deferred} mangas reportés (prochaine visite non due).")
+    
+    run_id = work_queue.new_run_id()
+    nb_enqueued = work_queue.enqueue_mangas(due_mangas, run_id)
+    logger.info(f"Run {run_id}: {nb_enqueued} mangas déposés dans la file de travail.")
+    
+    if wait:
+        stats = work_queue.wait_for_run(run_id)
+        logger.info(f"Run {run_id} terminé: {stats}")
+        feed = ChangeFeed(run_id)
+        record_removed_titles(feed, (manga.get("title") for manga in anime_data_list))
+        logger.info(f"Run {run_id}: {feed.summary()}")
+        run_job("planning")
+        run_job("homepage")
+    return run_id
+
+def run_workers(processes=1, run_id=None, idle_exit=True):
+    """
+    Mode worker du crawl distribué : lance `processes` processus locaux qui
+    réclament et traitent les éléments de la file jusqu'à ce qu'elle soit vide
+    (ou indéfiniment si `idle_exit` est faux).
+    """
+    if processes <= 1:
+        return work_queue.run_worker(process_queued_manga, run_id=run_id, idle_exit=idle_exit)
+    
+    workers = [
+        multiprocessing.Process(
+            target=work_queue.run_worker,
+            args=(process_queued_manga,),
+            kwargs={"run_id": run_id, "idle_exit": idle_exit},
+            name=f"worker-{index}",
+        )
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    logger.info(f"{processes} workers terminés.")
+
+def run_scheduled_job():
+    """
+    Fonction qui sera appelée par le scheduler pour le crawl complet
+    Inclut gestion des erreurs et retries en cas d'échec (max 3 essais)
+    """
+    return run_job("full_crawl", max_retries=3)
 
 def setup_schedule():
     """
-    Configure le scheduler pour exécuter le job tous les jours à minuit
+    Configure le scheduler : chaque étape est un job avec sa propre cadence
     """
-    schedule.every().day.at("00:00").do(run_scheduled_job)
-    logger.info("Job planifié tous les jours à minuit (00:00)")
-    logger.info("Le job comprend le scraping complet: mangas, chapitres, pages, planning et homepage (derniers scans, classiques, pépites)")
+    schedule.every(HOMEPAGE_INTERVAL_MINUTES).minutes.do(run_job_threaded, "homepage")
+    schedule.every(PLANNING_INTERVAL_MINUTES).minutes.do(run_job_threaded, "planning")
+    schedule.every(INCREMENTAL_INTERVAL_HOURS).hours.do(run_job_threaded, "incremental_chapters")
+    schedule.every(COVERS_INTERVAL_HOURS).hours.do(run_job_threaded, "covers")
+    getattr(schedule.every(), FULL_CRAWL_DAY).at(FULL_CRAWL_TIME).do(
+        run_job_threaded, "full_crawl", max_retries=3
+    )
+    if PRIORITY_CRAWL_TIME:
+        schedule.every().day.at(PRIORITY_CRAWL_TIME).do(run_job_threaded, "priority_crawl")
+    logger.info(f"Homepage: toutes les {HOMEPAGE_INTERVAL_MINUTES} minutes")
+    logger.info(f"Planning: toutes les {PLANNING_INTERVAL_MINUTES} minutes")
+    logger.info(f"Chapitres (incrémental): toutes les {INCREMENTAL_INTERVAL_HOURS} heures")
+    logger.info(f"Couvertures: toutes les {COVERS_INTERVAL_HOURS} heures")
+    if PRIORITY_CRAWL_TIME:
+        logger.info(f"Crawl par priorité: chaque jour à {PRIORITY_CRAWL_TIME} (budget: {CRAWL_BUDGET_MINUTES:g} minutes)")
+    logger.info(f"Crawl complet (mangas, chapitres, pages, planning, homepage): chaque {FULL_CRAWL_DAY} à {FULL_CRAWL_TIME}")
 
 def run_once():
     """
@@ -224,19 +837,26 @@ def start_scheduler():
     setup_schedule()
     logger.info("Démarrage du scheduler...")
     
-    while True:
+    # Vérifier le scheduler toutes les 30 secondes, jusqu'à SIGTERM
+    while not _shutdown.wait(30):
         schedule.run_pending()
-        time.sleep(60)  # Vérifier le scheduler toutes les minutes
-
-if __name__ == "__main__":
-    import argparse
     
-    parser = argparse.ArgumentParser(description="Script de scraping automatique pour Anime-Sama")
-    parser.add_argument("--now", action="store_true", help="Exécuter le scraping complet immédiatement")
-    parser.add_argument("--schedule", action="store_true", help="Démarrer le scheduler (par défaut)")
-    parser.add_argument("--test-db", action="store_true", help="Tester uniquement la connexion à la base de données")
+    # Laisser les jobs annulés se terminer proprement (libération des verrous)
+    for thread in threading.enumerate():
+        if thread.name.startswith("job-"):
+            thread.join()
+    logger.info("Arrêt du scheduler (SIGTERM)")
+
+def run_cli(args):
+    """
+    Exécute le mode demandé sur la ligne de commande
+    """
+    global CRAWL_BUDGET_MINUTES
+    if args.budget is not None:
+        CRAWL_BUDGET_MINUTES = args.budget
     
-    args = parser.parse_args()
+    # Arrêt propre (systemd, docker stop) : annulation coopérative des jobs
+    signal.signal(signal.SIGTERM, handle_shutdown_signal)
     
     if args.test_db:
         # Test de connexion uniquement
@@ -246,17 +866,52 @@ if __name__ == "__main__":
         else:
             logger.error("Test de connexion échoué !")
             sys.exit(1)
+    elif args.coordinator:
+        sys.exit(0 if run_coordinator(wait=not args.no_wait) else 1)
+    elif args.worker:
+        run_workers(args.processes, run_id=args.run_id, idle_exit=not args.forever)
+    elif args.job:
+        # Exécution immédiate d'un seul job
+        sys.exit(0 if run_job(args.job) else 1)
     elif args.now:
         # Exécution immédiate
         run_once()
     else:
         # Mode scheduler
         try:
-            logger.info("Mode scheduler activé. Le scraping complet sera exécuté quotidiennement à minuit.")
-            # Exécuter une première fois au démarrage
-            run_scheduled_job()
+            logger.info("Mode scheduler activé. Chaque étape est exécutée selon sa propre cadence.")
+            # Exécuter un crawl complet au démarrage, sans bloquer les autres cadences
+            run_job_threaded("full_crawl", max_retries=3)
             # Puis configurer le scheduler
             start_scheduler()
         except KeyboardInterrupt:
             logger.info("Arrêt du scheduler (Ctrl+C)")
             sys.exit(0)
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Script de scraping automatique pour Anime-Sama")
+    parser.add_argument("--now", action="store_true", help="Exécuter le scraping complet immédiatement")
+    parser.add_argument("--schedule", action="store_true", help="Démarrer le scheduler (par défaut)")
+    parser.add_argument("--test-db", action="store_true", help="Tester uniquement la connexion à la base de données")
+    parser.add_argument("--job", choices=sorted(JOBS), help="Exécuter immédiatement un seul job (sous son verrou)")
+    parser.add_argument("--coordinator", action="store_true", help="Crawl distribué: récupérer le catalogue et remplir la file de travail")
+    parser.add_argument("--no-wait", action="store_true", help="Avec --coordinator: ne pas attendre que la file soit vidée")
+    parser.add_argument("--worker", action="store_true", help="Crawl distribué: traiter les éléments de la file de travail")
+    parser.add_argument("--processes", type=int, default=1, help="Avec --worker: nombre de processus workers locaux")
+    parser.add_argument("--run-id", help="Avec --worker: ne traiter que les éléments de ce run")
+    parser.add_argument("--forever", action="store_true", help="Avec --worker: attendre de nouveaux éléments au lieu de quitter")
+    parser.add_argument("--budget", type=float, help="Avec --job priority_crawl: budget de temps en minutes")
+    parser.add_argument("--profile", action="store_true", help="Profiler chaque étape (cProfile + tracemalloc)")
+    parser.add_argument("--profile-dir", help="Avec --profile: dossier des résultats (défaut: profiles/<horodatage>)")
+    
+    args = parser.parse_args()
+    
+    if args.profile:
+        enable_profiling(args.profile_dir)
+    
+    try:
+        run_cli(args)
+    finally:
+        finish_profiling()
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Couche de requêtes HTTP partagée par les étapes du scraping.
+
+Le catalogue liste parfois la même œuvre plusieurs fois (cartes Scans et
+Manhwa distinctes), et les URLs d'une même page ne diffèrent parfois que par
+le slash final ou l'ordre des paramètres. Un Fetcher, créé pour un run :
+
+- canonicalise les URLs (canonical_url) ;
+- fusionne les requêtes identiques ("singleflight") : une requête déjà en
+  cours pour la même URL canonique est attendue au lieu d'être relancée, et
+  le résultat d'une requête terminée est réutilisé jusqu'à la fin du run.
+
+Ce sont les résultats de `parse` (ID de scan, types de scans, chapitres) qui
+sont conservés, pas les réponses HTTP : une page n'est analysée qu'une fois
+par run, et la mémoire utilisée reste faible. Les erreurs sont transmises
+aux requêtes en attente mais ne sont pas conservées.
+
+Délais : toutes les requêtes passent par http_request(), qui borne la durée
+totale d'une requête (REQUEST_TOTAL_SECONDS, corps reçu au goutte-à-goutte
+compris) et respecte une Deadline (budget d'une étape ou d'un run, annulable).
+Un watchdog signale les requêtes qui restent bloquées malgré ces limites
+(résolution DNS, socket figé) et garde leur URL.
+
+Requêtes doublées (HEDGE_REQUESTS=on) : un GET sans réponse après le p95
+glissant de son type d'endpoint (page de scan, episodes.js...) est relancé
+une seconde fois et la première réponse l'emporte ; l'autre est annulée. Les
+doublages sont plafonnés à HEDGE_MAX_FRACTION des requêtes du run.
+"""
+
+import os
+import posixpath
+import queue
+import threading
+import time
+from collections import Counter, deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+import urllib3
+
+# Délais de connexion et de lecture par défaut (secondes)
+DEFAULT_TIMEOUT = (5, 15)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Budget de temps épuisé ou travail annulé."""
+
+
+class Deadline:
+    """
+    Budget de temps d'un run ou d'une étape, annulable.
+
+    Une Deadline enfant (child()) expire au plus tard avec son parent, et
+    l'annulation du parent se propage aux enfants : les requêtes en cours
+    s'arrêtent au prochain bloc reçu, les suivantes ne partent pas.
+
+    Args:
+        seconds (float): Budget (None = illimité, seul le parent compte)
+        parent (Deadline): Deadline englobante (optionnel)
+        name (str): Nom affiché dans les erreurs
+    """
+
+    def __init__(self, seconds=None, parent=None, name="run"):
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self.parent = parent
+        self.name = name
+        self.reason = None
+        self._cancelled = threading.Event()
+
+    def child(self, seconds=None, name=None):
+        """Deadline d'une étape, bornée par celle-ci."""
+        return Deadline(seconds, parent=self, name=name or self.name)
+
+    def cancel(self, reason="annulé"):
+        """Annule ce budget et ceux de ses enfants."""
+        self.reason = reason
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def remaining(self):
+        """Secondes restantes (None si illimité)."""
+        remaining = None
+        if self.expires_at is not None:
+            remaining = self.expires_at - time.monotonic()
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                remaining = parent_remaining if remaining is None else min(remaining, parent_remaining)
+        return remaining
+
+    @property
+    def expired(self):
+        remaining = self.remaining()
+        return self.cancelled or (remaining is not None and remaining <= 0)
+
+    def wait(self, timeout=None):
+        """Attend l'annulation de cette deadline ; retourne True si elle est annulée."""
+        return self._cancelled.wait(timeout) or self.cancelled
+
+    def check(self):
+        """Lève DeadlineExceeded si le budget est épuisé ou annulé."""
+        if self.cancelled:
+            raise DeadlineExceeded(f"{self.name}: {self._reason()}")
+        if self.expired:
+            raise DeadlineExceeded(f"{self.name}: budget de temps épuisé")
+
+    def _reason(self):
+        deadline = self
+        while deadline is not None:
+            if deadline._cancelled.is_set():
+                return deadline.reason
+            deadline = deadline.parent
+        return "annulé"
+
+
+class Watchdog:
+    """
+    Surveille les requêtes en cours et signale celles qui dépassent
+    `stuck_after` secondes (une seule fois par requête).
+
+    Args:
+        stuck_after (float): Durée à partir de laquelle une requête est bloquée
+        interval (float): Intervalle entre deux vérifications
+    """
+
+    def __init__(self, stuck_after=None, interval=10.0):
+        self.stuck_after = stuck_after
+        self.interval = interval
+        self.stuck = []
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._next_token = 0
+
+    def started(self, item_url):
+        with self._lock:
+            self._next_token += 1
+            token = self._next_token
+            self._in_flight[token] = [item_url, time.monotonic(), threading.current_thread().name, False]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="fetch-watchdog", daemon=True)
+                self._thread.start()
+        return token
+
+    def finished(self, token):
+        with self._lock:
+            entry = self._in_flight.pop(token, None)
+        if entry is not None and entry[3]:
+            print(f"[watchdog] Requête débloquée après {time.monotonic() - entry[1]:.0f}s: {entry[0]}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            stuck_after = self.stuck_after or 2 * request_total_seconds()
+            now = time.monotonic()
+            with self._lock:
+                newly_stuck = [
+                    entry for entry in self._in_flight.values()
+                    if not entry[3] and now - entry[1] > stuck_after
+                ]
+                for entry in newly_stuck:
+                    entry[3] = True
+                    self.stuck.append({"url": entry[0], "thread": entry[2], "seconds": round(now - entry[1])})
+            for entry in newly_stuck:
+                print(f"[watchdog] Requête bloquée depuis {now - entry[1]:.0f}s ({entry[2]}): {entry[0]}")
+
+    def summary(self):
+        """Résumé des requêtes bloquées signalées depuis le démarrage du processus."""
+        if not self.stuck:
+            return "aucune requête bloquée"
+        return f"{len(self.stuck)} requêtes bloquées (dernière: {self.stuck[-1]['url']})"
+
+
+# Watchdog partagé par toutes les requêtes du processus
+watchdog = Watchdog()
+
+
+def request_total_seconds():
+    """Durée totale maximale d'une requête (variable REQUEST_TOTAL_SECONDS, 60 par défaut)."""
+    return float(os.getenv("REQUEST_TOTAL_SECONDS", "60"))
+
+
+def _iter_body(response, chunk_size=65536):
+    """
+    Blocs du corps d'une réponse au fur et à mesure de leur arrivée (read1) :
+    un serveur qui envoie goutte à goutte ne retarde pas les vérifications
+    de durée totale et d'annulation.
+    """
+    read1 = getattr(response.raw, "read1", None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size)
+        return
+    # Mêmes exceptions que iter_content
+    try:
+        while True:
+            chunk = read1(chunk_size, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+    except urllib3.exceptions.ReadTimeoutError as e:
+        raise requests.exceptions.ReadTimeout(e)
+    except urllib3.exceptions.ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except urllib3.exceptions.DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e)
+    except urllib3.exceptions.SSLError as e:
+        raise requests.exceptions.SSLError(e)
+
+
+def http_request(method, item_url, session=None, deadline=None, total=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """
+    Requête HTTP bornée : délais de connexion et de lecture, durée totale
+    (corps compris) et Deadline de l'appelant.
+
+    Args:
+        method (str): Méthode HTTP
+        item_url (str): URL
+        session (requests.Session): Session (défaut: requests)
+        deadline (Deadline): Budget de l'étape ou du run (optionnel)
+        total (float): Durée totale maximale (défaut: REQUEST_TOTAL_SECONDS)
+        timeout (float | tuple): Délais de connexion et de lecture
+        **kwargs: Arguments de requests (headers, params...)
+
+    Returns:
+        requests.Response: Réponse dont le corps est déjà lu
+
+    Raises:
+        DeadlineExceeded: Durée totale ou budget dépassé, ou travail annulé
+    """
+    limit = total if total is not None else request_total_seconds()
+    if deadline is not None:
+        deadline.check()
+        remaining = deadline.remaining()
+        if remaining is not None:
+            limit = min(limit, remaining)
+    connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    timeout = (min(connect_timeout or limit, limit), min(read_timeout or limit, limit))
+
+    start = time.monotonic()
+    token = watchdog.started(item_url)
+    try:
+        response = (session or requests).request(method, item_url, stream=True, timeout=timeout, **kwargs)
+        try:
+            chunks = []
+            for chunk in _iter_body(response):
+                chunks.append(chunk)
+                if time.monotonic() - start > limit:
+                    raise DeadlineExceeded(f"Durée totale de {limit:.0f}s dépassée: {item_url}")
+                if deadline is not None and deadline.cancelled:
+                    deadline.check()
+            response._content = b"".join(chunks)
+            # Corps lu en entier : la connexion retourne au pool à la fermeture
+            response._content_consumed = True
+        finally:
+            response.close()
+        return response
+    finally:
+        watchdog.finished(token)
+
+
+def endpoint_type(method, item_url):
+    """
+    Type d'endpoint d'une requête, pour le suivi des latences : les pages de
+    scan et les episodes.js n'ont pas les mêmes temps de réponse que les
+    autres pages.
+
+    Returns:
+        str: Ex. "GET episodes.js", "GET scan", "GET page"
+    """
+    path = urlsplit(item_url).path.lower()
+    if path.endswith("episodes.js"):
+        kind = "episodes.js"
+    elif "/scan" in path:
+        kind = "scan"
+    else:
+        kind = "page"
+    return f"{method} {kind}"
+
+
+class LatencyTracker:
+    """
+    Latences récentes des requêtes réussies, par type d'endpoint.
+
+    Args:
+        window (int): Nombre de latences conservées par type
+        min_samples (int): Latences nécessaires avant de donner un percentile
+    """
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds):
+        with self._lock:
+            self._samples.setdefault(endpoint, deque(maxlen=self._window)).append(seconds)
+
+    def percentile(self, endpoint, q=0.95):
+        """Percentile `q` des latences de `endpoint` (None si trop peu d'échantillons)."""
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[int(q * (len(samples) - 1))]
+
+
+# Extensions des fichiers servis par le site : leurs chemins n'ont pas de slash final
+FILE_EXTENSIONS = {
+    ".js", ".json", ".php", ".html", ".htm", ".xml", ".txt", ".css",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".svg",
+}
+
+
+def canonical_url(item_url):
+    """
+    Forme canonique d'une URL : schéma et hôte en minuscules, slashs
+    dupliqués supprimés, slash final ajouté aux chemins de dossier (tout
+    chemin qui ne se termine pas par une extension de FILE_EXTENSIONS : les
+    slugs peuvent contenir un point, ex. dr.stone), paramètres triés,
+    fragment supprimé.
+
+    Args:
+        item_url (str): URL à canonicaliser
+
+    Returns:
+        str: URL canonique
+    """
+    parts = urlsplit(item_url.strip())
+    path = posixpath.normpath(parts.path) if parts.path else "/"
+    if path == ".":
+        path = "/"
+    if path.startswith("//"):
+        path = "/" + path.lstrip("/")
+    # Les pages du site sont des dossiers : seuls les fichiers (episodes.js) n'ont pas de slash final
+    if not path.endswith("/") and posixpath.splitext(path)[1].lower() not in FILE_EXTENSIONS:
+        path += "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+class _Call:
+    """Requête en cours ou terminée pour une clé."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.completed_at = None
+        self.result = None
+        self.error = None
+
+
+class Fetcher:
+    """
+    Requêtes HTTP d'un run, dédupliquées par URL canonique.
+
+    Args:
+        session (requests.Session): Session HTTP (une nouvelle si absente)
+        ttl (float): Durée de réutilisation d'un résultat terminé, en secondes
+            (défaut: None, toute la durée de vie du Fetcher). À fixer pour les
+            processus qui enchaînent plusieurs runs (workers).
+        deadline (Deadline): Budget du run, appliqué aux requêtes sans deadline propre
+        hedge (bool): Doubler les GET lents (défaut: HEDGE_REQUESTS, désactivé)
+    """
+
+    def __init__(self, session=None, ttl=None, deadline=None, hedge=None):
+        self.session = session or requests.Session()
+        self.ttl = ttl
+        self.deadline = deadline
+        if hedge is None:
+            hedge = os.getenv("HEDGE_REQUESTS", "off").lower() in ("on", "1", "true", "yes")
+        self.hedge = hedge
+        self.hedge_max_fraction = float(os.getenv("HEDGE_MAX_FRACTION", "0.05"))
+        self.latency = LatencyTracker()
+        self.stats = Counter()
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, call, now):
+        return (
+            self.ttl is not None
+            and call.completed_at is not None
+            and now - call.completed_at > self.ttl
+        )
+
+    def _prune(self, now):
+        """Supprime les résultats expirés (appelé sous le verrou)."""
+        for call_key in [key for key, call in self._calls.items() if self._expired(call, now)]:
+            del self._calls[call_key]
+
+    def fetch(self, item_url, parse=None, method="GET", key=None, deadline=None, **kwargs):
+        """
+        Exécute (ou réutilise) la requête `method item_url` et retourne le
+        résultat de `parse(response)` (la réponse elle-même sans `parse`).
+
+        Args:
+            item_url (str): URL demandée
+            parse (callable): Analyse de la réponse, dont le résultat est partagé
+            method (str): Méthode HTTP
+            key (str): Distingue deux analyses différentes d'une même URL
+            deadline (Deadline): Budget de l'appelant (défaut: celui du Fetcher)
+            **kwargs: Arguments de http_request (headers, timeout...)
+
+        Returns:
+            Résultat de `parse`, ou la réponse
+        """
+        deadline = deadline or self.deadline
+        call_key = (method, canonical_url(item_url), key)
+        with self._lock:
+            now = time.monotonic()
+            call = self._calls.get(call_key)
+            owner = call is None or self._expired(call, now)
+            if owner:
+                call = self._calls[call_key] = _Call()
+                self.stats["requests"] += 1
+                if self.ttl is not None and self.stats["requests"] % 1000 == 0:
+                    self._prune(now)
+            elif call.done.is_set():
+                self.stats["reused"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not owner:
+            # Une requête en attente respecte son propre budget
+            remaining = deadline.remaining() if deadline is not None else None
+            if not call.done.wait(timeout=max(0, remaining) if remaining is not None else None):
+                raise DeadlineExceeded(f"Budget épuisé en attendant {item_url}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            response = self._request(method, item_url, deadline, **kwargs)
+            call.result = parse(response) if parse is not None else response
+        except Exception as e:
+            call.error = e
+            self.stats["errors"] += 1
+            with self._lock:
+                self._calls.pop(call_key, None)
+            raise
+        finally:
+            call.completed_at = time.monotonic()
+            call.done.set()
+        return call.result
+
+    def _request(self, method, item_url, deadline, **kwargs):
+        """Envoie la requête, doublée si elle est plus lente que le p95 de son endpoint."""
+        endpoint = endpoint_type(method, item_url)
+        delay = self.latency.percentile(endpoint) if self.hedge and method == "GET" else None
+        if delay is None:
+            start = time.monotonic()
+            response = http_request(method, item_url, self.session, deadline, **kwargs)
+            self.latency.record(endpoint, time.monotonic() - start)
+            return response
+
+        outcomes = queue.Queue()
+        attempts = []
+
+        def attempt(attempt_deadline, hedged):
+            start = time.monotonic()
+            try:
+                response = http_request(method, item_url, self.session, attempt_deadline, **kwargs)
+                outcomes.put((hedged, response, None, time.monotonic() - start))
+            except Exception as e:
+                outcomes.put((hedged, None, e, None))
+
+        def launch(hedged):
+            attempt_deadline = (deadline or Deadline(name="requête")).child(name=item_url)
+            attempts.append(attempt_deadline)
+            threading.Thread(
+                target=attempt, args=(attempt_deadline, hedged), name="fetch-hedge", daemon=True
+            ).start()
+
+        launch(False)
+        try:
+            results = [outcomes.get(timeout=delay)]
+        except queue.Empty:
+            results = []
+            # Les doublages comptent dans les requêtes du run et sont plafonnés
+            with self._lock:
+                allowed = self.stats["hedged"] + 1 <= self.hedge_max_fraction * self.stats["requests"]
+                if allowed:
+                    self.stats["hedged"] += 1
+            if allowed:
+                launch(True)
+
+        # Première réponse réussie, ou toutes les tentatives en échec
+        while not any(error is None for _, _, error, _ in results) and len(results) < len(attempts):
+            results.append(outcomes.get())
+        for attempt_deadline in attempts:
+            attempt_deadline.cancel("réponse déjà reçue")
+
+        for hedged, response, error, seconds in results:
+            if error is None:
+                self.latency.record(endpoint, seconds)
+                if hedged:
+                    with self._lock:
+                        self.stats["hedge_wins"] += 1
+                return response
+        raise results[0][2]
+
+    def get(self, item_url, parse=None, key=None, **kwargs):
+        return self.fetch(item_url, parse, "GET", key, **kwargs)
+
+    def head(self, item_url, parse=None, key=None, **kwargs):
+        kwargs.setdefault("allow_redirects", False)
+        return self.fetch(item_url, parse, "HEAD", key, **kwargs)
+
+    @property
+    def duplicates(self):
+        """Nombre de requêtes évitées (en cours ou déjà terminées)."""
+        return self.stats["coalesced"] + self.stats["reused"]
+
+    def summary(self):
+        """Résumé lisible des requêtes du run (et des compteurs ajoutés par les étapes)."""
+        summary = (
+            f"{self.stats['requests']} requêtes envoyées, {self.duplicates} doublons évités "
+            f"({self.stats['coalesced']} en cours, {self.stats['reused']} déjà terminées), "
+            f"{self.stats['errors']} en erreur"
+        )
+        extra = sorted(
+            (name, count)
+            for name, count in self.stats.items()
+            if name not in ("requests", "coalesced", "reused", "errors")
+        )
+        return summary + "".join(f", {count} {name}" for name, count in extra)
@@ -4,29 +4,32 @@
 Module d'intégration du scraper homepage avec MongoDB
 """
 
-import requests
 import bs4 as bs
 import json
 from urllib.parse import urljoin
 from datetime import datetime
 import os
-import sys
 
-# Import des modules du projet
-try:
-    from add_to_db import get_manga_collection, get_homepage_collection
-except ImportError:
-    print("Erreur : Impossible d'importer add_to_db. Assurez-vous que le module existe.")
-    sys.exit(1)
+from fetcher import http_request
 
-def scrape_homepage_to_db():
+# Import des modules du projet (la connexion MongoDB est ouverte à la demande)
+from add_to_db import (
+    get_manga_collection,
+    get_homepage_collection,
+    notify_cache_invalidation,
+)
+
+def scrape_homepage_to_db(deadline=None):
     """
     Scrape la homepage et sauvegarde directement en base
+
+    Args:
+        deadline (Deadline): Budget du job (optionnel)
     """
     print("=== SCRAPING HOMEPAGE VERS MONGODB ===")
     
     # Récupérer les données de la homepage
-    homepage_data = scrape_homepage_data()
+    homepage_data = scrape_homepage_data(deadline=deadline)
     if not homepage_data:
         print("❌ Impossible de récupérer les données de la homepage")
         return False
@@ -36,6 +39,9 @@ def scrape_homepage_to_db():
         # Récupérer la collection homepage
         homepage_collection = get_homepage_collection()
         
+        # Index utilisé par get_latest_homepage_data() pour trier par date
+        homepage_collection.create_index([("scraped_at", -1)])
+        
         # Supprimer les anciennes données (optionnel)
         print("Suppression des anciennes données homepage...")
         homepage_collection.delete_many({})
@@ -46,6 +52,7 @@ def scrape_homepage_to_db():
         
         if result.inserted_id:
             print(f"✅ Données homepage sauvegardées avec l'ID: {result.inserted_id}")
+            notify_cache_invalidation("homepage")
             return True
         else:
             print("❌ Erreur lors de l'insertion en base")
@@ -55,10 +62,13 @@ def scrape_homepage_to_db():
         print(f"❌ Erreur base de données: {e}")
         return False
 
-def scrape_homepage_data():
+def scrape_homepage_data(deadline=None):
     """
     Fonction principale pour récupérer les données de la homepage
     Retourne les données structurées
+
+    Args:
+        deadline (Deadline): Budget du job (optionnel)
     """
     url = "https://anime-sama.fr"
     
@@ -68,7 +78,7 @@ def scrape_homepage_data():
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
-        response = requests.get(url, headers=headers, timeout=15)
+        response = http_request("GET", url, deadline=deadline, headers=headers, timeout=15)
         response.raise_for_status()
         
         # Parser le HTML
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Écriture en base au fil du crawl.
+
+Au lieu d'attendre la fin de get_scan_chapters pour appeler
+insert_mangas_to_db sur tout le catalogue, chaque manga est déposé dans une
+file bornée dès que ses chapitres sont analysés. Un thread d'écriture vide
+la file par lots et les insère pendant que le scraping continue : le temps
+d'écriture se cache derrière le temps réseau, et un arrêt en fin de crawl
+ne fait perdre que le lot en cours.
+
+La file est bornée (INGEST_QUEUE_SIZE) : si la base ralentit, le scraping
+attend au lieu d'accumuler les mangas en mémoire.
+
+Les index sont vérifiés une seule fois au démarrage du thread et les caches
+de lecture invalidés une seule fois à la fermeture, pas à chaque lot.
+after_batch ne reçoit que les mangas dont le scraping et l'écriture ont
+réussi : un manga en erreur n'est pas compté comme une visite sans changement.
+"""
+
+import os
+import queue
+import threading
+
+from add_to_db import ensure_manga_id_indexes, insert_mangas_to_db, load_env, notify_cache_invalidation
+from profiling import profile_stage
+
+# Marqueur de fin de la file
+_STOP = object()
+
+
+class IngestWriter:
+    """
+    Thread d'écriture alimenté par une file bornée.
+
+    S'utilise comme gestionnaire de contexte ; put() dépose un manga, la
+    sortie du bloc `with` écrit le dernier lot et attend la fin du thread.
+
+    Args:
+        feed (ChangeFeed): Journal des changements du run (optionnel)
+        batch_size (int): Mangas par appel à insert_mangas_to_db (défaut: INGEST_BATCH_SIZE, 25)
+        max_queue (int): Taille de la file (défaut: INGEST_QUEUE_SIZE, 200)
+        flush_seconds (float): Délai après lequel un lot partiel est écrit si aucun manga n'arrive
+        after_batch (callable): Appelé avec les mangas observés et écrits sans
+            erreur de chaque lot (ex. record_observations)
+        threaded (bool): False pour écrire les lots dans le thread appelant
+            (profilage : cProfile ne suit que le thread profilé)
+    """
+
+    def __init__(
+        self, feed=None, batch_size=None, max_queue=None, flush_seconds=10.0, after_batch=None, threaded=True
+    ):
+        load_env()
+        self.feed = feed
+        self.batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", "25"))
+        self.flush_seconds = flush_seconds
+        self.after_batch = after_batch
+        self.queue = queue.Queue(maxsize=max_queue or int(os.getenv("INGEST_QUEUE_SIZE", "200")))
+        self.nb_mangas_added = 0
+        self.nb_chapters_added = 0
+        self.nb_written = 0
+        self.nb_failed = 0
+        self.nb_failed_batches = 0
+        self.threaded = threaded
+        self._batch = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def start(self):
+        if self.threaded:
+            self._thread.start()
+        else:
+            self._ensure_indexes()
+
+    def put(self, manga, observe=True):
+        """
+        Dépose un manga à écrire (bloque si la file est pleine).
+
+        Args:
+            manga: Manga à écrire
+            observe (bool): False si le scraping du manga a échoué ; il est
+                écrit mais pas transmis à after_batch
+        """
+        if not self.threaded:
+            self._batch.append((manga, observe))
+            if len(self._batch) >= self.batch_size:
+                self._write(self._batch)
+                self._batch = []
+            return
+        self.queue.put((manga, observe))
+
+    def close(self):
+        """Écrit les mangas restants et attend la fin du thread d'écriture."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+        elif self._batch:
+            self._write(self._batch)
+            self._batch = []
+        if self.nb_written:
+            notify_cache_invalidation("mangas", "chapters")
+
+    @property
+    def totals(self):
+        """(nb_mangas_added, nb_chapters_added), comme insert_mangas_to_db."""
+        return self.nb_mangas_added, self.nb_chapters_added
+
+    def _ensure_indexes(self):
+        try:
+            ensure_manga_id_indexes()
+        except Exception as e:
+            print(f"Erreur lors de la création des index: {e}")
+
+    def _run(self):
+        self._ensure_indexes()
+        batch = []
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                item = None
+            if item is not None and item is not _STOP:
+                batch.append(item)
+            # Lot plein, fin de la file, ou aucun manga depuis flush_seconds
+            if batch and (item is None or item is _STOP or len(batch) >= self.batch_size):
+                self._write(batch)
+                batch = []
+            if item is _STOP:
+                return
+
+    def _write(self, batch):
+        mangas = [manga for manga, _ in batch]
+        failed = []
+        try:
+            with profile_stage("insert_mangas_to_db", merge=True):
+                nb_mangas_added, nb_chapters_added = insert_mangas_to_db(
+                    mangas,
+                    feed=self.feed,
+                    failed=failed,
+                    ensure_indexes=False,
+                    invalidate_cache=False,
+                )
+            self.nb_mangas_added += nb_mangas_added
+            self.nb_chapters_added += nb_chapters_added
+            self.nb_written += len(batch) - len(failed)
+            self.nb_failed += len(failed)
+            if self.after_batch is not None:
+                failed = set(failed)
+                observed = [manga for manga, observe in batch if observe and manga.url not in failed]
+                if observed:
+                    self.after_batch(observed)
+        except Exception as e:
+            self.nb_failed_batches += 1
+            print(f"Erreur lors de l'écriture d'un lot de {len(batch)} mangas: {e}")
+
+    def summary(self):
+        """Résumé lisible des écritures."""
+        return (
+            f"{self.nb_written} mangas écrits, {self.nb_mangas_added} nouveaux mangas, "
+            f"{self.nb_chapters_added} nouveaux chapitres, {self.nb_failed} mangas en erreur, "
+            f"{self.nb_failed_batches} lots en échec"
+        )
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Verrous (baux) de jobs stockés dans MongoDB.
+
+Un bail est un document de la collection `job_locks` identifié par le nom
+du job, avec un propriétaire et une date d'expiration. Il est renouvelé
+périodiquement tant que le job tourne ; si le processus meurt, le bail
+expire et un autre processus peut le reprendre. Le verrou est partagé
+entre le service planifié et les exécutions manuelles (--now).
+"""
+
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pymongo
+from pymongo.errors import DuplicateKeyError
+
+from add_to_db import get_job_locks_collection
+
+# Durée par défaut d'un bail, renouvelé tous les tiers de cette durée
+DEFAULT_LEASE_SECONDS = 600
+
+
+def make_owner_id():
+    """Identifiant unique du détenteur d'un bail (hôte, pid, jeton)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(name, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Tente de prendre (ou renouveler) le bail `name`.
+
+    Args:
+        name (str): Nom du job
+        owner (str): Identifiant du détenteur
+        lease_seconds (float): Durée du bail
+
+    Returns:
+        bool: True si le bail est détenu par `owner` après l'appel
+    """
+    now = datetime.now()
+    try:
+        get_job_locks_collection().find_one_and_update(
+            {
+                "_id": name,
+                "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}],
+            },
+            {
+                "$set": {
+                    "owner": owner,
+                    "expires_at": now + timedelta(seconds=lease_seconds),
+                    "renewed_at": now,
+                },
+                "$setOnInsert": {"acquired_at": now},
+            },
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        return True
+    except DuplicateKeyError:
+        # Le document existe et appartient à un autre détenteur non expiré
+        return False
+
+
+def release_lease(name, owner):
+    """Libère le bail `name` s'il est détenu par `owner`."""
+    get_job_locks_collection().delete_one({"_id": name, "owner": owner})
+
+
+def is_locked(name):
+    """Indique si le bail `name` est actuellement détenu."""
+    return (
+        get_job_locks_collection().count_documents(
+            {"_id": name, "expires_at": {"$gte": datetime.now()}}, limit=1
+        )
+        > 0
+    )
+
+
+def get_lease(name):
+    """Retourne le document du bail `name` (ou None)."""
+    return get_job_locks_collection().find_one({"_id": name})
+
+
+class JobLease:
+    """
+    Gestionnaire de contexte qui détient un bail pendant l'exécution d'un job.
+
+    Usage:
+        with JobLease("homepage") as lease:
+            if not lease.acquired:
+                return
+            ...
+
+    Args:
+        name (str): Nom du job
+        lease_seconds (float): Durée du bail, renouvelé en tâche de fond
+    """
+
+    def __init__(self, name, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = make_owner_id()
+        self.acquired = False
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                if not acquire_lease(self.name, self.owner, self.lease_seconds):
+                    print(f"Bail '{self.name}' perdu (repris par un autre processus)")
+                    return
+            except Exception as e:
+                print(f"Erreur lors du renouvellement du bail '{self.name}': {e}")
+
+    def __enter__(self):
+        self.acquired = acquire_lease(self.name, self.owner, self.lease_seconds)
+        if self.acquired:
+            self._heartbeat = threading.Thread(
+                target=self._renew_loop, name=f"lease-{self.name}", daemon=True
+            )
+            self._heartbeat.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self.acquired:
+            try:
+                release_lease(self.name, self.owner)
+            except Exception as e:
+                print(f"Erreur lors de la libération du bail '{self.name}': {e}")
+        return False
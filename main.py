@@ -5,9 +5,14 @@ import os
 import re
 from urllib.parse import urljoin
 
+from models import Manga, ScanType, ChapterSet, as_manga, catalogue_slug, chapter_sort_value
+from fetcher import Fetcher, canonical_url, http_request
+
 url = "https://anime-sama.fr"
 catalog = "/catalogue"
 page_param = "?page="  # Renamed to avoid conflict with page content
+# Types du catalogue conservés par refine_data
+REFINED_TYPES = ("Scans", "Manhwa")
 
 def remove_old_files():
     """
@@ -20,11 +25,50 @@ def remove_old_files():
             os.remove(file_name)
             print(f"Removed old file: {file_name}")
 
-def get_anime_list():
+def catalogue_params(filters=None):
+    """
+    Paramètres de requête du catalogue, tels que les soumet le formulaire
+    de recherche du site (ex: {"type[]": ["Scans"], "langue[]": ["VF"]}).
+
+    Returns:
+        list: Paires (paramètre, valeur)
+    """
+    params = []
+    for name, values in (filters or {}).items():
+        if isinstance(values, str):
+            values = [values]
+        params.extend((name, value) for value in values)
+    return params
+
+
+def get_anime_list(filters=None, max_pages=None, deadline=None):
+    """
+    Télécharge les pages du catalogue et retourne le contenu des blocs
+    'list_catalog'.
+
+    Args:
+        filters (dict): Filtres du formulaire du catalogue (voir catalogue_params),
+            appliqués côté serveur. Sans filtre, tout le catalogue est parcouru.
+        max_pages (int): Nombre maximum de pages à télécharger (optionnel)
+        deadline (Deadline): Budget de l'étape (voir fetcher.py). S'il est
+            épuisé, DeadlineExceeded est levée : un catalogue partiel n'est
+            jamais retourné.
+    """
     all_anime_content = []
     current_page = 1
-    while True:
-        response = requests.get(url + catalog + page_param + str(current_page))
+    params = catalogue_params(filters)
+    while max_pages is None or current_page <= max_pages:
+        if params:
+            response = http_request(
+                "GET",
+                url + catalog + "/",
+                deadline=deadline,
+                params=params + [("page", current_page)],
+            )
+        else:
+            response = http_request(
+                "GET", url + catalog + page_param + str(current_page), deadline=deadline
+            )
         if response.status_code == 200:
             soup = bs.BeautifulSoup(response.content, "html.parser")
             anime_list_div = soup.find("div", id="list_catalog")
@@ -55,6 +99,17 @@ def refine_data(html_file_path):
     with open(html_file_path, "r", encoding="utf-8") as file:
         html_content = file.read()
 
+    anime_items = parse_catalogue_items(html_content)
+    return json.dumps(anime_items, indent=4, ensure_ascii=False)
+
+
+def parse_catalogue_items(html_content):
+    """
+    Extrait les items 'Scans' ou 'Manhwa' du HTML du catalogue.
+
+    Returns:
+        list: Dictionnaires (url, image_url, title, alt_title, genres, type, language)
+    """
     soup = bs.BeautifulSoup(html_content, "html.parser")
     anime_items = []
 
@@ -103,10 +158,8 @@ def refine_data(html_file_path):
 
         if data:  # Add data only if some information was extracted
             # Conserver tous les items qui contiennent "Scans" ou "Manhwa" dans leur type
-            if "type" in data and (
-                "Scans" in data["type"]
-                or "Manhwa" in data["type"]
-                or "manhwa" in data["type"].lower()
+            if "type" in data and any(
+                refined_type.lower() in data["type"].lower() for refined_type in REFINED_TYPES
             ):
                 anime_items.append(data)
                 print(
@@ -114,88 +167,143 @@ def refine_data(html_file_path):
                 )
 
     print(f"Total des items 'Scans' ou 'Manhwa' trouvés: {len(anime_items)}")
-    return json.dumps(anime_items, indent=4, ensure_ascii=False)
+    return anime_items
+
+
+def verify_catalogue_filters(filtered_items, sample_pages=2, deadline=None):
+    """
+    Vérifie sur un échantillon que le crawl filtré côté serveur n'a perdu
+    aucun item : les items 'Scans'/'Manhwa' des premières pages du catalogue
+    non filtré doivent tous figurer dans `filtered_items`.
+
+    Args:
+        filtered_items (list): Items issus du crawl filtré
+        sample_pages (int): Nombre de pages non filtrées à comparer
+        deadline (Deadline): Budget de l'étape (optionnel)
+
+    Returns:
+        list: URLs des items absents du crawl filtré (vide si les résultats concordent),
+            ou None si l'échantillon n'a pas pu être téléchargé
+    """
+    sample_html = get_anime_list(max_pages=sample_pages, deadline=deadline)
+    if not sample_html:
+        return None
+    filtered_slugs = {catalogue_slug(item.get("url")) for item in filtered_items}
+    return [
+        item.get("url")
+        for item in parse_catalogue_items(sample_html)
+        if catalogue_slug(item.get("url")) not in filtered_slugs
+    ]
+
+
+# Multiple regex patterns to try, in order
+SCAN_PATTERNS = [
+    r'panneauScan\("([^"]+)",\s*"([^"]+)"\);',  # Standard pattern (without double escapes)
+    r'panneauScan\\\\?"([^"]+)",\\\\?s*"([^"]+)"\\\\?\\);',  # More flexible pattern
+    r'panneauScan\([\'"](.*?)[\'"]\s*,\s*[\'"](.*?)[\'"]',  # Even more flexible
+]
+
+
+def parse_scan_types(html_content, base_url):
+    """
+    Extracts the scan types declared by panneauScan() calls in a catalogue page.
+    base_url: URL of the page, ending with a slash (relative scan URLs are joined to it).
+    Returns a list of {"name", "url"} dictionaries.
+    """
+    # Check for an indication that panneauScan function exists in the HTML
+    if "panneauScan" in html_content:
+        print("  Found 'panneauScan' function reference in HTML")
+    else:
+        print("  No 'panneauScan' function reference found in HTML")
+
+    found_scan_types = []
+    scan_matches = []
+
+    # Try different regex patterns
+    for pattern in SCAN_PATTERNS:
+        scan_matches = re.findall(pattern, html_content)
+        if scan_matches:
+            print(f"  Found matches with pattern: {pattern}")
+            break
+    # Process regex matches if any were found
+    for name, relative_url_path in scan_matches:
+        absolute_url = urljoin(base_url, relative_url_path.strip())
+        found_scan_types.append({"name": name.strip(), "url": absolute_url})
+        print(f"  Found scan type: {name.strip()} - {absolute_url}")
+
+    # Remove the first entry as it's always "name = nom" and "url = url"
+    if len(found_scan_types) > 0:
+        print(f"  Removing first entry: {found_scan_types[0]}")
+        found_scan_types.pop(0)
+        print(f"  Remaining scan types: {len(found_scan_types)}")
 
+    return found_scan_types
 
-def fetch_scan_page_urls(anime_data_list):  # Function name kept for menu consistency
+
+def fetch_scan_page_urls(anime_data_list, negative_cache=None, fetcher=None, on_manga=None, errors=None):  # Function name kept for menu consistency
     """
     Fetches scan types (e.g., Scan VF, Scan Spécial VF) and their URLs
     for items of type 'Scans' from their main catalog page using regex.
-    anime_data_list: A list of dictionaries, where each dictionary is an anime/manga item.
-    Returns a new list with 'scan_types' added to relevant items.
+    anime_data_list: A list of Manga records (or dictionaries, converted on the fly).
+    negative_cache: Optional NegativeCache (see negative_cache.py); fallback URLs
+    that recently returned 404 are not probed again.
+    fetcher: Optional Fetcher shared by the run (see fetcher.py); a page listed
+    by several catalogue cards is fetched and parsed only once. Its deadline
+    (if any) bounds the whole step: once expired or cancelled, the remaining
+    items are left untouched.
+    on_manga: Optional callable, called with each Manga as soon as its scan
+    types are known (streams items to get_scan_chapters, see stage_graph.py).
+    Items are then not kept in memory: the returned list is empty.
+    errors: Optional list; each page that could not be fetched is appended as
+    (url, message), so that callers processing one manga can retry it.
+    Returns the list of Manga records, with 'scan_types' set in place on relevant items.
     """
-    updated_anime_data_list = []
     if not isinstance(anime_data_list, list):
         print("Error: fetch_scan_page_urls expects a list of dictionaries.")
         return anime_data_list
 
-    # Multiple regex patterns to try, in order
-    scan_patterns = [
-        r'panneauScan\("([^"]+)",\s*"([^"]+)"\);',  # Standard pattern (without double escapes)
-        r'panneauScan\\\\?"([^"]+)",\\\\?s*"([^"]+)"\\\\?\\);',  # More flexible pattern
-        r'panneauScan\([\'"](.*?)[\'"]\s*,\s*[\'"](.*?)[\'"]',  # Even more flexible
-    ]
+    fetcher = fetcher or Fetcher()
+
+    items = iter(anime_data_list)
+    mangas = []
+
+    for manga in map(as_manga, items):
+        if on_manga is None:
+            mangas.append(manga)
+        if fetcher.deadline is not None and fetcher.deadline.expired:
+            print("Deadline reached, remaining scan types not fetched.")
+            if on_manga is None:
+                mangas.extend(map(as_manga, items))
+            break
 
-    for anime_item in anime_data_list:
-        current_item_copy = anime_item.copy()
         # Look for "Scans" in type (either exact match or contained in string)
         if (
-            current_item_copy.get("type") == "Scans"
-            or ("type" in current_item_copy and "Scans" in current_item_copy["type"])
-            or (
-                "type" in current_item_copy
-                and "scans" in current_item_copy["type"].lower()
-            )
-        ) and current_item_copy.get("url"):
+            manga.type == "Scans"
+            or (manga.type and "Scans" in manga.type)
+            or (manga.type and "scans" in manga.type.lower())
+        ) and manga.url:
 
-            item_main_page_url = current_item_copy["url"]
+            item_main_page_url = manga.url
             # Ensure the base URL for urljoin ends with a slash if it's a directory-like URL
             if not item_main_page_url.endswith("/"):
                 item_main_page_url_for_join = item_main_page_url + "/"
             else:
                 item_main_page_url_for_join = item_main_page_url
 
-            item_title = current_item_copy.get("title", item_main_page_url)
+            item_title = manga.title or item_main_page_url
             print(
                 f"Processing for scan types: {item_title} (from {item_main_page_url})"
             )
 
-            try:
-                response = requests.get(item_main_page_url, timeout=10)
+            def parse_main_page(response, base_url=item_main_page_url_for_join):
                 response.raise_for_status()
-                html_content = response.text  # Get HTML content for regex
-
-                # Print a snippet of the HTML for debugging
-                content_snippet = html_content[: min(500, len(html_content))]
-                # print(f"  HTML snippet (first 500 chars): {content_snippet}")
-
-                # Check for an indication that panneauScan function exists in the HTML
-                if "panneauScan" in html_content:
-                    print("  Found 'panneauScan' function reference in HTML")
-                else:
-                    print("  No 'panneauScan' function reference found in HTML")
-
-                found_scan_types = []
-
-                # Try different regex patterns
-                for pattern in scan_patterns:
-                    scan_matches = re.findall(pattern, html_content)
-                    if scan_matches:
-                        print(f"  Found matches with pattern: {pattern}")
-                        break
-                # Process regex matches if any were found
-                for name, relative_url_path in scan_matches:
-                    absolute_url = urljoin(
-                        item_main_page_url_for_join, relative_url_path.strip()
-                    )
-                    found_scan_types.append({"name": name.strip(), "url": absolute_url})
-                    print(f"  Found scan type: {name.strip()} - {absolute_url}")
+                return parse_scan_types(response.text, base_url)
 
-                # Remove the first entry as it's always "name = nom" and "url = url"
-                if len(found_scan_types) > 0:
-                    print(f"  Removing first entry: {found_scan_types[0]}")
-                    found_scan_types.pop(0)
-                    print(f"  Remaining scan types: {len(found_scan_types)}")
+            try:
+                # Copy: the parsed result is shared with duplicate catalogue cards
+                found_scan_types = list(
+                    fetcher.get(item_main_page_url, parse_main_page, timeout=10)
+                )
 
                 # Fallback: If no matches were found, try constructing common scan URLs
                 if not found_scan_types:
@@ -206,11 +314,20 @@ def fetch_scan_page_urls(anime_data_list):  # Function name kept for menu consis
                     potential_paths = ["/scan/vf/", "/scan_special/vf/"]
                     for path in potential_paths:
                         potential_url = urljoin(item_main_page_url_for_join, path)
+                        if negative_cache is not None and negative_cache.contains(
+                            "probe_not_found", potential_url
+                        ):
+                            print(f"  Skipping {potential_url} (recently not found)")
+                            continue
 
                         # Make a HEAD request to check if the URL exists
                         try:
-                            head_response = requests.head(potential_url, timeout=5)
-                            if head_response.status_code == 200:
+                            status_code = fetcher.head(
+                                potential_url, lambda response: response.status_code, timeout=5
+                            )
+                            if status_code == 404 and negative_cache is not None:
+                                negative_cache.add("probe_not_found", potential_url)
+                            if status_code == 200:
                                 if path == "/scan/vf/":
                                     name = "Scan VF"
                                 else:
@@ -227,9 +344,9 @@ def fetch_scan_page_urls(anime_data_list):  # Function name kept for menu consis
                             )
 
                 if found_scan_types:
-                    current_item_copy["scan_types"] = (
-                        found_scan_types  # Changed key to scan_types
-                    )
+                    manga.scan_types = [
+                        ScanType(scan["name"], scan["url"]) for scan in found_scan_types
+                    ]
                 else:
                     print(f"  No scan types found for {item_title}.")
 
@@ -237,26 +354,217 @@ def fetch_scan_page_urls(anime_data_list):  # Function name kept for menu consis
                 print(
                     f"  Timeout while fetching page {item_main_page_url} for scan types."
                 )
+                if errors is not None:
+                    errors.append((item_main_page_url, "timeout"))
             except requests.exceptions.RequestException as e:
                 print(f"  Error fetching page {item_main_page_url} for scan types: {e}")
+                if errors is not None:
+                    errors.append((item_main_page_url, str(e)))
             except Exception as e:
                 print(
                     f"  An unexpected error occurred while processing {item_title} for scan types: {e}"
                 )
+                if errors is not None:
+                    errors.append((item_main_page_url, str(e)))
+
+        if on_manga is not None:
+            on_manga(manga)
+
+    return mangas
+
+
+def find_scan_id(html_content):
+    """
+    Cherche l'ID du scan (paramètre filever de episodes.js) dans le HTML
+    d'une page de scan, en essayant plusieurs méthodes.
+
+    Args:
+        html_content (str): HTML de la page de scan
+
+    Returns:
+        str: ID du scan, ou None
+    """
+    soup = bs.BeautifulSoup(html_content, "html.parser")
+
+    # Essayer plusieurs méthodes pour trouver l'ID du scan
+    id_scan = None
+
+    # Method 1: Look for script tags with episodes.js?filever=
+    script_tags = soup.find_all("script")
+    for script in script_tags:
+        if script.get("src") and "episodes.js?filever=" in script.get(
+            "src"
+        ):
+            match = re.search(r"filever=(\d+)", script.get("src"))
+            if match:
+                id_scan = match.group(1)
+                print(f"  Scan ID found (method 1): {id_scan}")
+                break
+
+    # Method 2: Look for script tags containing episodes.js?filever= in their text content
+    if not id_scan:
+        for script in script_tags:
+            if (
+                script.string
+                and "episodes.js?filever=" in script.string
+            ):
+                match = re.search(r"filever=(\d+)", script.string)
+                if match:
+                    id_scan = match.group(1)
+                    print(f"  Scan ID found (method 2): {id_scan}")
+                    break
+
+    # Method 3: Check for inline scripts that might define the scan ID
+    if not id_scan:
+        for script in script_tags:
+            if script.string:
+                match = re.search(
+                    r'(?:scanID|idScan|id_scan|filever)\s*=\s*[\'"]?(\d+)[\'"]?',
+                    script.string,
+                )
+                if match:
+                    id_scan = match.group(1)
+                    print(f"  Scan ID found (method 3): {id_scan}")
+                    break
+
+    # Method 4: Look for script tags with src attribute containing a version number
+    if not id_scan:
+        for script in script_tags:
+            src = script.get("src")
+            if src and re.search(r"\.js\?v=(\d+)", src):
+                match = re.search(r"\.js\?v=(\d+)", src)
+                if match:
+                    id_scan = match.group(1)
+                    print(f"  Scan ID found (method 4): {id_scan}")
+                    break
+
+    # Method 5: Look for any HTML element with data-id attribute
+    if not id_scan:
+        elements_with_data_id = soup.find_all(
+            attrs={"data-id": re.compile(r"\d+")}
+        )
+        if elements_with_data_id:
+            id_scan = elements_with_data_id[0].get("data-id")
+            print(f"  Scan ID found (method 5): {id_scan}")
+
+    # If all else fails, extract the raw HTML and search for common patterns
+    if not id_scan:
+        patterns = [
+            r"episodes\.js\?filever=(\d+)",
+            r"episodes\.js\?v=(\d+)",
+            r'scan_id\s*=\s*[\'"]?(\d+)[\'"]?',
+            r'id_scan\s*=\s*[\'"]?(\d+)[\'"]?',
+            r'scanID\s*=\s*[\'"]?(\d+)[\'"]?',
+            r'data-id=[\'"](\d+)[\'"]',
+            r"scan/(\d+)/",
+        ]
 
-        updated_anime_data_list.append(current_item_copy)
+        for pattern in patterns:
+            match = re.search(pattern, html_content)
+            if match:
+                id_scan = match.group(1)
+                print(f"  Scan ID found (general pattern): {id_scan}")
+                break
 
-    return updated_anime_data_list
+    return id_scan
+
+
+def raise_for_transient_status(response):
+    """
+    Lève HTTPError pour les erreurs temporaires (429, 5xx) : le Fetcher ne
+    conserve pas les erreurs, la page sera donc redemandée au prochain essai.
+    """
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()
 
 
-def get_scan_chapters(anime_data_list):
+def parse_scan_page(response):
+    """Code HTTP et ID du scan d'une réponse de page de scan."""
+    raise_for_transient_status(response)
+    if response.status_code != 200:
+        return {"status_code": response.status_code, "id_scan": None}
+    return {"status_code": 200, "id_scan": find_scan_id(response.text)}
+
+
+def build_episodes_url(scan_url, id_scan=None):
+    """
+    Construit l'URL du fichier episodes.js d'une page de scan.
+
+    Args:
+        scan_url (str): URL de la page de scan (.../catalogue/<titre>/scan/vf/)
+        id_scan (str): Paramètre filever (omis si None)
+
+    Returns:
+        str: URL de episodes.js, ou None si l'URL du scan est invalide
+    """
+    scan_url_parts = scan_url.rstrip("/").split("/catalogue/")
+    if len(scan_url_parts) != 2:
+        return None
+    episodes_url = f"{url}/catalogue/{scan_url_parts[1]}/episodes.js"
+    if id_scan:
+        episodes_url += f"?filever={id_scan}"
+    return episodes_url
+
+
+def looks_like_episodes_js(raw_content):
+    """Vérifie qu'une réponse ressemble à un episodes.js (et pas à une page HTML d'erreur)."""
+    return not raw_content.lstrip().startswith("<") and re.search(r"eps\d+", raw_content) is not None
+
+
+def get_scan_chapters(
+    anime_data_list,
+    manifest_store=None,
+    negative_cache=None,
+    fetcher=None,
+    known_scans=None,
+    on_manga=None,
+    errors=None,
+    discovery_slugs=(),
+):
     """
     Pour chaque entrée avec 'scan_types', récupère les chapitres disponibles
-    en utilisant les méthodes de l'API (trouver l'ID du scan, puis analyser episodes.js)
+    en utilisant les méthodes de l'API (trouver l'ID du scan, puis analyser episodes.js).
+    Les chapitres sont ajoutés sur place aux ScanType de chaque Manga.
+
+    `anime_data_list` peut être un itérable consommé au fil de l'eau (mangas
+    émis par fetch_scan_page_urls pendant qu'elle tourne, voir stage_graph.py).
+
+    Chemin rapide (désactivé par EPISODES_FAST_PATH=off) : pour un scan dont
+    l'ID a été lu sur sa page lors d'un des EPISODES_DISCOVERY_RUNS derniers
+    runs (voir `known_scans`), episodes.js est demandé directement avec cet
+    ID, qui est conservé. La page de scan est téléchargée (et l'ID du scan
+    relu) pour les titres de `discovery_slugs` (signalés par la homepage ou
+    le planning), pour les scans découverts depuis trop de runs, et si la
+    réponse n'est pas un episodes.js valide ou contient moins de chapitres
+    que lors du run précédent.
+
+    Si `manifest_store` est fourni (voir page_manifest.py), les listes d'URLs
+    des pages de chaque chapitre y sont enregistrées au fil du parsing.
+
+    Si `negative_cache` est fourni (voir negative_cache.py), les pages de scan
+    sans ID de scan lors d'un passage récent ne sont pas retéléchargées.
+
+    Si `fetcher` est fourni (voir fetcher.py), une page de scan ou un
+    episodes.js déjà demandé pendant le run n'est ni retéléchargé ni réanalysé.
+    Quand sa deadline est épuisée ou annulée, les mangas restants ne sont pas
+    traités (ni transmis à `on_manga`).
+
+    `known_scans` associe l'URL canonique d'une page de scan à son état du
+    run précédent (id_scan, chapters_count), voir get_known_scan_types().
+
+    Si `on_manga` est fourni, il est appelé avec chaque Manga dès que ses
+    chapitres sont récupérés (écriture en base au fil du crawl, voir
+    ingest_writer.py) ; les mangas ne sont alors pas gardés en mémoire et la
+    liste retournée est vide.
+
+    Si `errors` est fourni (liste), chaque type de scan dont les chapitres
+    n'ont pas pu être récupérés (erreur de requête, page inaccessible,
+    episodes.js sans chapitre) y est ajouté sous la forme (URL, message).
+    Les pages sans ID de scan et celles sautées par le cache négatif ne sont
+    pas des erreurs.
     """
-    updated_anime_data_list = []
-    if not isinstance(anime_data_list, list):
-        print("Error: get_scan_chapters expects a list of dictionaries.")
+    if isinstance(anime_data_list, (str, dict)) or not hasattr(anime_data_list, "__iter__"):
+        print("Error: get_scan_chapters expects a list (or an iterable) of dictionaries.")
         return anime_data_list
 
     # User agent header pour éviter les blocages
@@ -264,198 +572,231 @@ def get_scan_chapters(anime_data_list):
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
 
-    for anime_item in anime_data_list:
-        current_item_copy = anime_item.copy()
+    fetcher = fetcher or Fetcher()
+    known_scans = known_scans or {}
+    discovery_slugs = set(discovery_slugs)
+    fast_path = os.getenv("EPISODES_FAST_PATH", "on").lower() not in ("off", "0", "false", "no")
+    discovery_runs = int(os.getenv("EPISODES_DISCOVERY_RUNS", "7"))
+    items = iter(anime_data_list)
+    mangas = []
+
+    for manga in map(as_manga, items):
+        if on_manga is None:
+            mangas.append(manga)
+        if fetcher.deadline is not None and fetcher.deadline.expired:
+            print("Deadline atteinte, chapitres des mangas restants non récupérés.")
+            if on_manga is None:
+                mangas.extend(map(as_manga, items))
+            break
 
         # Vérifier si l'élément a des 'scan_types'
-        if current_item_copy.get("scan_types") and isinstance(
-            current_item_copy["scan_types"], list
-        ):
-            scan_chapters_data = []
-
-            for scan_type in current_item_copy["scan_types"]:
-                scan_url = scan_type.get("url", "")
-                scan_name = scan_type.get("name", "Scan")
+        if manga.scan_types:
+            for scan_type in manga.scan_types:
+                scan_url = scan_type.url or ""
+                scan_name = scan_type.name or "Scan"
 
                 if not scan_url:
                     continue
 
-                print(f"Processing chapters for: {scan_name} at {scan_url}")
+                if negative_cache is not None and negative_cache.contains("no_scan_id", scan_url):
+                    print(f"Skipping {scan_name} at {scan_url} (no scan ID on a recent pass)")
+                    continue
 
-                try:
-                    # Faire la requête pour trouver l'ID du scan
-                    response = requests.get(scan_url, headers=headers, timeout=15)
+                print(f"Processing chapters for: {scan_name} at {scan_url}")
 
-                    if response.status_code != 200:
-                        print(
-                            f"  Failed to access page, status code: {response.status_code}"
-                        )
-                        continue
+                manga_title = manga.title or "Unknown"
 
-                    # Analyser la réponse pour trouver l'ID du scan
-                    soup = bs.BeautifulSoup(response.text, "html.parser")
-                    html_content = response.text
+                def fetch_episodes(episodes_url):
+                    """Retourne (résultat du parsing, pages des chapitres pour le manifeste)."""
+                    print(f"  Fetching episodes from: {episodes_url}")
 
-                    # Essayer plusieurs méthodes pour trouver l'ID du scan
-                    id_scan = None
+                    # Les pages ne sont enregistrées dans le manifeste qu'une fois
+                    # le résultat accepté (un chemin rapide rejeté n'y écrit rien)
+                    page_urls = []
+                    page_urls_sink = None
+                    if manifest_store is not None:
 
-                    # Method 1: Look for script tags with episodes.js?filever=
-                    script_tags = soup.find_all("script")
-                    for script in script_tags:
-                        if script.get("src") and "episodes.js?filever=" in script.get(
-                            "src"
-                        ):
-                            match = re.search(r"filever=(\d+)", script.get("src"))
-                            if match:
-                                id_scan = match.group(1)
-                                print(f"  Scan ID found (method 1): {id_scan}")
-                                break
-
-                    # Method 2: Look for script tags containing episodes.js?filever= in their text content
-                    if not id_scan:
-                        for script in script_tags:
-                            if (
-                                script.string
-                                and "episodes.js?filever=" in script.string
-                            ):
-                                match = re.search(r"filever=(\d+)", script.string)
-                                if match:
-                                    id_scan = match.group(1)
-                                    print(f"  Scan ID found (method 2): {id_scan}")
-                                    break
-
-                    # Method 3: Check for inline scripts that might define the scan ID
-                    if not id_scan:
-                        for script in script_tags:
-                            if script.string:
-                                match = re.search(
-                                    r'(?:scanID|idScan|id_scan|filever)\s*=\s*[\'"]?(\d+)[\'"]?',
-                                    script.string,
-                                )
-                                if match:
-                                    id_scan = match.group(1)
-                                    print(f"  Scan ID found (method 3): {id_scan}")
-                                    break
-
-                    # Method 4: Look for script tags with src attribute containing a version number
-                    if not id_scan:
-                        for script in script_tags:
-                            src = script.get("src")
-                            if src and re.search(r"\.js\?v=(\d+)", src):
-                                match = re.search(r"\.js\?v=(\d+)", src)
-                                if match:
-                                    id_scan = match.group(1)
-                                    print(f"  Scan ID found (method 4): {id_scan}")
-                                    break
-
-                    # Method 5: Look for any HTML element with data-id attribute
-                    if not id_scan:
-                        elements_with_data_id = soup.find_all(
-                            attrs={"data-id": re.compile(r"\d+")}
-                        )
-                        if elements_with_data_id:
-                            id_scan = elements_with_data_id[0].get("data-id")
-                            print(f"  Scan ID found (method 5): {id_scan}")
-
-                    # If all else fails, extract the raw HTML and search for common patterns
-                    if not id_scan:
-                        patterns = [
-                            r"episodes\.js\?filever=(\d+)",
-                            r"episodes\.js\?v=(\d+)",
-                            r'scan_id\s*=\s*[\'"]?(\d+)[\'"]?',
-                            r'id_scan\s*=\s*[\'"]?(\d+)[\'"]?',
-                            r'scanID\s*=\s*[\'"]?(\d+)[\'"]?',
-                            r'data-id=[\'"](\d+)[\'"]',
-                            r"scan/(\d+)/",
-                        ]
-
-                        for pattern in patterns:
-                            match = re.search(pattern, html_content)
-                            if match:
-                                id_scan = match.group(1)
-                                print(f"  Scan ID found (general pattern): {id_scan}")
-                                break
-
-                    # Si aucun ID n'a été trouvé, passer au scan suivant
-                    if not id_scan:
-                        print(f"  No scan ID found for {scan_url}")
-                        continue
-
-                    # Construire l'URL du fichier episodes.js
-                    # Extraire le nom et le chemin de l'URL du scan
-                    scan_url_parts = scan_url.rstrip("/").split("/catalogue/")
-                    if len(scan_url_parts) != 2:
-                        print(f"  Invalid scan URL format: {scan_url}")
-                        continue
-
-                    scan_path = scan_url_parts[1]
-                    episodes_url = (
-                        f"{url}/catalogue/{scan_path}/episodes.js?filever={id_scan}"
-                    )
+                        def page_urls_sink(number, urls):
+                            page_urls.append((number, urls))
 
-                    print(f"  Fetching episodes from: {episodes_url}")
+                    def parse_episodes(response):
+                        raise_for_transient_status(response)
+                        if response.status_code != 200:
+                            print(
+                                f"  Failed to access episodes.js, status code: {response.status_code}"
+                            )
+                            return None
+                        if not looks_like_episodes_js(response.text):
+                            print("  Response does not look like an episodes.js file")
+                            return None
+                        return parse_episodes_js(response.text, manga_title, page_urls_sink)
 
                     # Faire la requête pour récupérer le script episodes.js
-                    episodes_response = requests.get(
-                        episodes_url, headers=headers, timeout=15
-                    )
+                    result = fetcher.get(episodes_url, parse_episodes, headers=headers, timeout=15)
+                    return result, page_urls
 
-                    if episodes_response.status_code != 200:
-                        print(
-                            f"  Failed to access episodes.js, status code: {episodes_response.status_code}"
+                try:
+                    chapters_result = None
+                    page_urls = []
+                    known = known_scans.get(canonical_url(scan_url)) or {}
+                    runs_since_discovery = known.get("runs_since_discovery")
+
+                    if (
+                        fast_path
+                        and known.get("id_scan")
+                        and runs_since_discovery is not None
+                        and runs_since_discovery + 1 < discovery_runs
+                        and catalogue_slug(manga.url) not in discovery_slugs
+                    ):
+                        id_scan = known["id_scan"]
+                        runs_since_discovery += 1
+                        known_count = (
+                            known.get("chapters_count")
+                            or (scan_type.extra or {}).get("chapters_count")
+                            or 0
                         )
-                        continue
+                        episodes_url = build_episodes_url(scan_url, id_scan)
+                        if episodes_url:
+                            try:
+                                chapters_result, page_urls = fetch_episodes(episodes_url)
+                            except requests.exceptions.RequestException as e:
+                                print(f"  Direct episodes.js request failed: {e}")
+                            found = len(chapters_result.get("chapters") or []) if chapters_result else 0
+                            if found and found >= known_count:
+                                fetcher.stats["episodes_fast_path"] += 1
+                            else:
+                                print(
+                                    f"  Direct episodes.js suspicious ({found} chapters, {known_count} known), "
+                                    "falling back to scan page"
+                                )
+                                fetcher.stats["episodes_fallback"] += 1
+                                chapters_result = None
 
-                    # Récupérer le contenu brut
-                    raw_content = episodes_response.text
-                    
-                    # Analyser le contenu JavaScript pour extraire les données des chapitres
-                    manga_title = current_item_copy.get("title", "Unknown")
-                    chapters_result = parse_episodes_js(raw_content, manga_title)
+                    if chapters_result is None:
+                        # Faire la requête pour trouver l'ID du scan
+                        scan_page = fetcher.get(
+                            scan_url, parse_scan_page, headers=headers, timeout=15
+                        )
+
+                        if scan_page["status_code"] != 200:
+                            print(
+                                f"  Failed to access page, status code: {scan_page['status_code']}"
+                            )
+                            if errors is not None:
+                                errors.append((scan_url, f"status code {scan_page['status_code']}"))
+                            continue
+
+                        id_scan = scan_page["id_scan"]
+
+                        # Si aucun ID n'a été trouvé, passer au scan suivant
+                        if not id_scan:
+                            print(f"  No scan ID found for {scan_url}")
+                            if negative_cache is not None:
+                                negative_cache.add("no_scan_id", scan_url)
+                            continue
+
+                        # Construire l'URL du fichier episodes.js
+                        episodes_url = build_episodes_url(scan_url, id_scan)
+                        if not episodes_url:
+                            print(f"  Invalid scan URL format: {scan_url}")
+                            if errors is not None:
+                                errors.append((scan_url, "invalid scan URL format"))
+                            continue
+
+                        runs_since_discovery = 0
+                        chapters_result, page_urls = fetch_episodes(episodes_url)
 
                     if chapters_result and chapters_result.get("chapters"):
-                        chapters_data = chapters_result["chapters"]
-                        total_chapters = chapters_result["total_chapters"]
-
-                        # Ajouter les informations récupérées
-                        scan_chapters_info = {
-                            "name": scan_name,
-                            "url": scan_url,
-                            "id_scan": id_scan,
-                            "episodes_url": episodes_url,
-                            "total_chapters": total_chapters,
-                            "chapters": chapters_data,
-                        }
-                        scan_chapters_data.append(scan_chapters_info)
+                        if manifest_store is not None:
+                            sink = manifest_store.sink(manga_title, scan_name, episodes_url)
+                            for number, urls in page_urls:
+                                sink(number, urls)
+
+                        # Ajouter les informations récupérées (tableaux compacts)
+                        scan_type.id_scan = id_scan
+                        scan_type.episodes_url = episodes_url
+                        scan_type.extra = dict(
+                            scan_type.extra or {}, runs_since_discovery=runs_since_discovery
+                        )
+                        scan_type.chapters = ChapterSet.from_list(chapters_result["chapters"])
+                        total_chapters = len(scan_type.chapters)
                         print(f"  Added {total_chapters} chapters for {scan_name}")
 
                         # Afficher un résumé des pages par chapitre
-                        total_pages = sum(
-                            chapter.get("page_count", 0) for chapter in chapters_data
-                        )
+                        total_pages = scan_type.chapters.total_pages
                         if total_pages > 0:
                             print(f"  Total pages across all chapters: {total_pages}")
                     else:
                         print(f"  No chapters found in episodes.js for {scan_name}")
+                        if errors is not None:
+                            errors.append((scan_url, "no chapters found in episodes.js"))
 
                 except requests.exceptions.Timeout:
                     print(f"  Timeout while retrieving data for {scan_name}")
+                    if errors is not None:
+                        errors.append((scan_url, "timeout"))
                 except requests.exceptions.RequestException as e:
                     print(f"  Request error while retrieving data for {scan_name}: {e}")
+                    if errors is not None:
+                        errors.append((scan_url, str(e)))
                 except Exception as e:
                     print(
                         f"  An unexpected error occurred while processing {scan_name}: {e}"
-                    )  # Si nous avons trouvé des données de chapitres, les ajouter à l'élément
-            if scan_chapters_data:
-                current_item_copy["scan_chapters"] = scan_chapters_data
+                    )
+                    if errors is not None:
+                        errors.append((scan_url, str(e)))
+
+        if on_manga is not None:
+            on_manga(manga)
+
+    if manifest_store is not None:
+        manifest_store.flush()
+
+    return mangas
+
+
+class AnimeDataWriter:
+    """
+    Écriture incrémentale d'un fichier au format de save_anime_data : les
+    mangas sont écrits un par un (au fil du crawl) puis le tableau JSON est
+    fermé à la sortie du bloc `with`.
+    """
+
+    def __init__(self, json_file_path):
+        self.json_file_path = json_file_path
+        self.count = 0
+        self._file = None
 
-        updated_anime_data_list.append(current_item_copy)
+    def __enter__(self):
+        self._file = open(self.json_file_path, "w", encoding="utf-8")
+        self._file.write("[")
+        return self
 
-    return updated_anime_data_list
+    def write(self, item):
+        """Ajoute un Manga (ou un dictionnaire) au fichier."""
+        data = item.to_dict() if isinstance(item, Manga) else item
+        self._file.write(",\n    " if self.count else "\n    ")
+        self._file.write(json.dumps(data, indent=4, ensure_ascii=False).replace("\n", "\n    "))
+        self.count += 1
 
+    def __exit__(self, exc_type, exc, tb):
+        self._file.write("\n]" if self.count else "]")
+        self._file.close()
+        return False
 
 
-def parse_episodes_js(raw_content, manga_title="Unknown"):
+def save_anime_data(anime_data_list, json_file_path):
+    """
+    Sauvegarde une liste de Manga (ou de dictionnaires) au format JSON,
+    manga par manga pour ne pas matérialiser une copie complète en mémoire.
+    """
+    with AnimeDataWriter(json_file_path) as writer:
+        for item in anime_data_list:
+            writer.write(item)
+
+
+
+def parse_episodes_js(raw_content, manga_title="Unknown", page_urls_sink=None):
     """
     Analyser le contenu JavaScript du fichier episodes.js pour extraire les données des chapitres.
     Le format peut être:
@@ -463,6 +804,12 @@ def parse_episodes_js(raw_content, manga_title="Unknown"):
     2. var eps[numero] = []; eps[numero].length = X; (format avec longueur séparée)
     3. Autres formats possibles
 
+    Args:
+        raw_content (str): Contenu du fichier episodes.js
+        manga_title (str): Titre du manga (pour les logs)
+        page_urls_sink (callable): Optionnel, appelé avec (numéro, liste d'URLs)
+            pour chaque chapitre au format classique (manifeste des pages)
+
     Returns:
         dict: {
             'total_chapters': int,
@@ -527,14 +874,18 @@ def parse_episodes_js(raw_content, manga_title="Unknown"):
                 image_urls = re.findall(url_pattern, urls_content)
                 
                 # Compter seulement les URLs non vides
-                page_count = len([url for url in image_urls if url.strip()])
+                image_urls = [url for url in image_urls if url.strip()]
+                page_count = len(image_urls)
                 print(f"    Chapitre {chapter_num}: {page_count} pages trouvées (via comptage URLs)")
+                if page_urls_sink is not None:
+                    page_urls_sink(chapter_num, image_urls)
 
             # CHANGEMENT IMPORTANT : Garder TOUS les chapitres, même avec 0 pages
             chapter_data = {
                 "number": chapter_num,
                 "title": f"Chapitre {chapter_num}",
                 "page_count": page_count,
+                "number_sort": chapter_sort_value(chapter_num),
             }
             
             chapters.append(chapter_data)
@@ -548,18 +899,13 @@ def parse_episodes_js(raw_content, manga_title="Unknown"):
                     "number": chapter_num,
                     "title": f"Chapitre {chapter_num}",
                     "page_count": length,
+                    "number_sort": chapter_sort_value(chapter_num),
                 }
                 chapters.append(chapter_data)
                 found_chapters[chapter_num] = True
 
         # Trier les chapitres par numéro
-        def chapter_sort_key(chapter):
-            try:
-                return int(chapter["number"])
-            except ValueError:
-                return float("inf")
-
-        chapters.sort(key=chapter_sort_key)
+        chapters.sort(key=lambda chapter: chapter["number_sort"])
 
         print(f"  Total chapters processed: {len(chapters)}")
         
@@ -640,3 +986,44 @@ def diagnose_episodes_js(raw_content, manga_title="Unknown"):
     
     print(f"=== FIN DIAGNOSTIC ===\n")
     return all_found_chapters
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from profiling import enable_profiling, finish_profiling, profile_stage
+
+    parser = argparse.ArgumentParser(description="Scraping du catalogue Anime-Sama vers un fichier JSON")
+    parser.add_argument("--output", default="anime_data.json", help="Fichier JSON de sortie")
+    parser.add_argument("--limit", type=int, help="Ne traiter que les N premiers mangas du catalogue")
+    parser.add_argument("--profile", action="store_true", help="Profiler chaque étape (cProfile + tracemalloc)")
+    parser.add_argument("--profile-dir", help="Avec --profile: dossier des résultats (défaut: profiles/<horodatage>)")
+    args = parser.parse_args()
+
+    if args.profile:
+        enable_profiling(args.profile_dir)
+
+    try:
+        with profile_stage("get_anime_list"):
+            anime_list_html = get_anime_list()
+        if not anime_list_html:
+            raise SystemExit("Échec de la récupération du catalogue.")
+        with open("anime_list.html", "w", encoding="utf-8") as file:
+            file.write(anime_list_html)
+
+        with profile_stage("refine_data"):
+            anime_data_list = json.loads(refine_data("anime_list.html"))
+        if args.limit:
+            anime_data_list = anime_data_list[: args.limit]
+
+        fetcher = Fetcher()
+        with profile_stage("fetch_scan_page_urls"):
+            anime_data_list = fetch_scan_page_urls(anime_data_list, fetcher=fetcher)
+        with profile_stage("get_scan_chapters"):
+            anime_data_list = get_scan_chapters(anime_data_list, fetcher=fetcher)
+
+        save_anime_data(anime_data_list, args.output)
+        print(f"{len(anime_data_list)} mangas sauvegardés dans {args.output}")
+        print(f"Requêtes: {fetcher.summary()}")
+    finally:
+        finish_profiling()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Enregistrements compacts manipulés par le pipeline de scraping.
+
+Les étapes du pipeline (fetch_scan_page_urls, get_scan_chapters) mettent à
+jour ces objets sur place au lieu de recopier chaque dictionnaire. Les
+chapitres sont stockés sous forme de tableaux parallèles (numéros et
+nombres de pages) ; les titres "Chapitre N" sont dérivés à la demande.
+
+Les fonctions from_dict()/to_dict() convertissent depuis et vers les
+formats JSON / MongoDB existants (anime_data.json, collection mangas).
+"""
+
+import hashlib
+import math
+import re
+import unicodedata
+from array import array
+
+
+def catalogue_slug(item_url):
+    """
+    Extrait l'identifiant d'une œuvre depuis une URL du catalogue.
+    Ex: "https://anime-sama.fr/catalogue/one-piece/scan/vf/" -> "one-piece"
+
+    Returns:
+        str: Le slug en minuscules, ou None si l'URL n'est pas une URL du catalogue
+    """
+    if not item_url:
+        return None
+    match = re.search(r"catalogue/([^/?#]+)", item_url)
+    return match.group(1).lower() if match else None
+
+
+def manga_id_from_slug(slug):
+    """
+    Identifiant stable et compact d'un manga : entier signé 64 bits dérivé
+    du slug du catalogue (8 octets en BSON, indépendant du titre affiché).
+
+    Args:
+        slug (str): Slug du catalogue (voir catalogue_slug)
+
+    Returns:
+        int: Identifiant, ou None si le slug est vide
+    """
+    if not slug:
+        return None
+    digest = hashlib.blake2b(slug.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def manga_id_from_url(item_url):
+    """Identifiant stable d'un manga depuis son URL du catalogue (ou None)."""
+    return manga_id_from_slug(catalogue_slug(item_url))
+
+
+# Dimensions de navigation, dans l'ordre des clés composées (voir browse_key)
+BROWSE_DIMENSIONS = ("type", "language", "genre")
+
+
+def normalize_facet_value(value):
+    """
+    Forme normalisée d'un genre, type ou langue pour l'indexation.
+    Ex: "Tranche de Vie" -> "tranche-de-vie", "Comédie" -> "comedie"
+    """
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")
+
+
+def facet_values(value):
+    """
+    Valeurs normalisées d'un champ genres / type / language (liste ou
+    chaîne séparée par des virgules), avec leur libellé d'origine.
+
+    Returns:
+        dict: Valeur normalisée -> libellé
+    """
+    if isinstance(value, str):
+        value = value.split(",")
+    labels = {}
+    for label in value or []:
+        key = normalize_facet_value(label)
+        if key and key not in labels:
+            labels[key] = label.strip()
+    return labels
+
+
+def browse_key(**filters):
+    """
+    Clé de navigation d'une combinaison de filtres (valeurs normalisées).
+    Ex: browse_key(type="manhwa", genre="action") -> "type=manhwa;genre=action",
+    browse_key() -> "*" (tout le catalogue).
+    """
+    parts = [
+        f"{dimension}={filters[dimension]}"
+        for dimension in BROWSE_DIMENSIONS
+        if filters.get(dimension)
+    ]
+    return ";".join(parts) or "*"
+
+
+def browse_fields(manga):
+    """
+    Champs de navigation d'un document manga : valeurs normalisées de
+    chaque dimension et clés de toutes les combinaisons de filtres
+    (un type, une langue et un genre au plus), indexées par
+    (browse_keys, title, _id).
+
+    Args:
+        manga (dict): Document manga (genres, type, language)
+
+    Returns:
+        tuple: (champs à écrire sur le manga, libellés {dimension: {valeur: libellé}})
+    """
+    labels = {
+        "type": facet_values(manga.get("type")),
+        "language": facet_values(manga.get("language")),
+        "genre": facet_values(manga.get("genres")),
+    }
+    keys = [{}]
+    for dimension in BROWSE_DIMENSIONS:
+        keys += [dict(filters, **{dimension: value}) for filters in keys for value in labels[dimension]]
+    fields = {
+        "type_keys": list(labels["type"]),
+        "language_keys": list(labels["language"]),
+        "genre_keys": list(labels["genre"]),
+        "browse_keys": [browse_key(**filters) for filters in keys],
+    }
+    return fields, labels
+
+
+def parse_browse_key(key):
+    """Filtres d'une clé produite par browse_key() ({} pour "*")."""
+    if key == "*":
+        return {}
+    return dict(part.split("=", 1) for part in key.split(";"))
+
+
+def chapter_sort_value(number):
+    """
+    Calcule la clé de tri numérique d'un numéro de chapitre.
+
+    Les numéros sont stockés sous forme de chaîne ("10", "10.5"), ce qui
+    donne un tri lexicographique ("10" < "2"). Cette valeur flottante est
+    stockée à côté pour trier et filtrer par plage via l'index.
+
+    Args:
+        number (str): Numéro du chapitre
+
+    Returns:
+        float: Valeur numérique, ou inf si le numéro n'est pas numérique
+    """
+    try:
+        return float(str(number).strip().replace(",", "."))
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+def format_chapter_number(value):
+    """Représentation textuelle canonique d'un numéro de chapitre (10.0 -> "10")."""
+    if not math.isfinite(value):
+        return str(value)
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class ChapterSet:
+    """
+    Chapitres d'un type de scan, en tableaux parallèles.
+
+    Les numéros sont stockés en flottants (tri et comparaisons numériques) ;
+    ceux dont la forme textuelle n'est pas canonique ("01", "x") sont
+    conservés dans `labels` pour être restitués à l'identique.
+    """
+
+    __slots__ = ("numbers", "page_counts", "labels")
+
+    def __init__(self):
+        self.numbers = array("d")
+        self.page_counts = array("I")
+        self.labels = None
+
+    def append(self, number, page_count=0):
+        """Ajoute un chapitre (numéro sous forme de chaîne)."""
+        value = chapter_sort_value(number)
+        index = len(self.numbers)
+        self.numbers.append(value)
+        self.page_counts.append(max(0, int(page_count or 0)))
+        if value == float("inf") or format_chapter_number(value) != number:
+            if self.labels is None:
+                self.labels = {}
+            self.labels[index] = number
+
+    def number(self, index):
+        """Numéro du chapitre `index` sous forme de chaîne."""
+        if self.labels and index in self.labels:
+            return self.labels[index]
+        return format_chapter_number(self.numbers[index])
+
+    def title(self, index):
+        """Titre dérivé du chapitre `index`."""
+        return f"Chapitre {self.number(index)}"
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __iter__(self):
+        """Itère sur les paires (numéro, nombre de pages)."""
+        for index in range(len(self.numbers)):
+            yield self.number(index), self.page_counts[index]
+
+    @property
+    def total_pages(self):
+        return sum(self.page_counts)
+
+    @classmethod
+    def from_list(cls, chapters):
+        """Construit un ChapterSet depuis une liste de dictionnaires chapitre."""
+        chapter_set = cls()
+        for chapter in chapters:
+            chapter_set.append(chapter["number"], chapter.get("page_count", 0))
+        return chapter_set
+
+    def to_list(self):
+        """Restitue les chapitres au format de parse_episodes_js()."""
+        return [
+            {
+                "number": self.number(index),
+                "title": self.title(index),
+                "page_count": self.page_counts[index],
+                "number_sort": self.numbers[index],
+            }
+            for index in range(len(self.numbers))
+        ]
+
+
+class ScanType:
+    """
+    Type de scan d'un manga (Scan VF, Scan Spécial VF, ...).
+
+    `chapters` vaut None tant que get_scan_chapters n'a pas trouvé de chapitres.
+    Les clés inconnues (ex: chapters_count venant de MongoDB) sont gardées dans `extra`.
+    """
+
+    __slots__ = ("name", "url", "id_scan", "episodes_url", "chapters", "extra")
+
+    def __init__(self, name, url, id_scan=None, episodes_url=None, chapters=None, extra=None):
+        self.name = name
+        self.url = url
+        self.id_scan = id_scan
+        self.episodes_url = episodes_url
+        self.chapters = chapters
+        self.extra = extra
+
+    def has_chapter_data(self):
+        """Indique si ce type de scan doit apparaître dans `scan_chapters`."""
+        return self.chapters is not None or bool(self.extra)
+
+    def to_scan_type_dict(self):
+        """Format d'une entrée de `scan_types`."""
+        return {"name": self.name, "url": self.url}
+
+    def to_scan_chapters_dict(self):
+        """Format d'une entrée de `scan_chapters`."""
+        data = dict(self.extra or {})
+        data.update({"name": self.name, "url": self.url})
+        if self.id_scan is not None:
+            data["id_scan"] = self.id_scan
+        if self.episodes_url is not None:
+            data["episodes_url"] = self.episodes_url
+        if self.chapters is not None:
+            data["total_chapters"] = len(self.chapters)
+            data["chapters"] = self.chapters.to_list()
+        return data
+
+
+class Manga:
+    """
+    Manga du catalogue, mis à jour sur place par les étapes du pipeline.
+
+    Les clés inconnues (ex: _id, total_pages venant de MongoDB) sont gardées
+    dans `extra` et restituées par to_dict().
+    """
+
+    __slots__ = (
+        "title",
+        "alt_title",
+        "url",
+        "image_url",
+        "genres",
+        "type",
+        "language",
+        "scan_types",
+        "extra",
+    )
+
+    FIELDS = ("title", "alt_title", "url", "image_url", "genres", "type", "language")
+
+    def __init__(self, title=None, alt_title=None, url=None, image_url=None,
+                 genres=None, type=None, language=None, scan_types=None, extra=None):
+        self.title = title
+        self.alt_title = alt_title
+        self.url = url
+        self.image_url = image_url
+        self.genres = genres
+        self.type = type
+        self.language = language
+        self.scan_types = scan_types
+        self.extra = extra
+
+    def get(self, key, default=None):
+        """Accès compatible avec les dictionnaires pour les champs de base."""
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return (self.extra or {}).get(key, default)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Construit un Manga depuis le format JSON/MongoDB
+        (clés `scan_types` et `scan_chapters` fusionnées par nom).
+        """
+        manga = cls(**{field: data.get(field) for field in cls.FIELDS})
+
+        scan_types = {}
+        for entry in data.get("scan_types") or []:
+            scan_types[entry["name"]] = ScanType(entry["name"], entry.get("url"))
+        for entry in data.get("scan_chapters") or []:
+            scan_type = scan_types.get(entry["name"])
+            if scan_type is None:
+                scan_type = scan_types[entry["name"]] = ScanType(entry["name"], entry.get("url"))
+            scan_type.id_scan = entry.get("id_scan")
+            scan_type.episodes_url = entry.get("episodes_url")
+            if entry.get("chapters") is not None:
+                scan_type.chapters = ChapterSet.from_list(entry["chapters"])
+            extra = {
+                key: value
+                for key, value in entry.items()
+                if key not in ("name", "url", "id_scan", "episodes_url", "chapters", "total_chapters")
+            }
+            scan_type.extra = extra or None
+        if scan_types or "scan_types" in data:
+            manga.scan_types = list(scan_types.values())
+
+        extra = {
+            key: value
+            for key, value in data.items()
+            if key not in cls.FIELDS and key not in ("scan_types", "scan_chapters")
+        }
+        manga.extra = extra or None
+        return manga
+
+    def to_dict(self):
+        """Restitue le manga au format JSON/MongoDB existant."""
+        data = dict(self.extra or {})
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        if self.scan_types is not None:
+            data["scan_types"] = [scan_type.to_scan_type_dict() for scan_type in self.scan_types]
+            scan_chapters = [
+                scan_type.to_scan_chapters_dict()
+                for scan_type in self.scan_types
+                if scan_type.has_chapter_data()
+            ]
+            if scan_chapters:
+                data["scan_chapters"] = scan_chapters
+        return data
+
+
+def as_manga(item):
+    """Retourne `item` s'il s'agit déjà d'un Manga, sinon le convertit."""
+    return item if isinstance(item, Manga) else Manga.from_dict(item)
+
+
+def to_dict_list(items):
+    """Convertit une liste de Manga (ou de dictionnaires) au format JSON."""
+    return [item.to_dict() if isinstance(item, Manga) else item for item in items]
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache persistant des résultats négatifs du scraping.
+
+Deux types d'échecs se répètent d'une nuit à l'autre pour les mêmes titres :
+
+- PROBE_NOT_FOUND : une URL de repli (/scan/vf/, /scan_special/vf/) testée
+  par fetch_scan_page_urls a répondu 404 ;
+- NO_SCAN_ID : get_scan_chapters n'a trouvé aucun ID de scan sur une page.
+
+Ces résultats sont enregistrés dans la collection `negative_cache` avec une
+expiration aléatoirement décalée (pour que les entrées n'expirent pas toutes
+la même nuit) et les requêtes correspondantes sont sautées jusqu'à
+expiration, ou jusqu'à ce qu'un signal (homepage, planning) marque le titre
+comme modifié.
+"""
+
+import os
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pymongo
+
+from add_to_db import get_negative_cache_collection, load_env
+from main import catalogue_slug
+
+PROBE_NOT_FOUND = "probe_not_found"
+NO_SCAN_ID = "no_scan_id"
+
+
+class NegativeCache:
+    """
+    Résultats négatifs non expirés, chargés en une requête au premier accès.
+
+    Args:
+        ttl_hours (float): Durée de vie d'une entrée (défaut: NEGATIVE_CACHE_TTL_HOURS, 72)
+        jitter (float): Décalage aléatoire relatif de l'expiration (défaut: 0.25, soit ±25 %)
+    """
+
+    def __init__(self, ttl_hours=None, jitter=0.25):
+        load_env()
+        self.ttl_hours = ttl_hours if ttl_hours is not None else float(
+            os.getenv("NEGATIVE_CACHE_TTL_HOURS", "72")
+        )
+        self.jitter = jitter
+        self.stats = Counter()
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            collection = get_negative_cache_collection()
+            collection.create_index("expires_at", expireAfterSeconds=0)
+            collection.create_index([("slug", pymongo.ASCENDING)])
+            now = datetime.now()
+            self._entries = {
+                doc["_id"]: doc["expires_at"]
+                for doc in collection.find({"expires_at": {"$gt": now}}, {"expires_at": 1})
+            }
+        return self._entries
+
+    def contains(self, kind, url):
+        """Indique si `url` a un résultat négatif non expiré pour `kind`."""
+        with self._lock:
+            expires_at = self._load().get(f"{kind}:{url}")
+        if expires_at is not None and expires_at > datetime.now():
+            self.stats[f"{kind}_skipped"] += 1
+            return True
+        return False
+
+    def add(self, kind, url):
+        """Enregistre un résultat négatif pour `url`, avec une expiration décalée."""
+        factor = 1 + random.uniform(-self.jitter, self.jitter)
+        expires_at = datetime.now() + timedelta(hours=self.ttl_hours * factor)
+        key = f"{kind}:{url}"
+        with self._lock:
+            self._load()[key] = expires_at
+        self.stats[f"{kind}_recorded"] += 1
+        try:
+            get_negative_cache_collection().update_one(
+                {"_id": key},
+                {
+                    "$set": {
+                        "kind": kind,
+                        "url": url,
+                        "slug": catalogue_slug(url),
+                        "expires_at": expires_at,
+                        "recorded_at": datetime.now(),
+                    }
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Erreur lors de l'écriture du cache négatif pour {url}: {e}")
+
+    def mark_dirty(self, slugs):
+        """
+        Supprime les résultats négatifs des titres signalés comme modifiés.
+
+        Args:
+            slugs (iterable): Slugs du catalogue (voir catalogue_slug())
+
+        Returns:
+            int: Nombre d'entrées supprimées
+        """
+        slugs = [slug for slug in set(slugs) if slug]
+        if not slugs:
+            return 0
+        result = get_negative_cache_collection().delete_many({"slug": {"$in": slugs}})
+        with self._lock:
+            if self._entries is not None:
+                slug_set = set(slugs)
+                self._entries = {
+                    key: expires_at
+                    for key, expires_at in self._entries.items()
+                    if catalogue_slug(key.split(":", 1)[1]) not in slug_set
+                }
+        return result.deleted_count
+
+    def summary(self):
+        """Résumé lisible des requêtes sautées et des entrées ajoutées."""
+        return ", ".join(f"{count} {name}" for name, count in sorted(self.stats.items())) or "aucune entrée utilisée"
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Manifeste des pages de chapitres et vérification de leur disponibilité.
+
+Mode optionnel : pendant get_scan_chapters, les listes d'URLs des pages
+trouvées dans episodes.js sont enregistrées dans un manifeste (collection
+MongoDB `page_manifests` ou fichier JSONL) au lieu d'être jetées.
+
+Le vérificateur asynchrone parcourt ensuite le manifeste et teste les
+pages (échantillon HEAD ou vérification complète) avec une concurrence
+bornée globalement et par hôte. Les résultats sont mis en cache par URL,
+ce qui permet de détecter les chapitres morts de tout le catalogue en un
+seul passage.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+
+import pymongo
+import requests
+
+from cache import TTLCache
+from fetcher import http_request
+from add_to_db import get_page_manifests_collection, load_env
+
+# User agent header pour éviter les blocages
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+DEFAULT_CONCURRENCY = 32
+DEFAULT_PER_HOST = 4
+DEFAULT_SAMPLE_SIZE = 3
+# Les résultats de disponibilité restent valables 12 heures
+AVAILABILITY_TTL = 12 * 3600
+
+# Cache des résultats par URL, partagé par toutes les vérifications du processus
+availability_cache = TTLCache(maxsize=500_000, ttl=AVAILABILITY_TTL)
+
+
+class MongoManifestStore:
+    """
+    Manifeste stocké dans la collection `page_manifests`
+    (un document par manga, type de scan et chapitre).
+
+    Args:
+        batch_size (int): Nombre de chapitres envoyés par bulk_write
+    """
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._indexed = False
+
+    def sink(self, manga_title, scan_name, episodes_url):
+        """Retourne la fonction à passer à parse_episodes_js(page_urls_sink=...)."""
+
+        def add(number, page_urls):
+            self.add(manga_title, scan_name, number, page_urls, episodes_url)
+
+        return add
+
+    def add(self, manga_title, scan_name, number, page_urls, episodes_url=None):
+        """Ajoute les pages d'un chapitre (écrites par lots)."""
+        operation = pymongo.UpdateOne(
+            {"manga_title": manga_title, "scan_name": scan_name, "number": number},
+            {
+                "$set": {
+                    "pages": list(page_urls),
+                    "page_count": len(page_urls),
+                    "episodes_url": episodes_url,
+                    "updated_at": datetime.now(),
+                }
+            },
+            upsert=True,
+        )
+        with self._lock:
+            self._pending.append(operation)
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self._write(batch)
+
+    def flush(self):
+        """Écrit les chapitres encore en attente."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        collection = get_page_manifests_collection()
+        if not self._indexed:
+            collection.create_index(
+                [
+                    ("manga_title", pymongo.ASCENDING),
+                    ("scan_name", pymongo.ASCENDING),
+                    ("number", pymongo.ASCENDING),
+                ],
+                unique=True,
+            )
+            self._indexed = True
+        try:
+            collection.bulk_write(batch, ordered=False)
+        except Exception as e:
+            print(f"Erreur lors de l'écriture du manifeste des pages: {e}")
+
+    def iter_chapters(self, query=None):
+        """Itère sur les chapitres du manifeste (dictionnaires avec `pages`)."""
+        return get_page_manifests_collection().find(query or {}, {"_id": 0})
+
+    def record_availability(self, results):
+        """Enregistre le résultat de la vérification de chaque chapitre."""
+        operations = [
+            pymongo.UpdateOne(
+                {
+                    "manga_title": result["manga_title"],
+                    "scan_name": result["scan_name"],
+                    "number": result["number"],
+                },
+                {
+                    "$set": {
+                        "availability": {
+                            "checked_at": datetime.now(),
+                            "checked": result["checked"],
+                            "dead_pages": result["dead_pages"],
+                        }
+                    }
+                },
+            )
+            for result in results
+        ]
+        for start in range(0, len(operations), self.batch_size):
+            get_page_manifests_collection().bulk_write(
+                operations[start:start + self.batch_size], ordered=False
+            )
+
+
+class JsonlManifestStore:
+    """
+    Manifeste écrit dans un fichier JSON Lines (une ligne par chapitre).
+
+    Les chapitres sont ajoutés en fin de fichier ; flush() compacte le
+    fichier (dernière ligne de chaque chapitre) dès que les lignes ajoutées
+    depuis le dernier compactage sont aussi nombreuses que les lignes
+    conservées, pour que le fichier ne grossisse pas à chaque run. Le
+    fichier ne doit pas être partagé par plusieurs processus (voir
+    make_manifest_store(part=...)).
+
+    Args:
+        file_path (str): Chemin du fichier JSONL
+    """
+
+    def __init__(self, file_path="page_manifest.jsonl"):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._file = None
+        self._appended = 0
+        # Lignes du fichier au dernier compactage (None : pas encore compacté)
+        self._compacted_lines = None
+
+    def sink(self, manga_title, scan_name, episodes_url):
+        """Retourne la fonction à passer à parse_episodes_js(page_urls_sink=...)."""
+
+        def add(number, page_urls):
+            self.add(manga_title, scan_name, number, page_urls, episodes_url)
+
+        return add
+
+    def add(self, manga_title, scan_name, number, page_urls, episodes_url=None):
+        """Ajoute une ligne pour le chapitre."""
+        line = json.dumps(
+            {
+                "manga_title": manga_title,
+                "scan_name": scan_name,
+                "number": number,
+                "episodes_url": episodes_url,
+                "pages": list(page_urls),
+            },
+            ensure_ascii=False,
+        )
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.file_path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._appended += 1
+
+    def flush(self):
+        """Vide le tampon du fichier et le compacte si nécessaire."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            if self._appended and (
+                self._compacted_lines is None or self._appended >= self._compacted_lines
+            ):
+                self._compact()
+
+    def _compact(self):
+        """Réécrit le fichier avec la dernière ligne de chaque chapitre (verrou tenu)."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        lines = {}
+        with open(self.file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                chapter = json.loads(line)
+                lines[(chapter.get("manga_title"), chapter.get("scan_name"), chapter.get("number"))] = line
+        temp_path = f"{self.file_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines.values())
+        os.replace(temp_path, self.file_path)
+        self._appended = 0
+        self._compacted_lines = len(lines)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def iter_chapters(self, query=None):
+        """Itère sur les chapitres du fichier (le filtre `query` porte sur l'égalité des champs)."""
+        self.flush()
+        with open(self.file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                chapter = json.loads(line)
+                if query and any(chapter.get(key) != value for key, value in query.items()):
+                    continue
+                yield chapter
+
+    def record_availability(self, results):
+        """Les résultats ne sont pas réécrits dans un fichier JSONL."""
+        return None
+
+
+def make_manifest_store(part=None):
+    """
+    Crée le manifeste configuré par la variable d'environnement PAGE_MANIFEST :
+    "mongo" (collection page_manifests), "jsonl" (fichier PAGE_MANIFEST_FILE)
+    ou vide (mode désactivé, retourne None).
+
+    Args:
+        part (str): Suffixe du fichier JSONL, pour que chaque processus
+            (workers du crawl distribué) écrive dans son propre fichier
+            (page_manifest.<part>.jsonl)
+    """
+    load_env()
+    mode = os.getenv("PAGE_MANIFEST", "").strip().lower()
+    if mode == "mongo":
+        return MongoManifestStore()
+    if mode == "jsonl":
+        file_path = os.getenv("PAGE_MANIFEST_FILE", "page_manifest.jsonl")
+        if part:
+            root, extension = os.path.splitext(file_path)
+            file_path = f"{root}.{part}{extension}"
+        return JsonlManifestStore(file_path)
+    return None
+
+
+_thread_local = threading.local()
+
+
+def _get_session():
+    """Session HTTP par thread (réutilisation des connexions)."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        _thread_local.session = session
+    return session
+
+
+def probe_page(page_url, full=False, timeout=15):
+    """
+    Teste la disponibilité d'une page (bloquant). La requête passe par
+    http_request : sa durée totale est bornée (REQUEST_TOTAL_SECONDS), y
+    compris le téléchargement de l'image en mode complet.
+
+    Args:
+        page_url (str): URL de l'image
+        full (bool): Télécharger l'image entière au lieu d'une requête HEAD
+        timeout (float): Délai de la requête
+
+    Returns:
+        bool: True si la page répond avec un statut 2xx
+    """
+    session = _get_session()
+    try:
+        if not full:
+            response = http_request("HEAD", page_url, session, timeout=timeout, allow_redirects=True)
+            # Certains hébergeurs refusent HEAD : on retombe sur un GET du premier octet
+            if response.status_code not in (405, 501):
+                return 200 <= response.status_code < 300
+            response = http_request("GET", page_url, session, timeout=timeout, headers={"Range": "bytes=0-0"})
+        else:
+            response = http_request("GET", page_url, session, timeout=timeout)
+        return 200 <= response.status_code < 300
+    except requests.exceptions.RequestException:
+        return False
+
+
+class AvailabilityChecker:
+    """
+    Vérificateur asynchrone à concurrence bornée (globale et par hôte).
+
+    Args:
+        concurrency (int): Nombre maximum de requêtes simultanées
+        per_host (int): Nombre maximum de requêtes simultanées par hôte
+        full (bool): Vérification complète (GET) au lieu de HEAD
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST, full=False):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.full = full
+        self._global = None
+        self._hosts = {}
+        # Requêtes bloquantes exécutées dans un pool dédié, dimensionné sur la concurrence
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="availability")
+        # Vérification en cours par URL, partagée par les chapitres qui la demandent
+        self._in_flight = {}
+        self.requests_sent = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+
+    def _host_semaphore(self, page_url):
+        host = urlparse(page_url).netloc
+        semaphore = self._hosts.get(host)
+        if semaphore is None:
+            semaphore = self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return semaphore
+
+    async def check(self, page_url):
+        """
+        Retourne True si la page est disponible (résultat mis en cache par URL ;
+        une URL déjà en cours de vérification n'est pas redemandée).
+        """
+        key = ("pages", page_url, self.full)
+        cached = availability_cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        future = self._in_flight.get(key)
+        if future is None:
+            future = self._in_flight[key] = asyncio.ensure_future(self._probe(page_url, key))
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    async def _probe(self, page_url, key):
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.concurrency)
+        async with self._global, self._host_semaphore(page_url):
+            self.requests_sent += 1
+            loop = asyncio.get_running_loop()
+            available = await loop.run_in_executor(self._executor, probe_page, page_url, self.full)
+        availability_cache.set(key, available)
+        return available
+
+    def close(self):
+        """Arrête le pool de requêtes."""
+        self._executor.shutdown(wait=False)
+
+    async def check_chapter(self, chapter, sample_size=DEFAULT_SAMPLE_SIZE):
+        """
+        Vérifie un chapitre du manifeste.
+
+        Returns:
+            dict: manga_title, scan_name, number, checked, dead_pages
+        """
+        pages = chapter.get("pages") or []
+        to_check = pages if self.full else sample_pages(pages, sample_size)
+        results = await asyncio.gather(*(self.check(page) for page in to_check))
+        return {
+            "manga_title": chapter.get("manga_title"),
+            "scan_name": chapter.get("scan_name"),
+            "number": chapter.get("number"),
+            "checked": len(to_check),
+            "dead_pages": [page for page, ok in zip(to_check, results) if not ok],
+        }
+
+
+async def find_dead_chapters_async(store, checker, sample_size=DEFAULT_SAMPLE_SIZE,
+                                   query=None, batch_size=200):
+    """
+    Vérifie tous les chapitres du manifeste et retourne ceux qui ont des pages mortes.
+
+    Les chapitres sont traités par lots pour borner la mémoire ; la
+    concurrence réelle est limitée par le vérificateur.
+    """
+    dead_chapters = []
+    nb_checked = 0
+    batch = []
+
+    async def run_batch(chapters):
+        results = await asyncio.gather(
+            *(checker.check_chapter(chapter, sample_size) for chapter in chapters)
+        )
+        await asyncio.to_thread(store.record_availability, results)
+        return results
+
+    for chapter in store.iter_chapters(query):
+        batch.append(chapter)
+        if len(batch) >= batch_size:
+            for result in await run_batch(batch):
+                if result["dead_pages"]:
+                    dead_chapters.append(result)
+            nb_checked += len(batch)
+            print(f"  {nb_checked} chapitres vérifiés, {len(dead_chapters)} avec des pages mortes")
+            batch = []
+    if batch:
+        for result in await run_batch(batch):
+            if result["dead_pages"]:
+                dead_chapters.append(result)
+        nb_checked += len(batch)
+
+    print(
+        f"Vérification terminée: {nb_checked} chapitres, {len(dead_chapters)} avec des pages mortes "
+        f"({checker.requests_sent} requêtes, {checker.cache_hits} résultats en cache, "
+        f"{checker.coalesced} vérifications partagées)"
+    )
+    return dead_chapters
+
+
+def find_dead_chapters(store=None, full=False, sample_size=DEFAULT_SAMPLE_SIZE,
+                       concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST, query=None):
+    """
+    Point d'entrée synchrone de la détection des chapitres morts.
+
+    Args:
+        store: Manifeste à parcourir (défaut: MongoManifestStore)
+        full (bool): Vérifier toutes les pages au lieu d'un échantillon HEAD
+        sample_size (int): Nombre de pages testées par chapitre en mode échantillon
+        concurrency (int): Requêtes simultanées maximum
+        per_host (int): Requêtes simultanées maximum par hôte
+        query (dict): Filtre sur les chapitres (ex: {"manga_title": "..."})
+
+    Returns:
+        list: Chapitres avec au moins une page indisponible
+    """
+    store = store if store is not None else MongoManifestStore()
+    checker = AvailabilityChecker(concurrency=concurrency, per_host=per_host, full=full)
+    try:
+        return asyncio.run(find_dead_chapters_async(store, checker, sample_size, query))
+    finally:
+        checker.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vérification de la disponibilité des pages de chapitres")
+    parser.add_argument(
+        "--jsonl", nargs="+", help="Lire le manifeste depuis des fichiers JSONL au lieu de MongoDB"
+    )
+    parser.add_argument("--manga", help="Limiter la vérification à un manga")
+    parser.add_argument("--full", action="store_true", help="Télécharger toutes les pages au lieu d'un échantillon HEAD")
+    parser.add_argument("--sample", type=int, default=DEFAULT_SAMPLE_SIZE, help="Pages testées par chapitre")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Requêtes simultanées maximum")
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST, help="Requêtes simultanées maximum par hôte")
+
+    args = parser.parse_args()
+
+    stores = [JsonlManifestStore(path) for path in args.jsonl] if args.jsonl else [MongoManifestStore()]
+    query = {"manga_title": args.manga} if args.manga else None
+    dead = []
+    for store in stores:
+        dead.extend(find_dead_chapters(store, args.full, args.sample, args.concurrency, args.per_host, query))
+    for chapter in dead:
+        print(
+            f"{chapter['manga_title']} - {chapter['scan_name']} - Chapitre {chapter['number']}: "
+            f"{len(chapter['dead_pages'])}/{chapter['checked']} pages mortes"
+        )
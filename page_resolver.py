@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Résolution à la demande des URLs des pages d'un chapitre.
+
+Les URLs des images ne sont pas stockées en base. Pour un manga, un type de
+scan et un numéro de chapitre, le PageResolver retrouve l'`episodes_url`
+enregistré par le scraper, télécharge `episodes.js` et n'en extrait que le
+tableau du chapitre demandé (liens Google Drive convertis en liens de
+téléchargement direct).
+
+Le contenu de chaque episodes.js est gardé dans un cache LRU (cache.TTLCache)
+indexé par (episodes_url, filever), avec ses validateurs HTTP : un chapitre
+déjà demandé est servi depuis la mémoire, et après PAGE_RESOLVER_REVALIDATE_SECONDS
+le fichier est revalidé par un GET conditionnel (If-None-Match /
+If-Modified-Since). Un nouveau filever (chapitres ajoutés) donne une nouvelle
+entrée.
+"""
+
+import contextlib
+import os
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+from add_to_db import get_manga_collection, load_env
+from cache import TTLCache
+from fetcher import http_request
+from main import build_episodes_url
+
+# User agent header pour éviter les blocages
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# Liens Google Drive de visualisation (voir README, "Notes techniques")
+DRIVE_VIEW_PATTERN = re.compile(r"^https?://drive\.google\.com/uc\?export=view&id=([\w-]+)")
+
+# Durée de conservation d'un episodes.js en cache (revalidé bien avant)
+ENTRY_TTL = 24 * 3600
+# Durée de conservation de l'episodes_url d'un type de scan (namespace "mangas")
+LOOKUP_TTL = 60
+
+
+def convert_drive_url(page_url):
+    """
+    Convertit un lien Google Drive de visualisation en lien de téléchargement direct.
+
+    Args:
+        page_url (str): URL d'une page
+
+    Returns:
+        str: URL directe (l'URL d'origine si ce n'est pas un lien Drive)
+    """
+    match = DRIVE_VIEW_PATTERN.match(page_url)
+    if match is None:
+        return page_url
+    return f"https://drive.usercontent.google.com/download?id={match.group(1)}&export=view&authuser=0"
+
+
+def parse_chapter_pages(raw_content, number):
+    """
+    Extrait d'un episodes.js les URLs des pages d'un seul chapitre (mêmes
+    formats que parse_episodes_js).
+
+    Args:
+        raw_content (str): Contenu de episodes.js
+        number (str): Numéro du chapitre
+
+    Returns:
+        list: URLs des pages (vide pour un chapitre sans URLs, au format
+            `eps<N>.length = X`), ou None si le chapitre n'existe pas
+    """
+    number = re.escape(str(number))
+    match = re.search(rf"(?:var\s+)?eps\[?{number}\]?\s*=\s*\[(.*?)\];", raw_content, re.DOTALL)
+    if match is None:
+        if re.search(rf"eps{number}\.length\s*=", raw_content):
+            return []
+        return None
+    page_urls = re.findall(r"""['"]([^'"]+)['"]""", match.group(1))
+    return [convert_drive_url(page_url.strip()) for page_url in page_urls if page_url.strip()]
+
+
+def split_episodes_url(episodes_url):
+    """
+    Sépare une URL d'episodes.js en (URL sans filever, filever).
+
+    Returns:
+        tuple: (URL, filever ou None)
+    """
+    parts = urlsplit(episodes_url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    filever = next((value for name, value in params if name == "filever"), None)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", "")), filever
+
+
+def find_scan_episodes_url(manga, scan_name):
+    """
+    URL de l'episodes.js d'un type de scan d'un document manga.
+
+    `insert_mangas_to_db` n'enregistre que {name, url} dans `scan_types` ;
+    `episodes_url` et `id_scan` sont dans `scan_chapters`. `scan_types` ne
+    sert qu'à retrouver l'URL de la page de scan.
+
+    Args:
+        manga (dict): Document de la collection mangas
+        scan_name (str): Type de scan (ex: "Scan VF")
+
+    Returns:
+        str: URL, ou None si le type de scan est inconnu
+    """
+    scan_url = None
+    id_scan = None
+    for field in ("scan_chapters", "scan_types"):
+        for scan_type in manga.get(field) or []:
+            if scan_type.get("name") != scan_name:
+                continue
+            if scan_type.get("episodes_url"):
+                return scan_type["episodes_url"]
+            scan_url = scan_url or scan_type.get("url")
+            id_scan = id_scan or scan_type.get("id_scan")
+    if not scan_url:
+        return None
+    return build_episodes_url(scan_url, id_scan)
+
+
+class _Entry:
+    """episodes.js en cache : contenu, validateurs et chapitres déjà extraits."""
+
+    def __init__(self, raw, etag, last_modified):
+        self.raw = raw
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = time.monotonic()
+        self.chapters = {}
+
+
+class PageResolver:
+    """
+    Résolveur des pages de chapitres avec cache LRU des episodes.js.
+
+    Args:
+        maxsize (int): Nombre d'episodes.js gardés en mémoire (défaut: PAGE_RESOLVER_CACHE_SIZE, 256)
+        revalidate_seconds (float): Âge à partir duquel un episodes.js est revalidé
+            (défaut: PAGE_RESOLVER_REVALIDATE_SECONDS, 300)
+        session (requests.Session): Session HTTP (optionnel)
+    """
+
+    def __init__(self, maxsize=None, revalidate_seconds=None, session=None):
+        load_env()
+        self.cache = TTLCache(
+            maxsize=maxsize or int(os.getenv("PAGE_RESOLVER_CACHE_SIZE", "256")), ttl=ENTRY_TTL
+        )
+        if revalidate_seconds is None:
+            revalidate_seconds = float(os.getenv("PAGE_RESOLVER_REVALIDATE_SECONDS", "300"))
+        self.revalidate_seconds = revalidate_seconds
+        self.session = session
+        self.downloads = 0
+        self.not_modified = 0
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def find_episodes_url(self, manga_title, scan_name):
+        """
+        URL de l'episodes.js d'un type de scan, telle qu'enregistrée par le
+        scraper dans `scan_chapters` (avec son filever), ou reconstruite
+        depuis l'URL de la page de scan et l'ID du scan.
+
+        Returns:
+            str: URL, ou None si le manga ou le type de scan est inconnu
+        """
+        key = ("mangas", "episodes_url", manga_title, scan_name)
+        episodes_url = self.cache.get(key)
+        if episodes_url is not None:
+            return episodes_url
+        manga = get_manga_collection().find_one(
+            {"title": manga_title}, {"scan_chapters": 1, "scan_types": 1}
+        ) or {}
+        episodes_url = find_scan_episodes_url(manga, scan_name)
+        if episodes_url is not None:
+            self.cache.set(key, episodes_url, ttl=LOOKUP_TTL)
+        return episodes_url
+
+    @contextlib.contextmanager
+    def _locked(self, key):
+        """
+        Verrou du chargement de `key`, partagé par les lecteurs concurrents et
+        supprimé quand le dernier l'a relâché (un verrou par chargement en
+        cours, pas un par fichier rencontré).
+        """
+        with self._lock:
+            lock, users = self._locks.get(key, (None, 0))
+            lock = lock or threading.Lock()
+            self._locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                users = self._locks[key][1] - 1
+                if users:
+                    self._locks[key] = (lock, users)
+                else:
+                    del self._locks[key]
+
+    def _load(self, episodes_url):
+        """Retourne l'entrée en cache de `episodes_url`, téléchargée ou revalidée si besoin."""
+        base_url, filever = split_episodes_url(episodes_url)
+        key = ("episodes", base_url, filever)
+        entry = self.cache.get(key)
+        if entry is not None and time.monotonic() - entry.checked_at < self.revalidate_seconds:
+            return entry
+
+        # Une seule requête par fichier, même si plusieurs lecteurs le demandent en même temps
+        with self._locked(key):
+            entry = self.cache.get(key)
+            if entry is not None and time.monotonic() - entry.checked_at < self.revalidate_seconds:
+                return entry
+
+            headers = dict(HEADERS)
+            if entry is not None:
+                if entry.etag:
+                    headers["If-None-Match"] = entry.etag
+                if entry.last_modified:
+                    headers["If-Modified-Since"] = entry.last_modified
+            response = http_request("GET", episodes_url, self.session, headers=headers, timeout=15)
+            if response.status_code == 304 and entry is not None:
+                self.not_modified += 1
+                entry.checked_at = time.monotonic()
+                return entry
+            response.raise_for_status()
+
+            self.downloads += 1
+            entry = _Entry(
+                response.text, response.headers.get("ETag"), response.headers.get("Last-Modified")
+            )
+            self.cache.set(key, entry)
+            return entry
+
+    def resolve_url(self, episodes_url, number):
+        """
+        URLs des pages d'un chapitre d'un episodes.js donné.
+
+        Args:
+            episodes_url (str): URL de episodes.js (avec filever)
+            number (str | int): Numéro du chapitre
+
+        Returns:
+            list: URLs des pages, ou None si le chapitre n'existe pas
+        """
+        number = str(number)
+        entry = self._load(episodes_url)
+        if number not in entry.chapters:
+            entry.chapters[number] = parse_chapter_pages(entry.raw, number)
+        return entry.chapters[number]
+
+    def resolve(self, manga_title, scan_name, number):
+        """
+        URLs des pages d'un chapitre.
+
+        Args:
+            manga_title (str): Titre du manga
+            scan_name (str): Type de scan (ex: "Scan VF")
+            number (str | int): Numéro du chapitre
+
+        Returns:
+            list: URLs des pages, ou None si le manga, le scan ou le chapitre est inconnu
+
+        Raises:
+            requests.exceptions.RequestException: episodes.js inaccessible
+        """
+        episodes_url = self.find_episodes_url(manga_title, scan_name)
+        if episodes_url is None:
+            return None
+        return self.resolve_url(episodes_url, number)
+
+    def stats(self):
+        """Compteurs du cache (hits, misses, entrées) et des requêtes."""
+        return {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "entries": len(self.cache),
+            "downloads": self.downloads,
+            "not_modified": self.not_modified,
+        }
@@ -1,20 +1,24 @@
-import requests
 import re
 import json
 
+from fetcher import http_request
+
 def url_maker(url):
     path = "https://cdn.statically.io/gh/Anime-Sama/IMG/img/contenu/"
     return f"{path}{url}.jpg"
 
-def scrape_planning():
+def scrape_planning(deadline=None):
     """
     Fonction pour scraper le planning d'Anime-Sama
     
+    Args:
+        deadline (Deadline): Budget de l'étape (voir fetcher.py, optionnel)
+    
     Returns:
         list: Liste des scans avec leurs jours de sortie
     """
     url = "https://anime-sama.fr/planning/"
-    response = requests.get(url)
+    response = http_request("GET", url, deadline=deadline)
     
     if response.status_code != 200:
         print(f"Erreur lors de la récupération de la page: {response.status_code}")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Crawl par priorité avec budget de temps.
+
+Les mangas du catalogue sont placés dans une file de priorité (heapq) :
+
+0. "derniers scans ajoutés" de la homepage ;
+1. planning du jour ;
+2. mangas restés en attente à la fin du run précédent, puis mangas jamais
+   crawlés ou pas mis à jour depuis STALE_AFTER_DAYS jours ;
+3. mangas populaires (classiques et pépites de la homepage) ;
+4. tout le reste.
+
+À priorité égale, le manga mis à jour le plus anciennement passe en premier.
+Quand le budget est épuisé, plus aucun manga n'est démarré : les mangas en
+cours se terminent, et les slugs restants sont enregistrés dans la
+collection `crawl_state` pour être repris en priorité au run suivant, avec
+ceux des mangas dont le traitement a échoué.
+"""
+
+import heapq
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from add_to_db import get_crawl_state_collection, get_manga_collection
+from homepage_db import get_latest_homepage_data
+from models import catalogue_slug
+
+PRIORITY_LATEST = 0
+PRIORITY_PLANNING = 1
+PRIORITY_STALE = 2
+PRIORITY_POPULAR = 3
+PRIORITY_DEFAULT = 4
+
+STALE_AFTER_DAYS = 7
+STATE_ID = "priority_crawl"
+
+
+def homepage_slugs(*sections):
+    """Slugs des items des sections de la dernière homepage enregistrée."""
+    homepage = get_latest_homepage_data() or {}
+    slugs = set()
+    for section in sections:
+        items = homepage.get("sections", {}).get(section, {}).get("items", [])
+        slugs.update(catalogue_slug(item.get("url")) for item in items)
+    slugs.discard(None)
+    return slugs
+
+
+def load_state():
+    """Retourne l'état du run précédent (ou un état vide)."""
+    return get_crawl_state_collection().find_one({"_id": STATE_ID}) or {}
+
+
+def save_state(**fields):
+    """Met à jour l'état du crawl par priorité."""
+    get_crawl_state_collection().update_one(
+        {"_id": STATE_ID}, {"$set": dict(fields, updated_at=datetime.now())}, upsert=True
+    )
+
+
+def build_priority_queue(mangas, planning_slugs=(), stale_after_days=STALE_AFTER_DAYS):
+    """
+    Construit la file de priorité des mangas du catalogue.
+
+    Args:
+        mangas (list): Mangas du catalogue (dictionnaires ou Manga)
+        planning_slugs (iterable): Slugs du planning du jour
+        stale_after_days (float): Âge à partir duquel un manga est considéré obsolète
+
+    Returns:
+        list: Tas d'entrées (priorité, dernière mise à jour, position, manga)
+    """
+    latest = homepage_slugs("derniers_scans")
+    popular = homepage_slugs("classiques", "pepites")
+    planning_slugs = set(planning_slugs)
+    carried_over = set(load_state().get("remaining", []))
+
+    updated_at = {}
+    for doc in get_manga_collection().find({}, {"url": 1, "updated_at": 1}):
+        slug = catalogue_slug(doc.get("url"))
+        if slug:
+            updated_at[slug] = doc.get("updated_at") or datetime.min
+    stale_before = datetime.now() - timedelta(days=stale_after_days)
+
+    heap = []
+    for position, manga in enumerate(mangas):
+        slug = catalogue_slug(manga.get("url"))
+        last_update = updated_at.get(slug, datetime.min)
+        if slug in latest:
+            priority = PRIORITY_LATEST
+        elif slug in planning_slugs:
+            priority = PRIORITY_PLANNING
+        elif slug in carried_over or last_update < stale_before:
+            priority = PRIORITY_STALE
+        elif slug in popular:
+            priority = PRIORITY_POPULAR
+        else:
+            priority = PRIORITY_DEFAULT
+        heap.append((priority, last_update, position, manga))
+    heapq.heapify(heap)
+    return heap
+
+
+def run_priority_crawl(mangas, process, budget_seconds, planning_slugs=(), workers=1, deadline=None):
+    """
+    Traite les mangas par ordre de priorité jusqu'à épuisement du budget.
+
+    Args:
+        mangas (list): Mangas du catalogue
+        process (callable): Traitement d'un manga (scans, chapitres, insertion) ;
+            lève une exception en cas d'échec, pour que le manga soit reporté
+        budget_seconds (float): Budget de temps du run
+        planning_slugs (iterable): Slugs du planning du jour
+        workers (int): Nombre de mangas traités en parallèle
+        deadline (Deadline): Deadline du run (voir fetcher.py) : une fois
+            épuisée ou annulée, plus aucun manga n'est démarré, comme à
+            l'épuisement du budget
+
+    Returns:
+        dict: Statistiques (processed, failed, remaining, budget_exhausted) ;
+            `remaining` compte aussi les mangas en échec
+    """
+    heap = build_priority_queue(mangas, planning_slugs)
+    budget_end = time.monotonic() + budget_seconds
+    stats = {"processed": 0, "failed": 0, "remaining": 0, "budget_exhausted": False}
+    save_state(started_at=datetime.now(), budget_seconds=budget_seconds, finished=False)
+
+    in_flight = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while heap or in_flight:
+            while heap and len(in_flight) < workers:
+                if time.monotonic() >= budget_end or (deadline is not None and deadline.expired):
+                    stats["budget_exhausted"] = True
+                    break
+                _, _, _, manga = heapq.heappop(heap)
+                in_flight[executor.submit(process, manga)] = manga
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                manga = in_flight.pop(future)
+                try:
+                    future.result()
+                    stats["processed"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    failed.append(catalogue_slug(manga.get("url")))
+                    print(f"  Échec du traitement de {manga.get('title')}: {e}")
+
+    remaining = failed + [catalogue_slug(entry[3].get("url")) for entry in sorted(heap)]
+    remaining = [slug for slug in remaining if slug]
+    stats["remaining"] = len(remaining)
+    save_state(
+        remaining=remaining,
+        finished=not heap,
+        stopped_at=datetime.now(),
+        processed=stats["processed"],
+        failed=stats["failed"],
+    )
+    return stats
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mode profilage du pipeline de scraping (option --profile).
+
+Chaque étape (get_anime_list, refine_data, fetch_scan_page_urls,
+get_scan_chapters, insert_mangas_to_db, planning, homepage) est exécutée
+sous cProfile et tracemalloc. Pour chaque étape, le dossier du run contient :
+
+- <étape>.prof : dump cProfile (lisible avec pstats ou snakeviz) ;
+- <étape>.txt : les N fonctions les plus coûteuses (temps cumulé) ;
+- <étape>_memory.txt : les N lignes qui allouent le plus de mémoire.
+
+summary.json / summary.txt résument la durée et le pic mémoire de chaque étape.
+Les étapes répétées (insert_mangas_to_db, un passage par lot écrit au fil du
+crawl) sont cumulées en une seule entrée. Sous --profile, le crawl complet
+exécute ses étapes l'une après l'autre pour que chacune ait son propre profil.
+
+Sans --profile, profile_stage() ne fait rien.
+"""
+
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+DEFAULT_TOP_N = 30
+
+
+class StageProfiler:
+    """
+    Profileur par étape écrivant ses résultats dans un dossier de run.
+
+    Un seul thread est profilé à la fois : une étape démarrée dans un autre
+    thread pendant qu'une étape est profilée n'est que chronométrée (le
+    crawl complet exécute son graphe d'étapes séquentiellement sous
+    --profile). Une étape imbriquée dans le même thread met en pause le
+    profil de l'étape englobante. Le pic mémoire est mesuré pour tout le
+    processus.
+
+    Les étapes répétées (merge=True, ex. un lot d'écriture) sont cumulées
+    en une seule entrée, écrite avec le résumé.
+
+    Args:
+        run_dir (str): Dossier des résultats (défaut: profiles/<horodatage>)
+        top_n (int): Nombre de fonctions / lignes dans les résumés
+    """
+
+    def __init__(self, run_dir=None, top_n=DEFAULT_TOP_N):
+        self.run_dir = run_dir or os.path.join("profiles", datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.top_n = top_n
+        self.stages = []
+        self._lock = threading.Lock()
+        self._owner = None
+        self._local = threading.local()
+        self._names = {}
+        self._merged = {}
+        os.makedirs(self.run_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _file_name(self, name):
+        with self._lock:
+            count = self._names.get(name, 0) + 1
+            self._names[name] = count
+        return name if count == 1 else f"{name}_{count}"
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def stage(self, name, merge=False):
+        """
+        Profile le bloc `with` comme l'étape `name`.
+
+        Args:
+            name (str): Nom de l'étape
+            merge (bool): Cumuler les passages successifs en une seule entrée
+        """
+        stack = self._stack()
+        with self._lock:
+            profiled = self._owner in (None, threading.get_ident())
+            if profiled:
+                self._owner = threading.get_ident()
+        parent = stack[-1] if profiled and stack else None
+        if parent is not None:
+            parent["profile"].disable()
+            parent["peak"] = max(parent["peak"], tracemalloc.get_traced_memory()[1])
+        profile = None
+        if profiled:
+            merged = self._merged.get(name, {}) if merge else {}
+            profile = merged.get("profile") or cProfile.Profile()
+            stack.append({"profile": profile, "peak": 0})
+            tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            duration = time.perf_counter() - start
+            memory_after, memory_peak = tracemalloc.get_traced_memory()
+            if profiled:
+                memory_peak = max(stack.pop()["peak"], memory_peak)
+            memory_delta = memory_after - memory_before
+            if merge:
+                self._merge(name, profile, duration, memory_delta, memory_peak if profiled else None)
+            else:
+                self._record(name, profile, duration, memory_delta, memory_peak if profiled else None)
+            if parent is not None:
+                parent["peak"] = max(parent["peak"], memory_peak)
+                parent["profile"].enable()
+            elif profiled:
+                with self._lock:
+                    self._owner = None
+
+    def _record(self, name, profile, duration, memory_delta, memory_peak):
+        file_name = self._file_name(name)
+        result = {
+            "stage": file_name,
+            "seconds": round(duration, 3),
+            "memory_delta_mb": round(memory_delta / 1e6, 2),
+            "profiled": profile is not None,
+        }
+        if profile is not None:
+            result["peak_memory_mb"] = round(memory_peak / 1e6, 2)
+            self._write_stage(file_name, profile, tracemalloc.take_snapshot())
+        with self._lock:
+            self.stages.append(result)
+        print(f"[profile] {file_name}: {duration:.2f}s, pic mémoire {result.get('peak_memory_mb', '-')} Mo")
+
+    def _merge(self, name, profile, duration, memory_delta, memory_peak):
+        with self._lock:
+            merged = self._merged.setdefault(
+                name,
+                {"profile": None, "calls": 0, "seconds": 0.0, "memory_delta": 0, "peak": None, "snapshot": None},
+            )
+            merged["calls"] += 1
+            merged["seconds"] += duration
+            merged["memory_delta"] += memory_delta
+            if profile is None:
+                return
+            merged["profile"] = profile
+            if merged["peak"] is not None and memory_peak <= merged["peak"]:
+                return
+            merged["peak"] = memory_peak
+        # Allocations au passage du plus haut pic
+        merged["snapshot"] = tracemalloc.take_snapshot()
+
+    def _write_merged(self):
+        for name, merged in self._merged.items():
+            file_name = self._file_name(name)
+            result = {
+                "stage": file_name,
+                "seconds": round(merged["seconds"], 3),
+                "memory_delta_mb": round(merged["memory_delta"] / 1e6, 2),
+                "profiled": merged["profile"] is not None,
+                "calls": merged["calls"],
+            }
+            if merged["profile"] is not None:
+                result["peak_memory_mb"] = round(merged["peak"] / 1e6, 2)
+                self._write_stage(file_name, merged["profile"], merged["snapshot"])
+            self.stages.append(result)
+            print(
+                f"[profile] {file_name}: {merged['seconds']:.2f}s en {merged['calls']} passages, "
+                f"pic mémoire {result.get('peak_memory_mb', '-')} Mo"
+            )
+        self._merged = {}
+
+    def _write_stage(self, name, profile, snapshot):
+        profile.dump_stats(os.path.join(self.run_dir, f"{name}.prof"))
+
+        out = io.StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+        with open(os.path.join(self.run_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+
+        snapshot = snapshot.filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ]
+        )
+        with open(os.path.join(self.run_dir, f"{name}_memory.txt"), "w", encoding="utf-8") as f:
+            for statistic in snapshot.statistics("lineno")[: self.top_n]:
+                f.write(f"{statistic}\n")
+
+    def write_summary(self):
+        """Écrit summary.json et summary.txt dans le dossier du run."""
+        self._write_merged()
+        with open(os.path.join(self.run_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.stages, f, indent=4)
+        with open(os.path.join(self.run_dir, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{'Étape':<32} {'Durée (s)':>10} {'Pic (Mo)':>10} {'Δ mém. (Mo)':>12}\n")
+            for stage in self.stages:
+                f.write(
+                    f"{stage['stage']:<32} {stage['seconds']:>10.2f} "
+                    f"{stage.get('peak_memory_mb', '-'):>10} {stage['memory_delta_mb']:>12.2f}\n"
+                )
+        print(f"[profile] Résultats écrits dans {self.run_dir}")
+
+
+# Profileur actif du processus (None sans --profile)
+_profiler = None
+
+
+def enable_profiling(run_dir=None, top_n=DEFAULT_TOP_N):
+    """Active le profilage par étape pour le reste du processus."""
+    global _profiler
+    _profiler = StageProfiler(run_dir, top_n)
+    return _profiler
+
+
+def profile_stage(name, merge=False):
+    """Contexte de profilage de l'étape `name` (sans effet si le profilage est inactif)."""
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _profiler.stage(name, merge=merge)
+
+
+def is_profiling():
+    """True si --profile est actif pour ce processus."""
+    return _profiler is not None
+
+
+def finish_profiling():
+    """Écrit le résumé du profilage actif, s'il y en a un."""
+    if _profiler is not None:
+        _profiler.write_summary()
@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Service de lecture asynchrone au-dessus des collections MongoDB
+(mangas, chapters, planning, homepage).
+
+Les réponses sont mises en cache en mémoire (TTL/LRU) et portent un ETag
+pour permettre au front de revalider avec If-None-Match (réponse 304).
+Les listes de chapitres sont paginées par curseur et triées par numéro
+réel, servies par l'index composé (manga_id, scan_name, number_sort, number).
+Les mangas restent adressés par leur titre, résolu en manga_id.
+
+La navigation par type, langue et genre (browse_mangas) est servie par
+l'index (browse_keys, title, _id) et paginée par curseur ; les compteurs
+par valeur (get_facets) sont lus dans la collection `facets`, tenue à jour
+à l'ingestion.
+
+Les URLs des pages d'un chapitre (get_chapter_pages) ne sont pas stockées :
+elles sont extraites à la demande de episodes.js par un PageResolver, qui a
+son propre cache (voir page_resolver.py).
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from collections import namedtuple
+
+import pymongo
+from bson import json_util
+
+from cache import TTLCache
+from page_resolver import PageResolver
+from models import BROWSE_DIMENSIONS, browse_key, normalize_facet_value
+from add_to_db import (
+    BROWSE_INDEX,
+    chapter_owner_query,
+    ensure_browse_indexes,
+    ensure_manga_id_indexes,
+    find_chapters,
+    use_chapter_buckets,
+    get_manga_collection,
+    get_chapters_collection,
+    get_planning_collection,
+    get_homepage_collection,
+    get_cache_state_collection,
+    get_facets_collection,
+)
+
+# Durée de vie par défaut des réponses en cache (secondes)
+DEFAULT_TTL = 60
+# Intervalle minimal entre deux vérifications des versions de cache en base
+VERSION_CHECK_INTERVAL = 5
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+ReadResponse = namedtuple("ReadResponse", ["status", "body", "etag", "next_cursor"])
+
+# Champs renvoyés par les listes de navigation
+BROWSE_PROJECTION = {
+    "title": 1,
+    "alt_title": 1,
+    "url": 1,
+    "image_url": 1,
+    "cover_thumbnails": 1,
+    "genres": 1,
+    "type": 1,
+    "language": 1,
+    "total_chapters": 1,
+}
+
+# Ordre de tri des chapitres, aligné sur CHAPTER_SORT_INDEX
+CHAPTER_SORT = [
+    ("scan_name", pymongo.ASCENDING),
+    ("number_sort", pymongo.ASCENDING),
+    ("number", pymongo.ASCENDING),
+]
+
+
+def ensure_read_indexes():
+    """
+    Crée les index nécessaires aux requêtes du service de lecture.
+    """
+    ensure_manga_id_indexes()
+    ensure_browse_indexes()
+    get_planning_collection().create_index(
+        [("day", pymongo.ASCENDING), ("time", pymongo.ASCENDING)]
+    )
+    get_homepage_collection().create_index([("scraped_at", pymongo.DESCENDING)])
+
+
+def chapter_position(chapter):
+    """Position d'un chapitre dans l'ordre de tri (scan_name, number_sort, number)."""
+    return (chapter["scan_name"], chapter["number_sort"], chapter["number"])
+
+
+def encode_cursor(values):
+    """Encode la position de la dernière entrée renvoyée en curseur opaque."""
+    raw = json.dumps(values, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Décode un curseur produit par encode_cursor()."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Curseur invalide: {cursor}") from e
+
+
+def compute_etag(body):
+    """Calcule un ETag fort à partir du contenu sérialisé de la réponse."""
+    payload = json_util.dumps(body, sort_keys=True).encode("utf-8")
+    return '"' + hashlib.sha1(payload).hexdigest() + '"'
+
+
+class ReadService:
+    """
+    Service de lecture avec cache mémoire.
+
+    Args:
+        maxsize (int): Nombre maximum de réponses gardées en cache
+        ttl (float): Durée de vie d'une réponse en cache (secondes)
+        version_check_interval (float): Intervalle entre deux synchronisations
+            des versions de cache écrites par le scraper
+    """
+
+    def __init__(
+        self,
+        maxsize=2048,
+        ttl=DEFAULT_TTL,
+        version_check_interval=VERSION_CHECK_INTERVAL,
+    ):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.pages = PageResolver()
+        self.version_check_interval = version_check_interval
+        self._versions = None
+        self._last_version_check = 0.0
+
+    async def ensure_indexes(self):
+        """Crée les index nécessaires (à appeler au démarrage du service)."""
+        await asyncio.to_thread(ensure_read_indexes)
+
+    async def _sync_versions(self):
+        """
+        Invalide les namespaces dont la version a changé en base depuis la
+        dernière vérification (écritures faites par un autre processus).
+        """
+        now = time.monotonic()
+        if now - self._last_version_check < self.version_check_interval:
+            return
+        self._last_version_check = now
+
+        try:
+            docs = await asyncio.to_thread(
+                lambda: list(get_cache_state_collection().find({}, {"version": 1}))
+            )
+        except Exception as e:
+            print(f"Erreur lors de la lecture des versions de cache: {e}")
+            return
+
+        versions = {doc["_id"]: doc.get("version", 0) for doc in docs}
+        if self._versions is not None:
+            changed = [
+                namespace
+                for namespace, version in versions.items()
+                if self._versions.get(namespace) != version
+            ]
+            if changed:
+                self.cache.invalidate(*changed)
+        self._versions = versions
+
+    async def _cached(self, key, loader, if_none_match=None):
+        """
+        Retourne la réponse associée à `key`, en appelant `loader` (synchrone,
+        exécuté dans un thread) en cas d'absence dans le cache.
+
+        `loader` retourne un tuple (body, next_cursor).
+        """
+        await self._sync_versions()
+
+        entry = self.cache.get(key)
+        if entry is None:
+            body, next_cursor = await asyncio.to_thread(loader)
+            entry = (body, compute_etag(body), next_cursor)
+            self.cache.set(key, entry)
+
+        body, etag, next_cursor = entry
+        # Une ressource absente n'a pas d'ETag : jamais de 304 pour un 404
+        if body is None:
+            return ReadResponse(404, None, None, None)
+        if if_none_match is not None and if_none_match == etag:
+            return ReadResponse(304, None, etag, next_cursor)
+        return ReadResponse(200, body, etag, next_cursor)
+
+    async def get_manga(self, title, if_none_match=None):
+        """
+        Retourne le document d'un manga par son titre.
+
+        Args:
+            title (str): Titre exact du manga
+            if_none_match (str): ETag connu du client
+
+        Returns:
+            ReadResponse: status 200, 304 ou 404
+        """
+
+        def load():
+            doc = get_manga_collection().find_one({"title": title})
+            if doc is not None:
+                manga_id = doc.pop("_id")
+                if isinstance(manga_id, int):
+                    doc["manga_id"] = manga_id
+            return doc, None
+
+        return await self._cached(("mangas", "manga", title), load, if_none_match)
+
+    async def get_chapters(
+        self,
+        manga_title,
+        scan_name=None,
+        cursor=None,
+        limit=DEFAULT_PAGE_SIZE,
+        if_none_match=None,
+    ):
+        """
+        Retourne une page de chapitres d'un manga, triée par type de scan
+        puis par numéro réel.
+
+        Args:
+            manga_title (str): Titre du manga
+            scan_name (str): Type de scan (optionnel)
+            cursor (str): Curseur renvoyé par la page précédente
+            limit (int): Taille de la page (plafonnée à MAX_PAGE_SIZE)
+            if_none_match (str): ETag connu du client
+
+        Returns:
+            ReadResponse: `next_cursor` vaut None sur la dernière page
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        def load():
+            if use_chapter_buckets():
+                # Un bucket par type de scan : la page est découpée en mémoire
+                docs = find_chapters(manga_title, scan_name)
+                if cursor:
+                    last = tuple(decode_cursor(cursor))
+                    docs = [doc for doc in docs if chapter_position(doc) > last]
+            else:
+                docs = self._find_chapter_page(manga_title, scan_name, cursor, limit)
+
+            next_cursor = None
+            if len(docs) > limit:
+                docs = docs[:limit]
+                next_cursor = encode_cursor(list(chapter_position(docs[-1])))
+            return docs, next_cursor
+
+        key = ("chapters", manga_title, scan_name, cursor, limit)
+        return await self._cached(key, load, if_none_match)
+
+    def _find_chapter_page(self, manga_title, scan_name, cursor, limit):
+        """Lit limit + 1 documents chapitres après le curseur, via l'index."""
+        query = chapter_owner_query(manga_title)
+        if scan_name:
+            query["scan_name"] = scan_name
+        if cursor:
+            last_scan, last_sort, last_number = decode_cursor(cursor)
+            query["$or"] = [
+                {"scan_name": {"$gt": last_scan}},
+                {"scan_name": last_scan, "number_sort": {"$gt": last_sort}},
+                {
+                    "scan_name": last_scan,
+                    "number_sort": last_sort,
+                    "number": {"$gt": last_number},
+                },
+            ]
+
+        return list(
+            get_chapters_collection()
+            .find(query, {"_id": 0})
+            .sort(CHAPTER_SORT)
+            .limit(limit + 1)
+        )
+
+    async def get_chapters_range(
+        self,
+        manga_title,
+        scan_name,
+        after=None,
+        until=None,
+        limit=DEFAULT_PAGE_SIZE,
+        if_none_match=None,
+    ):
+        """
+        Retourne les chapitres d'un type de scan dont le numéro est dans
+        l'intervalle ]after, until], en ordre croissant.
+
+        Args:
+            manga_title (str): Titre du manga
+            scan_name (str): Type de scan
+            after (float): Borne basse exclue (optionnelle)
+            until (float): Borne haute incluse (optionnelle)
+            limit (int): Nombre maximum de chapitres (plafonné à MAX_PAGE_SIZE)
+            if_none_match (str): ETag connu du client
+
+        Returns:
+            ReadResponse
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        def load():
+            if use_chapter_buckets():
+                docs = [
+                    doc
+                    for doc in find_chapters(manga_title, scan_name)
+                    if (after is None or doc["number_sort"] > float(after))
+                    and (until is None or doc["number_sort"] <= float(until))
+                ]
+                return docs[:limit], None
+
+            query = dict(chapter_owner_query(manga_title), scan_name=scan_name)
+            bounds = {}
+            if after is not None:
+                bounds["$gt"] = float(after)
+            if until is not None:
+                bounds["$lte"] = float(until)
+            if bounds:
+                query["number_sort"] = bounds
+            docs = list(
+                get_chapters_collection()
+                .find(query, {"_id": 0})
+                .sort(CHAPTER_SORT)
+                .limit(limit)
+            )
+            return docs, None
+
+        key = ("chapters", "range", manga_title, scan_name, after, until, limit)
+        return await self._cached(key, load, if_none_match)
+
+    async def get_latest_chapters(
+        self, manga_title, scan_name, count=1, if_none_match=None
+    ):
+        """
+        Retourne les `count` derniers chapitres d'un type de scan, du plus
+        récent au plus ancien (parcours inverse de l'index).
+
+        Args:
+            manga_title (str): Titre du manga
+            scan_name (str): Type de scan
+            count (int): Nombre de chapitres (plafonné à MAX_PAGE_SIZE)
+            if_none_match (str): ETag connu du client
+
+        Returns:
+            ReadResponse
+        """
+        count = max(1, min(int(count), MAX_PAGE_SIZE))
+
+        def load():
+            if use_chapter_buckets():
+                docs = [
+                    doc
+                    for doc in find_chapters(manga_title, scan_name)
+                    if doc["number_sort"] != float("inf")
+                ]
+                return docs[::-1][:count], None
+
+            docs = list(
+                get_chapters_collection()
+                .find(
+                    dict(
+                        chapter_owner_query(manga_title),
+                        scan_name=scan_name,
+                        number_sort={"$ne": float("inf")},
+                    ),
+                    {"_id": 0},
+                )
+                .sort([(field, pymongo.DESCENDING) for field, _ in CHAPTER_SORT])
+                .limit(count)
+            )
+            return docs, None
+
+        key = ("chapters", "latest", manga_title, scan_name, count)
+        return await self._cached(key, load, if_none_match)
+
+    async def browse_mangas(
+        self,
+        type=None,
+        language=None,
+        genre=None,
+        cursor=None,
+        limit=DEFAULT_PAGE_SIZE,
+        if_none_match=None,
+    ):
+        """
+        Liste les mangas d'un type, d'une langue et/ou d'un genre, triés par
+        titre. La requête ne lit que l'index (browse_keys, title, _id) et les
+        documents de la page.
+
+        Args:
+            type (str): Type (ex. "Manhwa"), normalisé avant la requête
+            language (str): Langue (ex. "VF")
+            genre (str): Genre (ex. "Action")
+            cursor (str): Curseur renvoyé par la page précédente
+            limit (int): Taille de la page (plafonnée à MAX_PAGE_SIZE)
+            if_none_match (str): ETag connu du client
+
+        Returns:
+            ReadResponse: `next_cursor` vaut None sur la dernière page
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        key = browse_key(
+            type=normalize_facet_value(type),
+            language=normalize_facet_value(language),
+            genre=normalize_facet_value(genre),
+        )
+
+        def load():
+            query = {"browse_keys": key}
+            if cursor:
+                last_title, last_id = json_util.loads(json.dumps(decode_cursor(cursor)))
+                query["$or"] = [
+                    {"title": {"$gt": last_title}},
+                    {"title": last_title, "_id": {"$gt": last_id}},
+                ]
+            docs = list(
+                get_manga_collection()
+                .find(query, BROWSE_PROJECTION)
+                .sort(BROWSE_INDEX[1:])
+                .hint(BROWSE_INDEX)
+                .limit(limit + 1)
+            )
+
+            next_cursor = None
+            if len(docs) > limit:
+                docs = docs[:limit]
+                last = [docs[-1]["title"], docs[-1]["_id"]]
+                next_cursor = encode_cursor(json.loads(json_util.dumps(last)))
+            for doc in docs:
+                manga_id = doc.pop("_id")
+                if isinstance(manga_id, int):
+                    doc["manga_id"] = manga_id
+            return docs, next_cursor
+
+        return await self._cached(("mangas", "browse", key, cursor, limit), load, if_none_match)
+
+    async def get_facets(self, dimension, type=None, language=None, genre=None, if_none_match=None):
+        """
+        Compteurs de mangas par valeur d'une dimension, éventuellement dans
+        le périmètre des autres filtres (ex. genres des Manhwa), du plus
+        fréquent au moins fréquent.
+
+        Args:
+            dimension (str): "type", "language" ou "genre"
+            type, language, genre (str): Filtres du périmètre (celui de
+                `dimension` est ignoré)
+            if_none_match (str): ETag connu du client
+
+        Returns:
+            ReadResponse: Liste de {"value", "label", "count"}
+        """
+        if dimension not in BROWSE_DIMENSIONS:
+            raise ValueError(f"Dimension inconnue: {dimension}")
+        filters = {"type": type, "language": language, "genre": genre}
+        filters[dimension] = None
+        scope = f"{dimension}@" + browse_key(
+            **{name: normalize_facet_value(value) for name, value in filters.items()}
+        )
+
+        def load():
+            docs = (
+                get_facets_collection()
+                .find({"scopes": scope, "count": {"$gt": 0}}, {"filters": 1, "labels": 1, "count": 1})
+                .sort("count", pymongo.DESCENDING)
+            )
+            return [
+                {
+                    "value": doc["filters"][dimension],
+                    "label": doc["labels"].get(dimension, doc["filters"][dimension]),
+                    "count": doc["count"],
+                }
+                for doc in docs
+            ], None
+
+        return await self._cached(("mangas", "facets", scope), load, if_none_match)
+
+    async def get_planning(self, day=None, if_none_match=None):
+        """
+        Retourne le planning des sorties, éventuellement filtré sur un jour.
+
+        Args:
+            day (str): Jour du planning (optionnel)
+            if_none_match (str): ETag connu du client
+
+        Returns:
+            ReadResponse
+        """
+
+        def load():
+            query = {"day": day} if day else {}
+            docs = list(
+                get_planning_collection()
+                .find(query, {"_id": 0})
+                .sort([("day", pymongo.ASCENDING), ("time", pymongo.ASCENDING)])
+            )
+            return docs, None
+
+        return await self._cached(("planning", day), load, if_none_match)
+
+    async def get_latest_homepage(self, if_none_match=None):
+        """
+        Retourne les dernières données de homepage scrapées.
+
+        Args:
+            if_none_match (str): ETag connu du client
+
+        Returns:
+            ReadResponse: status 200, 304 ou 404
+        """
+
+        def load():
+            doc = get_homepage_collection().find_one(
+                {}, {"_id": 0}, sort=[("scraped_at", pymongo.DESCENDING)]
+            )
+            return doc, None
+
+        return await self._cached(("homepage", "latest"), load, if_none_match)
+
+    async def get_chapter_pages(self, manga_title, scan_name, number, if_none_match=None):
+        """
+        Retourne les URLs des pages d'un chapitre, extraites à la demande de
+        episodes.js (voir page_resolver.py).
+
+        Args:
+            manga_title (str): Titre du manga
+            scan_name (str): Type de scan (ex: "Scan VF")
+            number (str): Numéro du chapitre
+            if_none_match (str): ETag connu du client
+
+        Returns:
+            ReadResponse: status 200, 304 ou 404 (body: liste d'URLs)
+        """
+        body = await asyncio.to_thread(self.pages.resolve, manga_title, scan_name, number)
+        if body is None:
+            return ReadResponse(404, None, None, None)
+        etag = compute_etag(body)
+        if if_none_match is not None and if_none_match == etag:
+            return ReadResponse(304, None, etag, None)
+        return ReadResponse(200, body, etag, None)
+
+    def stats(self):
+        """Retourne les compteurs du cache (hits, misses, entrées) et du résolveur de pages."""
+        return {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "entries": len(self.cache),
+            "pages": self.pages.stats(),
+        }
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Politique de revisite par titre, apprise à partir des mises à jour observées.
+
+À chaque passage sur un manga, son `total_chapters` est comparé à celui du
+passage précédent et l'observation est ajoutée à son historique (collection
+`revisit_history`, un document par manga_id). Le taux de mise à jour est
+estimé comme celui d'un processus de Poisson observé à intervalles
+irréguliers :
+
+    taux = -ln((n - X + 0.5) / (n + 0.5)) / intervalle moyen
+
+avec n intervalles observés et X intervalles avec au moins un nouveau
+chapitre. La prochaine visite est planifiée à REVISIT_FRACTION / taux, bornée
+entre MIN_REVISIT_HOURS et MAX_STALENESS_DAYS : une série hebdomadaire est
+revisitée souvent, une série terminée seulement une fois par MAX_STALENESS_DAYS.
+
+Tant qu'aucune mise à jour n'a été observée (taux nul), notamment pour un
+titre qui vient d'entrer dans l'historique, le délai part de
+MIN_REVISIT_HOURS et est multiplié par REVISIT_BACKOFF à chaque passage sans
+changement ; il ne passe à MAX_STALENESS_DAYS qu'après
+REVISIT_UNCHANGED_LIMIT passages consécutifs sans changement.
+"""
+
+import math
+import os
+from datetime import datetime, timedelta
+
+import pymongo
+
+from add_to_db import get_manga_collection, get_revisit_history_collection, load_env
+from models import catalogue_slug, manga_id_from_url
+
+# Nombre d'observations conservées dans l'historique de chaque manga
+HISTORY_SIZE = 20
+
+
+def get_policy_settings():
+    """
+    Paramètres de la politique (variables d'environnement).
+
+    Returns:
+        dict: min_interval (timedelta), max_staleness (timedelta), fraction (float),
+            backoff (float), unchanged_limit (int)
+    """
+    load_env()
+    return {
+        "min_interval": timedelta(hours=float(os.getenv("MIN_REVISIT_HOURS", "12"))),
+        "max_staleness": timedelta(days=float(os.getenv("MAX_STALENESS_DAYS", "30"))),
+        "fraction": float(os.getenv("REVISIT_FRACTION", "0.5")),
+        "backoff": float(os.getenv("REVISIT_BACKOFF", "2")),
+        "unchanged_limit": int(os.getenv("REVISIT_UNCHANGED_LIMIT", "5")),
+    }
+
+
+def estimate_rate(intervals, changes, observed_days):
+    """
+    Estime le nombre de mises à jour par jour d'un manga.
+
+    Args:
+        intervals (int): Nombre d'intervalles entre deux observations
+        changes (int): Intervalles pendant lesquels le total de chapitres a changé
+        observed_days (float): Durée totale observée (jours)
+
+    Returns:
+        float: Mises à jour par jour (0 si aucune n'a été observée)
+    """
+    if intervals <= 0 or observed_days <= 0 or changes <= 0:
+        return 0.0
+    mean_interval = observed_days / intervals
+    return -math.log((intervals - changes + 0.5) / (intervals + 0.5)) / mean_interval
+
+
+def next_visit_delay(rate, settings, unchanged=0):
+    """
+    Délai avant la prochaine visite.
+
+    Args:
+        rate (float): Mises à jour par jour (voir estimate_rate)
+        settings (dict): Paramètres de get_policy_settings
+        unchanged (int): Passages consécutifs sans changement
+
+    Returns:
+        timedelta: Délai, entre min_interval et max_staleness
+    """
+    if rate <= 0:
+        if unchanged >= settings["unchanged_limit"]:
+            return settings["max_staleness"]
+        delay = settings["min_interval"] * settings["backoff"] ** unchanged
+        return min(settings["max_staleness"], delay)
+    delay = timedelta(days=settings["fraction"] / rate)
+    return max(settings["min_interval"], min(settings["max_staleness"], delay))
+
+
+def is_enabled():
+    """La politique est active sauf si REVISIT_POLICY=off."""
+    load_env()
+    return os.getenv("REVISIT_POLICY", "on").lower() not in ("off", "0", "false", "no")
+
+
+def record_observations(mangas):
+    """
+    Ajoute une observation à l'historique des mangas visités, à partir de
+    leur `total_chapters` en base (à appeler après insert_mangas_to_db), et
+    replanifie leur prochaine visite.
+
+    Args:
+        mangas (list): Mangas visités (dictionnaires ou Manga)
+
+    Returns:
+        int: Nombre d'historiques mis à jour
+    """
+    manga_ids = {manga_id_from_url(manga.get("url")) for manga in mangas}
+    manga_ids = [manga_id for manga_id in manga_ids if manga_id is not None]
+    if not manga_ids:
+        return 0
+    settings = get_policy_settings()
+    history_collection = get_revisit_history_collection()
+    histories = {
+        doc["_id"]: doc
+        for doc in history_collection.find({"_id": {"$in": manga_ids}}, {"observations": 0})
+    }
+
+    now = datetime.now()
+    operations = []
+    for manga in get_manga_collection().find(
+        {"_id": {"$in": manga_ids}}, {"title": 1, "total_chapters": 1}
+    ):
+        total = manga.get("total_chapters", 0)
+        history = histories.get(manga["_id"])
+        if history is None:
+            state = {
+                "first_checked": now,
+                "intervals": 0,
+                "changes": 0,
+                "unchanged": 0,
+                "last_changed": None,
+            }
+        else:
+            state = {
+                "first_checked": history["first_checked"],
+                "intervals": history.get("intervals", 0) + 1,
+                "changes": history.get("changes", 0),
+                "unchanged": history.get("unchanged", 0) + 1,
+                "last_changed": history.get("last_changed"),
+            }
+            if total != history.get("last_total"):
+                state["changes"] += 1
+                state["unchanged"] = 0
+                state["last_changed"] = now
+
+        observed_days = (now - state["first_checked"]).total_seconds() / 86400
+        rate = estimate_rate(state["intervals"], state["changes"], observed_days)
+        state.update(
+            {
+                "title": manga.get("title"),
+                "last_total": total,
+                "last_checked": now,
+                "rate_per_day": rate,
+                "next_visit": now + next_visit_delay(rate, settings, state["unchanged"]),
+            }
+        )
+        operations.append(
+            pymongo.UpdateOne(
+                {"_id": manga["_id"]},
+                {
+                    "$set": state,
+                    "$push": {
+                        "observations": {
+                            "$each": [{"at": now, "total_chapters": total}],
+                            "$slice": -HISTORY_SIZE,
+                        }
+                    },
+                },
+                upsert=True,
+            )
+        )
+
+    if operations:
+        history_collection.create_index([("next_visit", pymongo.ASCENDING)])
+        history_collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def select_due_mangas(mangas, always_slugs=()):
+    """
+    Sépare les mangas à visiter maintenant de ceux dont la prochaine visite
+    n'est pas encore due.
+
+    Un manga sans historique, ou signalé par `always_slugs` (homepage,
+    planning), est toujours visité. Avec REVISIT_POLICY=off, tous le sont.
+
+    Args:
+        mangas (list): Mangas du catalogue (dictionnaires ou Manga)
+        always_slugs (iterable): Slugs à visiter quelle que soit la politique
+
+    Returns:
+        tuple: (mangas à visiter, nombre de mangas reportés)
+    """
+    if not is_enabled():
+        return list(mangas), 0
+    always_slugs = set(always_slugs)
+    now = datetime.now()
+    not_due = {
+        doc["_id"]
+        for doc in get_revisit_history_collection().find(
+            {"next_visit": {"$gt": now}}, {"_id": 1}
+        )
+    }
+    due = []
+    nb_deferred = 0
+    for manga in mangas:
+        url = manga.get("url")
+        if catalogue_slug(url) not in always_slugs and manga_id_from_url(url) in not_due:
+            nb_deferred += 1
+            continue
+        due.append(manga)
+    return due, nb_deferred
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exécution d'un job sous forme de graphe d'étapes.
+
+Chaque étape déclare les étapes dont elle dépend :
+
+- `after` : l'étape démarre quand ces étapes sont terminées avec succès ;
+- `streams` : l'étape démarre dès que ces étapes ont démarré, et consomme
+  au fil de l'eau les éléments qu'elles émettent (ctx.emit / ctx.stream).
+
+Les branches indépendantes tournent en parallèle (une étape à la fois avec
+run(sequential=True), ex. pour le profilage). Une étape en échec (exception
+ou retour False, comme les jobs de daily_scraper) fait sauter les étapes qui en
+dépendent. Le résumé donne le statut et la durée de chaque étape, ainsi que le
+chemin critique : la chaîne de dépendances qui a fixé la durée du job.
+"""
+
+import queue
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+PENDING = "en attente"
+RUNNING = "en cours"
+DONE = "terminée"
+FAILED = "en échec"
+SKIPPED = "sautée"
+
+# Fin du flux d'une étape
+_END = object()
+
+
+class Stage:
+    """Étape du graphe, avec son statut et ses horodatages."""
+
+    def __init__(self, name, func, after=(), streams=()):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.streams = tuple(streams)
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.channel = queue.Queue()
+
+    @property
+    def dependencies(self):
+        return self.after + self.streams
+
+    @property
+    def seconds(self):
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class StageContext:
+    """
+    Contexte passé à la fonction d'une étape.
+
+    Attributes:
+        results (dict): Résultats des étapes terminées (nom -> valeur retournée)
+    """
+
+    def __init__(self, graph, stage):
+        self.results = graph.results
+        self._graph = graph
+        self._stage = stage
+
+    def emit(self, item):
+        """Transmet un élément aux étapes qui consomment le flux de cette étape."""
+        self._stage.channel.put(item)
+
+    def stream(self, name):
+        """
+        Itère sur les éléments émis par l'étape `name` jusqu'à sa fin.
+        Un flux n'a qu'un seul consommateur.
+
+        Raises:
+            RuntimeError: Si l'étape productrice a échoué
+        """
+        producer = self._graph.stages[name]
+        while True:
+            item = producer.channel.get()
+            if item is _END:
+                break
+            yield item
+        if producer.status != DONE:
+            raise RuntimeError(f"Étape '{name}' {producer.status}")
+
+
+class StageGraph:
+    """
+    Graphe d'étapes d'un job.
+
+    Args:
+        name (str): Nom du job (pour les logs)
+    """
+
+    def __init__(self, name="job"):
+        self.name = name
+        self.stages = {}
+        self.results = {}
+        self.started_at = None
+        self.finished_at = None
+
+    def add(self, name, func, after=(), streams=()):
+        """
+        Ajoute une étape.
+
+        Args:
+            name (str): Nom de l'étape
+            func (callable): Appelée avec un StageContext ; False ou une exception = échec
+            after (iterable): Étapes à terminer avant de démarrer
+            streams (iterable): Étapes dont le flux d'éléments est consommé
+        """
+        for dependency in tuple(after) + tuple(streams):
+            if dependency not in self.stages:
+                raise ValueError(f"Étape inconnue: {dependency} (déclarer les étapes dans l'ordre)")
+        self.stages[name] = Stage(name, func, after, streams)
+        return self
+
+    def _ready(self, stage, sequential=False):
+        # En mode séquentiel, un consommateur attend la fin de ses producteurs
+        # (leurs éléments restent dans la file)
+        started = (DONE,) if sequential else (RUNNING, DONE)
+        return all(self.stages[name].status == DONE for name in stage.after) and all(
+            self.stages[name].status in started for name in stage.streams
+        )
+
+    def _blocked(self, stage):
+        return any(self.stages[name].status in (FAILED, SKIPPED) for name in stage.dependencies)
+
+    def _run_stage(self, stage):
+        try:
+            result = stage.func(StageContext(self, stage))
+            stage.result = result
+            stage.status = FAILED if result is False else DONE
+        except Exception as e:
+            stage.error = e
+            stage.status = FAILED
+            print(f"Étape '{stage.name}' en échec: {e}")
+            traceback.print_exc()
+        finally:
+            stage.finished_at = time.monotonic()
+            if stage.status == DONE:
+                self.results[stage.name] = stage.result
+            stage.channel.put(_END)
+
+    def run(self, sequential=False):
+        """
+        Exécute le graphe.
+
+        Args:
+            sequential (bool): Exécuter une étape à la fois, dans l'ordre de
+                déclaration (ex. profilage : cProfile ne suit que le thread
+                de l'étape et le pic mémoire est celui du processus)
+
+        Returns:
+            bool: True si toutes les étapes sont terminées avec succès
+        """
+        self.started_at = time.monotonic()
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=len(self.stages) or 1, thread_name_prefix=self.name) as executor:
+            while True:
+                for stage in self.stages.values():
+                    if stage.status != PENDING:
+                        continue
+                    if self._blocked(stage):
+                        stage.status = SKIPPED
+                        stage.channel.put(_END)
+                    elif sequential and in_flight:
+                        continue
+                    elif self._ready(stage, sequential):
+                        stage.status = RUNNING
+                        stage.started_at = time.monotonic()
+                        in_flight[executor.submit(self._run_stage, stage)] = stage
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.pop(future)
+        self.finished_at = time.monotonic()
+        return all(stage.status == DONE for stage in self.stages.values())
+
+    def critical_path(self):
+        """
+        Chaîne d'étapes qui a fixé la durée du job : depuis l'étape terminée
+        en dernier, on remonte à chaque fois vers la dépendance terminée en
+        dernier.
+
+        Returns:
+            list: Étapes du chemin critique, de la première à la dernière
+        """
+        finished = [stage for stage in self.stages.values() if stage.finished_at is not None]
+        if not finished:
+            return []
+        stage = max(finished, key=lambda stage: stage.finished_at)
+        path = [stage]
+        while True:
+            dependencies = [
+                self.stages[name]
+                for name in stage.dependencies
+                if self.stages[name].finished_at is not None
+            ]
+            if not dependencies:
+                break
+            stage = max(dependencies, key=lambda stage: stage.finished_at)
+            path.append(stage)
+        return path[::-1]
+
+    def summary(self):
+        """Résumé lisible : statut et durée de chaque étape, puis chemin critique."""
+        lines = []
+        for stage in self.stages.values():
+            line = f"- {stage.name}: {stage.status}"
+            if stage.started_at is not None:
+                line += f" ({stage.seconds:.1f}s)"
+            if stage.error is not None:
+                line += f" - {stage.error}"
+            lines.append(line)
+        path = self.critical_path()
+        if path and self.started_at is not None and self.finished_at is not None:
+            lines.append(
+                f"Chemin critique: {' -> '.join(stage.name for stage in path)} "
+                f"({self.finished_at - self.started_at:.1f}s)"
+            )
+        return "\n".join(lines)
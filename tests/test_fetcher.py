@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import fetcher
+from fetcher import Fetcher, canonical_url
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://anime-sama.fr/catalogue/dr.stone", "https://anime-sama.fr/catalogue/dr.stone/"),
+        ("https://anime-sama.fr/catalogue/dr.stone/", "https://anime-sama.fr/catalogue/dr.stone/"),
+        ("HTTPS://Anime-Sama.fr//catalogue//one-piece", "https://anime-sama.fr/catalogue/one-piece/"),
+        ("https://anime-sama.fr/catalogue/one-piece/#scans", "https://anime-sama.fr/catalogue/one-piece/"),
+        (
+            "https://anime-sama.fr/s2/scans/One%20Piece/episodes.js?v=2&filever=1712",
+            "https://anime-sama.fr/s2/scans/One%20Piece/episodes.js?filever=1712&v=2",
+        ),
+        ("https://x/pages/1.JPG", "https://x/pages/1.JPG"),
+        ("https://anime-sama.fr", "https://anime-sama.fr/"),
+    ],
+)
+def test_canonical_url(url, expected):
+    assert canonical_url(url) == expected
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, url):
+        self.text = url
+
+
+def fake_http(monkeypatch, requested, release=None, error=None):
+    def fake_request(method, url, session=None, deadline=None, **kwargs):
+        requested.append((method, url))
+        if release is not None:
+            release.wait(5)
+        if error is not None:
+            raise error
+        return FakeResponse(url)
+
+    monkeypatch.setattr(fetcher, "http_request", fake_request)
+
+
+def fetch_concurrently(fetch, count):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(index):
+        try:
+            results[index] = fetch()
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("condition jamais atteinte")
+
+
+def test_concurrent_requests_are_coalesced(monkeypatch):
+    requested = []
+    release = threading.Event()
+    fake_http(monkeypatch, requested, release)
+    client = Fetcher(hedge=False)
+
+    threads, results, errors = fetch_concurrently(
+        lambda: client.get("https://anime-sama.fr/catalogue/dr.stone", lambda r: r.text), 3
+    )
+    wait_for(lambda: client.stats["coalesced"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert requested == [("GET", "https://anime-sama.fr/catalogue/dr.stone")]
+    assert errors == [None, None, None]
+    assert results == ["https://anime-sama.fr/catalogue/dr.stone"] * 3
+    assert client.stats["requests"] == 1
+
+
+def test_completed_result_is_reused(monkeypatch):
+    requested = []
+    fake_http(monkeypatch, requested)
+    client = Fetcher(hedge=False)
+
+    first = client.get("https://anime-sama.fr/catalogue/dr.stone", lambda r: r.text)
+    second = client.get("https://anime-sama.fr/catalogue/dr.stone/", lambda r: r.text)
+    client.get("https://anime-sama.fr/catalogue/dr.stone/", lambda r: r.status_code, key="status")
+    client.head("https://anime-sama.fr/catalogue/dr.stone/")
+
+    assert first == second
+    assert len(requested) == 3
+    assert client.stats["reused"] == 1
+    assert client.duplicates == 1
+
+
+def test_errors_are_shared_then_retried(monkeypatch):
+    requested = []
+    release = threading.Event()
+    fake_http(monkeypatch, requested, release, error=requests.exceptions.ConnectionError("refusé"))
+    client = Fetcher(hedge=False)
+
+    threads, results, errors = fetch_concurrently(
+        lambda: client.get("https://anime-sama.fr/catalogue/one-piece/"), 2
+    )
+    wait_for(lambda: client.stats["coalesced"] == 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(requested) == 1
+    assert all(isinstance(error, requests.exceptions.ConnectionError) for error in errors)
+    assert client.stats["errors"] == 1
+
+    # Un échec n'est pas mis en cache : la requête suivante est renvoyée
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get("https://anime-sama.fr/catalogue/one-piece/")
+    assert len(requested) == 2
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import page_resolver
+from page_resolver import PageResolver
+
+# Document tel qu'écrit par insert_mangas_to_db : scan_types = {name, url},
+# id_scan et episodes_url uniquement dans scan_chapters
+MANGA = {
+    "_id": 123,
+    "title": "One Piece",
+    "scan_types": [
+        {"name": "Scan VF", "url": "https://anime-sama.fr/catalogue/one-piece/scan/vf/"},
+        {"name": "Scan VUS", "url": "https://anime-sama.fr/catalogue/one-piece/scan/vus/"},
+    ],
+    "scan_chapters": [
+        {
+            "name": "Scan VF",
+            "url": "https://anime-sama.fr/catalogue/one-piece/scan/vf/",
+            "id_scan": "1712",
+            "episodes_url": "https://anime-sama.fr/s2/scans/One%20Piece/episodes.js?filever=1712",
+            "total_chapters": 2,
+            "chapters_count": 2,
+        },
+    ],
+}
+
+EPISODES_JS = """
+var eps1 = ['https://drive.google.com/uc?export=view&id=abc', 'https://x/2.jpg'];
+var eps2 = ['https://x/3.jpg'];
+"""
+
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find_one(self, query, projection=None):
+        return next((doc for doc in self.documents if doc["title"] == query["title"]), None)
+
+
+class FakeResponse:
+    status_code = 200
+    text = EPISODES_JS
+    headers = {"ETag": '"v1"'}
+
+    def raise_for_status(self):
+        pass
+
+
+def make_resolver(monkeypatch, requested):
+    monkeypatch.setattr(page_resolver, "get_manga_collection", lambda: FakeCollection([MANGA]))
+
+    def fake_request(method, url, session=None, **kwargs):
+        requested.append(url)
+        return FakeResponse()
+
+    monkeypatch.setattr(page_resolver, "http_request", fake_request)
+    return PageResolver(maxsize=4, revalidate_seconds=300)
+
+
+def test_find_episodes_url_reads_scan_chapters(monkeypatch):
+    resolver = make_resolver(monkeypatch, [])
+    assert resolver.find_episodes_url("One Piece", "Scan VF") == MANGA["scan_chapters"][0]["episodes_url"]
+
+
+def test_find_episodes_url_falls_back_to_scan_types_url(monkeypatch):
+    resolver = make_resolver(monkeypatch, [])
+    url = resolver.find_episodes_url("One Piece", "Scan VUS")
+    assert url is not None
+    assert url.endswith("/episodes.js")
+    assert "filever" not in url
+
+
+def test_find_episodes_url_unknown(monkeypatch):
+    resolver = make_resolver(monkeypatch, [])
+    assert resolver.find_episodes_url("One Piece", "Scan VO") is None
+    assert resolver.find_episodes_url("Naruto", "Scan VF") is None
+
+
+def test_resolve_downloads_once(monkeypatch):
+    requested = []
+    resolver = make_resolver(monkeypatch, requested)
+    assert resolver.resolve("One Piece", "Scan VF", 1) == [
+        "https://drive.usercontent.google.com/download?id=abc&export=view&authuser=0",
+        "https://x/2.jpg",
+    ]
+    assert resolver.resolve("One Piece", "Scan VF", "2") == ["https://x/3.jpg"]
+    assert resolver.resolve("One Piece", "Scan VF", 3) is None
+    assert requested == [MANGA["scan_chapters"][0]["episodes_url"]]
+
+
+def test_concurrent_loads_share_one_download_and_drop_their_lock(monkeypatch):
+    requested = []
+    resolver = make_resolver(monkeypatch, requested)
+    fake_request = page_resolver.http_request
+
+    def slow_request(method, url, session=None, **kwargs):
+        time.sleep(0.1)
+        return fake_request(method, url, session, **kwargs)
+
+    monkeypatch.setattr(page_resolver, "http_request", slow_request)
+    threads = [
+        threading.Thread(target=resolver.resolve, args=("One Piece", "Scan VF", 1)) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert requested == [MANGA["scan_chapters"][0]["episodes_url"]]
+    assert resolver._locks == {}
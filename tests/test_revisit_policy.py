@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import revisit_policy
+from models import manga_id_from_url
+from revisit_policy import estimate_rate, get_policy_settings, next_visit_delay, select_due_mangas
+
+SETTINGS = {
+    "min_interval": timedelta(hours=12),
+    "max_staleness": timedelta(days=30),
+    "fraction": 0.5,
+    "backoff": 2.0,
+    "unchanged_limit": 5,
+}
+
+ONE_PIECE = {"title": "One Piece", "url": "https://anime-sama.fr/catalogue/one-piece/"}
+NARUTO = {"title": "Naruto", "url": "https://anime-sama.fr/catalogue/naruto/"}
+DR_STONE = {"title": "Dr. Stone", "url": "https://anime-sama.fr/catalogue/dr.stone/"}
+
+
+def test_estimate_rate_without_changes():
+    assert estimate_rate(0, 0, 0) == 0.0
+    assert estimate_rate(4, 0, 10) == 0.0
+    assert estimate_rate(4, 2, 0) == 0.0
+    assert estimate_rate(4, 2, 8) > 0
+
+
+def test_zero_rate_backs_off():
+    assert next_visit_delay(0, SETTINGS, unchanged=0) == timedelta(hours=12)
+    assert next_visit_delay(0, SETTINGS, unchanged=1) == timedelta(hours=24)
+    assert next_visit_delay(0, SETTINGS, unchanged=3) == timedelta(hours=96)
+
+
+def test_zero_rate_backoff_is_capped():
+    # 12h * 2**4 = 8 jours, plafonné à 5 jours
+    settings = dict(SETTINGS, max_staleness=timedelta(days=5))
+    assert next_visit_delay(0, settings, unchanged=4) == timedelta(days=5)
+
+
+def test_zero_rate_reaches_max_staleness_after_unchanged_limit():
+    assert next_visit_delay(0, SETTINGS, unchanged=4) == timedelta(hours=12 * 16)
+    assert next_visit_delay(0, SETTINGS, unchanged=5) == timedelta(days=30)
+
+
+def test_delay_is_clamped():
+    # Plusieurs mises à jour par jour : jamais moins que MIN_REVISIT_HOURS
+    assert next_visit_delay(10, SETTINGS) == timedelta(hours=12)
+    # Une mise à jour par an : jamais plus que MAX_STALENESS_DAYS
+    assert next_visit_delay(1 / 365, SETTINGS) == timedelta(days=30)
+    # Hebdomadaire : la moitié de l'intervalle moyen
+    assert next_visit_delay(1 / 7, SETTINGS) == timedelta(days=3.5)
+
+
+def test_policy_settings_from_env(monkeypatch):
+    monkeypatch.setenv("MIN_REVISIT_HOURS", "6")
+    monkeypatch.setenv("MAX_STALENESS_DAYS", "10")
+    monkeypatch.setenv("REVISIT_UNCHANGED_LIMIT", "3")
+    settings = get_policy_settings()
+    assert settings["min_interval"] == timedelta(hours=6)
+    assert settings["max_staleness"] == timedelta(days=10)
+    assert settings["unchanged_limit"] == 3
+
+
+@pytest.fixture
+def history(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.revisit_history
+    now = datetime.now()
+    collection.insert_many(
+        [
+            {"_id": manga_id_from_url(ONE_PIECE["url"]), "next_visit": now + timedelta(days=2)},
+            {"_id": manga_id_from_url(NARUTO["url"]), "next_visit": now - timedelta(hours=1)},
+        ]
+    )
+    monkeypatch.setattr(revisit_policy, "get_revisit_history_collection", lambda: collection)
+    monkeypatch.setenv("REVISIT_POLICY", "on")
+    return collection
+
+
+def test_select_due_mangas(history):
+    due, nb_deferred = select_due_mangas([ONE_PIECE, NARUTO, DR_STONE])
+    # Naruto est dû, Dr. Stone n'a pas d'historique
+    assert due == [NARUTO, DR_STONE]
+    assert nb_deferred == 1
+
+
+def test_always_slugs_override_not_due(history):
+    due, nb_deferred = select_due_mangas([ONE_PIECE, NARUTO], always_slugs={"one-piece"})
+    assert due == [ONE_PIECE, NARUTO]
+    assert nb_deferred == 0
+
+
+def test_policy_off_visits_everything(history, monkeypatch):
+    monkeypatch.setenv("REVISIT_POLICY", "off")
+    due, nb_deferred = select_due_mangas([ONE_PIECE, NARUTO])
+    assert due == [ONE_PIECE, NARUTO]
+    assert nb_deferred == 0
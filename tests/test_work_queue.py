@@ -0,0 +1,137 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import work_queue
+from work_queue import (
+    MAX_ATTEMPTS,
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_LEASED,
+    STATUS_PENDING,
+    ack_item,
+    claim_item,
+    fail_item,
+    reclaim_expired_leases,
+    run_worker,
+)
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.crawl_queue
+    now = datetime.now()
+    # Éléments tels que déposés par enqueue_mangas
+    collection.insert_many(
+        [
+            {
+                "_id": f"run:{slug}",
+                "run_id": "run",
+                "status": STATUS_PENDING,
+                "manga": {"title": slug},
+                "attempts": 0,
+                "position": position,
+                "enqueued_at": now,
+                "lease_expires_at": None,
+            }
+            for position, slug in enumerate(["one-piece", "naruto"])
+        ]
+    )
+    return collection
+
+
+def expire_lease(collection, item_id):
+    collection.update_one(
+        {"_id": item_id}, {"$set": {"lease_expires_at": datetime.now() - timedelta(seconds=1)}}
+    )
+
+
+def test_claim_in_order(collection):
+    first = claim_item("w1", collection=collection)
+    second = claim_item("w2", collection=collection)
+    assert first["_id"] == "run:one-piece"
+    assert second["_id"] == "run:naruto"
+    assert first["status"] == STATUS_LEASED
+    assert first["lease_owner"] == "w1"
+    assert first["attempts"] == 1
+    assert claim_item("w3", collection=collection) is None
+
+
+def test_expired_lease_is_reclaimed(collection):
+    item = claim_item("w1", collection=collection)
+    claim_item("w1", collection=collection)
+    assert claim_item("w2", collection=collection) is None
+
+    expire_lease(collection, item["_id"])
+    reclaimed = claim_item("w2", collection=collection)
+    assert reclaimed["_id"] == item["_id"]
+    assert reclaimed["lease_owner"] == "w2"
+    assert reclaimed["attempts"] == 2
+
+
+def test_stale_ack_is_ignored(collection):
+    item = claim_item("w1", collection=collection)
+    expire_lease(collection, item["_id"])
+    claim_item("w2", collection=collection)
+
+    assert not ack_item(item["_id"], "w1", collection=collection)
+    assert collection.find_one({"_id": item["_id"]})["status"] == STATUS_LEASED
+    assert ack_item(item["_id"], "w2", collection=collection)
+    assert collection.find_one({"_id": item["_id"]})["status"] == STATUS_DONE
+
+
+def test_max_attempts(collection):
+    for attempt in range(MAX_ATTEMPTS):
+        item = claim_item(f"w{attempt}", run_id="run", collection=collection)
+        assert item["_id"] == "run:one-piece"
+        expire_lease(collection, item["_id"])
+
+    assert claim_item("w", run_id="run", collection=collection)["_id"] == "run:naruto"
+    assert collection.find_one({"_id": "run:one-piece"})["status"] == STATUS_FAILED
+
+
+def test_reclaim_expired_leases(collection):
+    item = claim_item("w1", collection=collection)
+    expire_lease(collection, item["_id"])
+    assert reclaim_expired_leases(collection) == 1
+    assert collection.find_one({"_id": item["_id"]})["status"] == STATUS_PENDING
+
+
+def test_fail_item_requeues_then_fails(collection):
+    item = claim_item("w1", collection=collection)
+    fail_item(item["_id"], "w1", "erreur", collection=collection)
+    assert collection.find_one({"_id": item["_id"]})["status"] == STATUS_PENDING
+
+    collection.update_one({"_id": item["_id"]}, {"$set": {"attempts": MAX_ATTEMPTS - 1}})
+    item = claim_item("w1", collection=collection)
+    fail_item(item["_id"], "w1", "erreur", collection=collection)
+    assert collection.find_one({"_id": item["_id"]})["status"] == STATUS_FAILED
+
+
+def test_heartbeat_survives_renew_errors(collection, monkeypatch):
+    renew_lease = work_queue.renew_lease
+    calls = []
+
+    def flaky_renew_lease(*args, **kwargs):
+        calls.append(args[0])
+        if len(calls) == 1:
+            raise ConnectionError("réseau indisponible")
+        return renew_lease(*args, **kwargs)
+
+    monkeypatch.setattr(work_queue, "renew_lease", flaky_renew_lease)
+    processed = []
+
+    def process(manga):
+        # Plusieurs renouvellements pendant le traitement (un tiers du bail)
+        time.sleep(0.5)
+        processed.append(manga["title"])
+
+    assert run_worker(process, "w1", lease_seconds=0.3, collection=collection) == 2
+    assert processed == ["one-piece", "naruto"]
+    # Le renouvellement continue après l'erreur du premier appel
+    assert calls.count("run:one-piece") > 1
+    assert collection.count_documents({"status": STATUS_DONE}) == 2
+
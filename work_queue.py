@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+File de travail MongoDB pour le crawl distribué (mode coordinateur/worker).
+
+Le coordinateur dépose un élément par manga dans la collection
+`crawl_queue`. Les workers (sur n'importe quel nœud) réclament les
+éléments avec un bail, les traitent puis les acquittent. Un élément dont
+le bail a expiré (worker mort ou bloqué) redevient réclamable ; après
+MAX_ATTEMPTS tentatives il est marqué en échec. Le bail d'un élément est
+renouvelé tant que son traitement est en cours.
+
+Toutes les fonctions acceptent une collection en paramètre, ce qui permet
+de les utiliser contre une instance MongoDB locale de test.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pymongo
+
+from add_to_db import get_crawl_queue_collection
+from main import catalogue_slug
+
+# Durée du bail d'un élément réclamé par un worker (secondes)
+DEFAULT_LEASE_SECONDS = 300
+# Nombre de tentatives avant de marquer un élément en échec
+MAX_ATTEMPTS = 3
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+def new_run_id():
+    """Identifiant d'une exécution du coordinateur."""
+    return datetime.now().strftime("%Y%m%d%H%M%S")
+
+
+def new_worker_id():
+    """Identifiant unique d'un worker (hôte, pid, jeton)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def ensure_queue_indexes(collection=None):
+    """Crée les index utilisés pour réclamer et compter les éléments."""
+    collection = collection if collection is not None else get_crawl_queue_collection()
+    collection.create_index(
+        [
+            ("status", pymongo.ASCENDING),
+            ("lease_expires_at", pymongo.ASCENDING),
+            ("enqueued_at", pymongo.ASCENDING),
+        ]
+    )
+    collection.create_index([("run_id", pymongo.ASCENDING), ("status", pymongo.ASCENDING)])
+
+
+def enqueue_mangas(mangas, run_id, collection=None):
+    """
+    Dépose un élément par manga dans la file.
+
+    Un manga déjà présent pour ce run n'est pas redéposé, ce qui rend
+    l'opération idempotente si le coordinateur est relancé.
+
+    Args:
+        mangas (list): Mangas issus de refine_data()
+        run_id (str): Identifiant du run
+        collection: Collection de la file (défaut: crawl_queue)
+
+    Returns:
+        int: Nombre d'éléments nouvellement déposés
+    """
+    collection = collection if collection is not None else get_crawl_queue_collection()
+    ensure_queue_indexes(collection)
+
+    now = datetime.now()
+    operations = []
+    for position, manga in enumerate(mangas):
+        key = catalogue_slug(manga.get("url")) or manga.get("title", str(position))
+        operations.append(
+            pymongo.UpdateOne(
+                {"_id": f"{run_id}:{key}"},
+                {
+                    "$setOnInsert": {
+                        "run_id": run_id,
+                        "status": STATUS_PENDING,
+                        "manga": manga,
+                        "attempts": 0,
+                        "position": position,
+                        "enqueued_at": now,
+                        "lease_expires_at": None,
+                    }
+                },
+                upsert=True,
+            )
+        )
+
+    nb_enqueued = 0
+    for start in range(0, len(operations), 1000):
+        result = collection.bulk_write(operations[start:start + 1000], ordered=False)
+        nb_enqueued += result.upserted_count
+    return nb_enqueued
+
+
+def claim_item(worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, run_id=None, collection=None):
+    """
+    Réclame le prochain élément disponible : en attente, ou dont le bail a expiré.
+
+    Args:
+        worker_id (str): Identifiant du worker
+        lease_seconds (float): Durée du bail
+        run_id (str): Limiter aux éléments d'un run (optionnel)
+        collection: Collection de la file (défaut: crawl_queue)
+
+    Returns:
+        dict: L'élément réclamé, ou None si la file est vide
+    """
+    collection = collection if collection is not None else get_crawl_queue_collection()
+    now = datetime.now()
+    # Les éléments expirés qui ont épuisé leurs tentatives ne sont plus réclamables :
+    # les marquer en échec ici, le coordinateur n'attend pas forcément le run (--no-wait)
+    collection.update_many(
+        {"status": STATUS_LEASED, "lease_expires_at": {"$lt": now}, "attempts": {"$gte": MAX_ATTEMPTS}},
+        {"$set": {"status": STATUS_FAILED, "error": "bail expiré", "lease_expires_at": None}},
+    )
+    query = {
+        "$or": [
+            {"status": STATUS_PENDING},
+            {"status": STATUS_LEASED, "lease_expires_at": {"$lt": now}},
+        ],
+        "attempts": {"$lt": MAX_ATTEMPTS},
+    }
+    if run_id:
+        query["run_id"] = run_id
+
+    return collection.find_one_and_update(
+        query,
+        {
+            "$set": {
+                "status": STATUS_LEASED,
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "claimed_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("enqueued_at", pymongo.ASCENDING), ("position", pymongo.ASCENDING)],
+        return_document=pymongo.ReturnDocument.AFTER,
+    )
+
+
+def renew_lease(item_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, collection=None):
+    """
+    Prolonge le bail d'un élément en cours de traitement.
+
+    Returns:
+        bool: False si le bail a été repris par un autre worker
+    """
+    collection = collection if collection is not None else get_crawl_queue_collection()
+    result = collection.update_one(
+        {"_id": item_id, "lease_owner": worker_id, "status": STATUS_LEASED},
+        {"$set": {"lease_expires_at": datetime.now() + timedelta(seconds=lease_seconds)}},
+    )
+    return result.matched_count == 1
+
+
+def ack_item(item_id, worker_id, collection=None):
+    """
+    Acquitte un élément traité. Sans effet si le bail a été repris par un autre worker.
+
+    Returns:
+        bool: True si l'élément a été acquitté
+    """
+    collection = collection if collection is not None else get_crawl_queue_collection()
+    result = collection.update_one(
+        {"_id": item_id, "lease_owner": worker_id, "status": STATUS_LEASED},
+        {"$set": {"status": STATUS_DONE, "done_at": datetime.now()}},
+    )
+    return result.modified_count == 1
+
+
+def fail_item(item_id, worker_id, error, collection=None):
+    """
+    Remet un élément en attente après une erreur, ou le marque en échec
+    définitif après MAX_ATTEMPTS tentatives.
+    """
+    collection = collection if collection is not None else get_crawl_queue_collection()
+    item = collection.find_one({"_id": item_id, "lease_owner": worker_id}, {"attempts": 1})
+    if not item:
+        return
+    status = STATUS_FAILED if item.get("attempts", 0) >= MAX_ATTEMPTS else STATUS_PENDING
+    collection.update_one(
+        {"_id": item_id, "lease_owner": worker_id},
+        {"$set": {"status": status, "error": str(error), "lease_expires_at": None}},
+    )
+
+
+def reclaim_expired_leases(collection=None):
+    """
+    Remet en attente les éléments dont le bail a expiré (ou en échec s'ils
+    ont épuisé leurs tentatives).
+
+    Returns:
+        int: Nombre d'éléments récupérés
+    """
+    collection = collection if collection is not None else get_crawl_queue_collection()
+    now = datetime.now()
+    expired = {"status": STATUS_LEASED, "lease_expires_at": {"$lt": now}}
+    collection.update_many(
+        dict(expired, attempts={"$gte": MAX_ATTEMPTS}),
+        {"$set": {"status": STATUS_FAILED, "error": "bail expiré", "lease_expires_at": None}},
+    )
+    result = collection.update_many(
+        expired, {"$set": {"status": STATUS_PENDING, "lease_expires_at": None}}
+    )
+    return result.modified_count
+
+
+def queue_stats(run_id=None, collection=None):
+    """
+    Compte les éléments par statut.
+
+    Returns:
+        dict: {statut: nombre}
+    """
+    collection = collection if collection is not None else get_crawl_queue_collection()
+    pipeline = []
+    if run_id:
+        pipeline.append({"$match": {"run_id": run_id}})
+    pipeline.append({"$group": {"_id": "$status", "count": {"$sum": 1}}})
+    stats = {status: 0 for status in (STATUS_PENDING, STATUS_LEASED, STATUS_DONE, STATUS_FAILED)}
+    for row in collection.aggregate(pipeline):
+        stats[row["_id"]] = row["count"]
+    return stats
+
+
+def wait_for_run(run_id, poll_seconds=30, timeout=None, collection=None):
+    """
+    Attend que tous les éléments d'un run soient traités (ou en échec),
+    en récupérant au passage les baux expirés.
+
+    Returns:
+        dict: Statistiques finales du run
+    """
+    started = time.time()
+    while True:
+        reclaim_expired_leases(collection)
+        stats = queue_stats(run_id, collection)
+        print(
+            f"Run {run_id}: {stats[STATUS_DONE]} traités, {stats[STATUS_LEASED]} en cours, "
+            f"{stats[STATUS_PENDING]} en attente, {stats[STATUS_FAILED]} en échec"
+        )
+        if stats[STATUS_PENDING] == 0 and stats[STATUS_LEASED] == 0:
+            return stats
+        if timeout is not None and time.time() - started > timeout:
+            return stats
+        time.sleep(poll_seconds)
+
+
+def run_worker(process, worker_id=None, run_id=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+               idle_exit=True, idle_sleep=10, collection=None):
+    """
+    Boucle d'un worker : réclame un élément, appelle `process(manga)`, acquitte.
+
+    Args:
+        process (callable): Fonction de traitement d'un manga (lève une exception en cas d'échec)
+        worker_id (str): Identifiant du worker (généré si absent)
+        run_id (str): Limiter aux éléments d'un run (optionnel)
+        lease_seconds (float): Durée du bail de chaque élément
+        idle_exit (bool): Quitter quand la file est vide (sinon attendre)
+        idle_sleep (float): Attente entre deux tentatives quand la file est vide
+        collection: Collection de la file (défaut: crawl_queue)
+
+    Returns:
+        int: Nombre d'éléments traités avec succès
+    """
+    worker_id = worker_id or new_worker_id()
+    nb_processed = 0
+    print(f"Worker {worker_id} démarré")
+
+    while True:
+        item = claim_item(worker_id, lease_seconds, run_id, collection)
+        if item is None:
+            if idle_exit:
+                break
+            time.sleep(idle_sleep)
+            continue
+
+        title = item["manga"].get("title", item["_id"])
+        # Renouvellement du bail pendant le traitement (un manga lent n'est pas repris)
+        done = threading.Event()
+
+        def heartbeat(item_id=item["_id"], title=title):
+            while not done.wait(lease_seconds / 3):
+                # Une erreur passagère (réseau, élection MongoDB) n'arrête pas le
+                # renouvellement : seul un bail repris par un autre worker l'arrête
+                try:
+                    renewed = renew_lease(item_id, worker_id, lease_seconds, collection)
+                except Exception as e:
+                    print(f"  Échec du renouvellement du bail de {title}: {e}")
+                    continue
+                if not renewed:
+                    print(f"  Bail de {title} repris par un autre worker")
+                    return
+
+        renewer = threading.Thread(target=heartbeat, name="lease-renewer", daemon=True)
+        renewer.start()
+        error = None
+        try:
+            process(item["manga"])
+        except Exception as e:
+            error = e
+        finally:
+            done.set()
+            renewer.join()
+
+        if error is not None:
+            print(f"  Échec du traitement de {title}: {error}")
+            fail_item(item["_id"], worker_id, error, collection)
+        elif ack_item(item["_id"], worker_id, collection):
+            nb_processed += 1
+        else:
+            print(f"  Bail perdu pour {title}, résultat non acquitté")
+
+    print(f"Worker {worker_id} terminé: {nb_processed} éléments traités")
+    return nb_processed